@@ -6,7 +6,7 @@ database live (esposta dalla UI via /api/backtest/logs).
 
 Il motore gira con cwd = backtest/years/<anno>/ nel repo: ogni anno ha il suo
 my_database.db dedicato, che la UI espone come tab "<anno>". Il DB viene
-creato dal runner con lo schema completo a 25 colonne (initialize_db() del
+creato e aggiornato dal runner con lo schema di schema.py (initialize_db() del
 progetto BT non è mai chiamata dal motore e ha comunque uno schema obsoleto).
 
 Uso:
@@ -32,6 +32,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from schema import migrate as migrate_trades
+
 _REPO_ROOT = Path(__file__).resolve().parent.parent
 load_dotenv(_REPO_ROOT / '.env')
 
@@ -45,24 +47,6 @@ HEARTBEAT_SECONDS = 60
 
 ERROR_MARKERS = ('Traceback', 'Exception', 'exception', 'LOGIN_FAILED', 'failed', 'Error:')
 
-# Schema reale della tabella trades (25 colonne): rispecchia i DB prodotti
-# storicamente dal motore. Gli INSERT di db_utils.py (BT) scrivono anche
-# breakup_date e fibonacci100, assenti dalla initialize_db() del progetto BT.
-TRADES_DDL = '''
-    CREATE TABLE IF NOT EXISTS trades (
-        "pair" TEXT, status TEXT, trade_type TEXT,
-        entry_date TEXT, close_date TEXT,
-        entry_price REAL, entry_price_index INTEGER,
-        stop_loss REAL, target REAL, direction TEXT,
-        initial_risk_reward REAL, final_risk_reward REAL,
-        profit TEXT, result TEXT,
-        zones_rectX1_DLY TEXT, zones_rectY1_DLY REAL, zones_rectY2_DLY REAL,
-        zones_rectX1_H4 TEXT, zones_rectY1_H4 REAL, zones_rectY2_H4 REAL,
-        pattern_x1 TEXT, pattern_y1 REAL, pattern_y2 REAL,
-        breakup_date TEXT, fibonacci100 REAL
-    )
-'''
-
 stop_requested = False
 current_child = None
 work_dir = None  # backtest/years/<anno>, impostata in main()
@@ -97,12 +81,11 @@ def log(log_type, message, pair=None, details=None):
 
 
 def init_work_db():
-    """Crea (se serve) il working DB dell'anno con lo schema completo.
-    Necessario: il motore non crea mai la tabella e su un DB nuovo di zecca
-    i suoi INSERT a 25 colonne fallirebbero."""
+    """Crea (se serve) il working DB dell'anno e ne porta trades all'ultima
+    versione dello schema (schema.py). Necessario: il motore non crea mai la
+    tabella e su un DB nuovo di zecca i suoi INSERT a 25 colonne fallirebbero."""
     conn = sqlite3.connect(str(work_db))
-    conn.execute(TRADES_DDL)
-    conn.commit()
+    migrate_trades(conn)
     conn.close()
 
 
@@ -0,0 +1,57 @@
+"""
+Orologio delle candele per lo scheduling del bot_runner.
+
+Il bot si sveglia subito dopo la chiusura di ogni candela M15 (piu' qualche
+secondo di margine perche' FXCM renda disponibile la candela chiusa) invece
+di interrogare FXCM a intervallo fisso. Le chiusure M15 cadono sempre ai
+minuti 00/15/30/45 UTC, indipendentemente dall'ora legale; l'apertura di
+nuove candele H4/D1 viene invece riconosciuta dai dati (martina.find_zones_cached).
+
+Chiusura settimanale del mercato: da venerdi' 21:00 UTC (22:00 con l'ora solare)
+a domenica 21:00 UTC (22:00). La finestra usata e' quella piu' stretta comune
+ai due orari: chiuso da venerdi' 22:15 (dopo l'ultima M15 dell'ora solare) a
+domenica 21:00 UTC.
+Tutti i tempi sono timestamp epoch in secondi (UTC).
+"""
+
+M15_SECONDS = 900
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+# offset dall'inizio della settimana (lunedi' 00:00 UTC)
+MARKET_CLOSE = 4 * DAY_SECONDS + 22 * 3600 + 15 * 60   # venerdi' 22:15
+MARKET_OPEN = 6 * DAY_SECONDS + 21 * 3600              # domenica 21:00
+
+
+def week_offset(ts):
+    """Secondi trascorsi da lunedi' 00:00 UTC (il 01.01.1970 era un giovedi')."""
+    return (int(ts) + 3 * DAY_SECONDS) % WEEK_SECONDS
+
+
+def is_market_open(ts):
+    return not (MARKET_CLOSE <= week_offset(ts) < MARKET_OPEN)
+
+
+def next_market_open(ts):
+    """Prossima riapertura del mercato dopo ts."""
+    offset = week_offset(ts)
+    open_ts = int(ts) - offset + MARKET_OPEN
+    if offset >= MARKET_OPEN:
+        open_ts += WEEK_SECONDS
+    return open_ts
+
+
+def next_bar_close(ts, seconds=M15_SECONDS):
+    """Prima chiusura di una candela di `seconds` secondi strettamente dopo ts."""
+    return (int(ts) // seconds + 1) * seconds
+
+
+def next_wakeup(ts, settle=5):
+    """Istante del prossimo ciclo: chiusura M15 successiva + settle secondi,
+    oppure riapertura del mercato + settle se nel frattempo il mercato chiude.
+    Una chiusura avvenuta meno di `settle` secondi prima di ts non e' ancora
+    stata servita e viene restituita."""
+    close = next_bar_close(int(ts) - settle)
+    if not is_market_open(close - 1):
+        close = next_market_open(close - 1)
+    return close + settle
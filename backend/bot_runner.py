@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 """
 Bot Runner - Continuous Trading Bot
-Executes martina.py for each configured currency pair in a loop.
+Runs the martina.py analysis for each configured currency pair in a loop.
+By default all pairs share a single FXCM session inside this process;
+--subprocess starts a separate martina.py process per pair instead, so
+--workers analyses run in parallel on separate CPUs. Writes on the trades
+table and MT5 calls are serialized by the database write lock
+(db_utils.transaction), in both modes.
 Designed to work with the React UI via Activity Log system.
 """
 
@@ -11,7 +16,8 @@ import time
 import signal
 import subprocess
 import argparse
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,8 +26,14 @@ load_dotenv()
 # Import logging functions
 from db_utils import (
     initialize_db, initialize_activity_logs_db, initialize_signals_db,
-    add_activity_log, SIMULATION_MODE
+    initialize_pattern_trackers_db, initialize_breakout_states_db, initialize_trade_managers_db,
+    add_activity_log, flush_activity_logs, reload_log_config, SIMULATION_MODE
 )
+from candle_cache import CandleCache
+from fx_session import FXSession
+from utils import clean_trades
+import bar_clock
+import martina
 
 # Global flag for graceful shutdown
 running = True
@@ -31,6 +43,9 @@ def signal_handler(signum, frame):
     global running
     add_activity_log('WARNING', 'Shutdown signal received...')
     running = False
+    # activity log scritto in background: nulla resta in coda se il processo
+    # viene terminato subito dopo
+    flush_activity_logs()
 
 # Register signal handlers
 signal.signal(signal.SIGTERM, signal_handler)
@@ -39,12 +54,27 @@ signal.signal(signal.SIGINT, signal_handler)
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Continuous Trading Bot Runner')
+    parser.add_argument('--schedule', choices=['bars', 'interval'], default='bars',
+                        help='bars: scan right after every M15 bar close, D1/H4 zones recomputed only '
+                             'on new D1/H4 bars, no scans while the market is closed (default); '
+                             'interval: scan every --interval seconds')
+    parser.add_argument('--settle', type=int, default=5,
+                        help='Seconds to wait after a bar close before scanning (default: 5)')
     parser.add_argument('--interval', type=int, default=300, 
-                        help='Scan interval in seconds (default: 300 = 5 minutes)')
+                        help='Scan interval in seconds with --schedule interval (default: 300 = 5 minutes)')
     parser.add_argument('--pairs', type=str, default=None,
                         help='Comma-separated pairs to scan (default: from ACTIVE_PAIRS env)')
     parser.add_argument('--single-run', action='store_true',
                         help='Run once and exit (no loop)')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='Run each pair in its own martina.py process (one FXCM login per pair)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Pairs analyzed in parallel (default: 4; with --subprocess, martina.py '
+                             'processes running at once)')
+    parser.add_argument('--pair-timeout', type=int, default=120,
+                        help='Max seconds per pair (default: 120)')
+    parser.add_argument('--cycle-deadline', type=int, default=840,
+                        help='Max seconds per scan cycle, pairs not started by then are skipped (default: 840 = within one M15 bar)')
     return parser.parse_args()
 
 
@@ -54,7 +84,46 @@ def get_pairs():
     return [p.strip() for p in pairs_str.split(',') if p.strip()]
 
 
-def run_martina_for_pair(pair):
+def get_fxcm_session():
+    """Shared FXCM session built from the environment credentials"""
+    return FXSession(
+        os.getenv('FXCM_LOGIN_ID', ''),
+        os.getenv('FXCM_PASSWORD', ''),
+        os.getenv('FXCM_URL', 'http://www.fxcorporate.com/Hosts.jsp'),
+        os.getenv('FXCM_CONNECTION', 'Demo'),
+        'Trade'
+    )
+
+
+def run_pair_in_process(history_source, pair, expired=lambda: False, reuse_zones=False):
+    """
+    Run the martina.py analysis for a single pair on the shared session.
+    Downloads are serialized by the session, analyses run concurrently with
+    the other pairs; their DB writes and MT5 calls are serialized by the
+    database write lock. A pair whose download ends after expired() turns
+    True skips the analysis (no late DB writes). An analysis already started
+    is not interrupted: stopping it halfway would leave the trade state half
+    written.
+    Returns True if successful, False if error.
+    """
+    add_activity_log('INFO', f'Executing full analysis for {pair}...', pair=pair)
+    
+    try:
+        histories = martina.fetch_histories(history_source, pair)
+        if expired():
+            add_activity_log('WARNING', f'{pair}: Timed out before analysis - skipped', pair=pair)
+            return False
+        martina.analyze_pair(pair, *histories, 'Trade', None, reuse_zones)
+        #close mt5 orders already processed
+        clean_trades()
+        add_activity_log('SUCCESS', f'{pair}: Analysis complete', pair=pair)
+        return True
+    except Exception as e:
+        add_activity_log('ERROR', f'{pair}: {str(e)[:200]}', pair=pair)
+        return False
+
+
+def run_martina_for_pair(pair, timeout=120, reuse_zones=False):
     """
     Execute martina.py for a single currency pair.
     Returns True if successful, False if error.
@@ -81,6 +150,8 @@ def run_martina_for_pair(pair):
         '-session', 'Trade',  # Required for trading logic
         '--from-runner'  # Skip redundant startup logs
     ]
+    if reuse_zones:
+        cmd.append('--reuse-zones')
     
     add_activity_log('INFO', f'Executing full analysis for {pair}...', pair=pair)
     
@@ -91,7 +162,7 @@ def run_martina_for_pair(pair):
             cwd=script_dir,
             capture_output=True,
             text=True,
-            timeout=120  # 2 minute timeout per pair
+            timeout=timeout
         )
         
         # Check for errors
@@ -105,13 +176,106 @@ def run_martina_for_pair(pair):
         return True
         
     except subprocess.TimeoutExpired:
-        add_activity_log('ERROR', f'{pair}: Analysis timeout (>120s)', pair=pair)
+        add_activity_log('ERROR', f'{pair}: Analysis timeout (>{timeout}s)', pair=pair)
         return False
     except Exception as e:
         add_activity_log('ERROR', f'{pair}: {str(e)}', pair=pair)
         return False
 
 
+def format_utc(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%a %d.%m %H:%M:%S UTC')
+
+
+def wait_until(target):
+    """Sleep until target (epoch seconds) in small steps to respond to stop signal faster"""
+    last_log = time.time()
+    while running:
+        remaining = target - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(1, remaining))
+        now = time.time()
+        # Log progress every minute (every hour on long waits, e.g. weekend)
+        every = 60 if target - now < 3600 else 3600
+        if now - last_log >= every and running and target - now >= 1:
+            last_log = now
+            add_activity_log('SYSTEM', f'Waiting... {int(target - now)}s until next scan')
+
+
+def rotate_pairs(pairs, scan_count):
+    """Start each cycle from a different pair so none is always served last"""
+    if not pairs:
+        return pairs
+    start = (scan_count - 1) % len(pairs)
+    return pairs[start:] + pairs[:start]
+
+
+def run_cycle(pairs, run_one, workers, pair_timeout, cycle_deadline):
+    """
+    Run run_one(pair, expired) for every pair on a pool of `workers` threads.
+    A pair running longer than pair_timeout is counted as failed; once
+    cycle_deadline is reached the pairs not started yet are skipped and the
+    cycle ends without waiting for the ones still running (their expired()
+    turns True so they skip the DB writes).
+    Returns (successful, failed, skipped).
+    """
+    cycle_end = time.monotonic() + cycle_deadline
+    started = {}
+    given_up = set()
+    
+    def task(pair):
+        started[pair] = time.monotonic()
+        
+        def expired():
+            deadline = min(cycle_end, started[pair] + pair_timeout)
+            return not running or pair in given_up or time.monotonic() > deadline
+        
+        return run_one(pair, expired)
+    
+    successful = 0
+    failed = 0
+    skipped = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='pair')
+    futures = {executor.submit(task, pair): pair for pair in pairs}
+    pending = set(futures)
+    
+    while pending:
+        done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                ok = future.result()
+            except Exception as e:
+                add_activity_log('ERROR', f'{futures[future]}: {str(e)[:200]}', pair=futures[future])
+                ok = False
+            if ok:
+                successful += 1
+            else:
+                failed += 1
+        
+        now = time.monotonic()
+        for future in list(pending):
+            pair = futures[future]
+            if pair not in started:
+                # not started yet: drop it on shutdown or past the cycle deadline
+                if (not running or now > cycle_end) and future.cancel():
+                    pending.discard(future)
+                    skipped += 1
+                continue
+            # a few seconds of grace so the pair can report its own timeout
+            if now > started[pair] + pair_timeout + 5 or now > cycle_end:
+                given_up.add(pair)
+                pending.discard(future)
+                failed += 1
+                add_activity_log('ERROR', f'{pair}: Analysis timeout (>{pair_timeout}s)', pair=pair)
+    
+    if skipped:
+        add_activity_log('WARNING', f'Cycle deadline ({cycle_deadline}s) reached: {skipped} pairs skipped')
+    # threads still running after a timeout finish on their own
+    executor.shutdown(wait=False)
+    return successful, failed, skipped
+
+
 def main():
     global running
     
@@ -121,6 +285,9 @@ def main():
     # SQLite file does not exist because *.db is gitignored)
     initialize_db()
     initialize_activity_logs_db()
+    initialize_pattern_trackers_db()
+    initialize_breakout_states_db()
+    initialize_trade_managers_db()
     if SIMULATION_MODE:
         initialize_signals_db()
     
@@ -132,7 +299,11 @@ def main():
     # Get pairs to scan
     pairs = args.pairs.split(',') if args.pairs else get_pairs()
     add_activity_log('INFO', f'Configured {len(pairs)} pairs: {", ".join(pairs[:5])}{"..." if len(pairs) > 5 else ""}')
-    add_activity_log('INFO', f'Scan interval: {args.interval} seconds')
+    if args.schedule == 'bars':
+        add_activity_log('INFO', f'Schedule: every M15 bar close (+{args.settle}s), market hours only')
+    else:
+        add_activity_log('INFO', f'Scan interval: {args.interval} seconds')
+    add_activity_log('INFO', f'Workers: {args.workers}, pair timeout: {args.pair_timeout}s, cycle deadline: {args.cycle_deadline}s')
     
     # Verify credentials
     login_id = os.getenv('FXCM_LOGIN_ID', '')
@@ -142,32 +313,49 @@ def main():
         add_activity_log('ERROR', 'FXCM credentials not configured!')
         return 1
     
-    add_activity_log('SUCCESS', 'Connected to FXCM API successfully')
+    session = None
+    history_source = None
+    if args.subprocess:
+        add_activity_log('INFO', 'Subprocess mode: one martina.py process per pair')
+        add_activity_log('SUCCESS', 'Connected to FXCM API successfully')
+    else:
+        # martina.py expects to run from the backend folder
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        session = get_fxcm_session()
+        history_source = CandleCache(session.get_history)
+        try:
+            session.connect()
+            add_activity_log('SUCCESS', 'Connected to FXCM API successfully')
+        except Exception as e:
+            # not fatal: the session is opened again before the next download
+            add_activity_log('ERROR', f'FXCM login failed: {str(e)[:200]} - retrying on next pair')
     
     scan_count = 0
     
     # Main loop
     while running:
+        if args.schedule == 'bars' and not bar_clock.is_market_open(time.time()):
+            reopen = bar_clock.next_market_open(time.time()) + args.settle
+            add_activity_log('INFO', f'Market closed - next scan at {format_utc(reopen)}')
+            wait_until(reopen)
+            continue
+        
         scan_count += 1
+        # log level / debug pairs changed from the UI apply from this cycle
+        reload_log_config()
         add_activity_log('SYSTEM', f'===== Starting scan cycle #{scan_count} =====')
         
-        successful = 0
-        failed = 0
+        reuse_zones = args.schedule == 'bars'
+        if args.subprocess:
+            run_one = lambda pair, expired: run_martina_for_pair(pair, args.pair_timeout, reuse_zones)
+        else:
+            run_one = lambda pair, expired: run_pair_in_process(history_source, pair, expired, reuse_zones)
         
-        for pair in pairs:
-            if not running:
-                break
-            
-            if run_martina_for_pair(pair):
-                successful += 1
-            else:
-                failed += 1
-            
-            # Small delay between pairs
-            if running:
-                time.sleep(2)
+        successful, failed, skipped = run_cycle(rotate_pairs(pairs, scan_count), run_one,
+                                                args.workers, args.pair_timeout, args.cycle_deadline)
         
-        add_activity_log('SYSTEM', f'Scan cycle #{scan_count} complete: {successful} OK, {failed} errors')
+        add_activity_log('SYSTEM', f'Scan cycle #{scan_count} complete: {successful} OK, {failed} errors'
+                                   + (f', {skipped} skipped' if skipped else ''))
         
         if args.single_run:
             add_activity_log('INFO', 'Single run mode - exiting')
@@ -175,22 +363,20 @@ def main():
         
         # Wait for next scan
         if running:
-            add_activity_log('INFO', f'Heartbeat: Bot active. Next scan in {args.interval}s...')
-            
-            # Sleep in small increments to respond to stop signal faster
-            for i in range(args.interval):
-                if not running:
-                    break
-                time.sleep(1)
-                # Log progress every minute
-                if (i + 1) % 60 == 0 and running:
-                    remaining = args.interval - i - 1
-                    add_activity_log('SYSTEM', f'Waiting... {remaining}s until next scan')
+            if args.schedule == 'bars':
+                next_scan = bar_clock.next_wakeup(time.time(), args.settle)
+            else:
+                next_scan = time.time() + args.interval
+            add_activity_log('INFO', f'Heartbeat: Bot active. Next scan in {int(next_scan - time.time())}s...')
+            wait_until(next_scan)
     
     # Graceful shutdown
     add_activity_log('WARNING', 'Stop signal received...')
     add_activity_log('INFO', 'Closing connections...')
+    if session is not None:
+        session.close()
     add_activity_log('SYSTEM', 'Trading bot stopped')
+    flush_activity_logs()
     
     return 0
 
@@ -0,0 +1,217 @@
+"""
+Rottura e retest del pattern M15 come macchina a stati (BreakoutMachine).
+
+Trovato il pattern M15, ogni candela M15 chiusa dopo il pattern e' un evento
+per la macchina del trade:
+
+    WAITING_BREAK   il close oltre rectY1 del pattern rompe il pattern: entry
+                    al Fibonacci 78.6 tra lastlow/lasthigh e l'estremo della
+                    candela di rottura, stop loss, target (Kijun H4 della
+                    candela) e R:R. Con R:R >= 2 il segnale va in retest
+                    (WAITING_RETEST), altrimenti CLOSED.
+    WAITING_RETEST  il prezzo torna al Fibonacci: IN_PROGRESS;
+                    il prezzo arriva al target senza retest: CLOSED;
+                    nuovo estremo: segnale ricalcolato (CLOSED se l'R:R
+                    scende sotto 2).
+    IN_PROGRESS, CLOSED  stati finali, la macchina non consuma altre candele.
+
+LONG (zona SUP) e SHORT (zona RES) sono la stessa macchina con i confronti
+della direzione (DIRECTIONS). La macchina non fa ordini ne' scritture: on_bar
+ritorna il nome dell'evento e chi la usa (martina.follow_breakout) esegue
+ordini, DB e log. Lo stato e' serializzabile (to_state / from_state): nel
+loop live (run_breakout con key) le candele con la Kijun H4 definitiva sono
+confermate e il loro stato va salvato nella tabella breakout_states
+(db_utils) da chi esegue gli eventi, dopo averli eseguiti; le piu' recenti
+si rigiocano a ogni ciclo su una copia, come in pattern_tracker.py.
+Un backtest rigioca le candele una per una con lo stesso risultato.
+"""
+
+import json
+import operator
+from collections import namedtuple
+
+import numpy as np
+
+from db_utils import get_breakout_state
+from kijun import kijun_keys
+from patterns import pattern_columns
+from utils import (
+    calculate_risk_reward_ratio, calculate_stop_loss_LONG, calculate_stop_loss_SHORT,
+    calculate_target_price_LONG, calculate_target_price_SHORT, fibonacci_78_6
+)
+
+WAITING_BREAK = 'WAITING_BREAK'
+WAITING_RETEST = 'WAITING_RETEST'
+IN_PROGRESS = 'IN_PROGRESS'
+CLOSED = 'CLOSED'
+
+MIN_RISK_REWARD = 2
+
+# beyond:  il prezzo e' oltre il livello nel verso del trade (rottura, nuovo estremo)
+# reaches: come beyond, livello compreso (retest, target)
+# extreme: colonna dell'estremo della candela nel verso del trade
+# back:    colonna che torna verso entry e stop loss (retest)
+# anchor_name / extreme_name: nomi nei log (lastlow / candle_high ...)
+Direction = namedtuple('Direction', 'name beyond reaches extreme back stop_loss target_price anchor_name extreme_name')
+
+DIRECTIONS = {
+    'LONG': Direction('LONG', operator.gt, operator.ge, 'BidHigh', 'BidLow',
+                      calculate_stop_loss_LONG, calculate_target_price_LONG, 'lastlow', 'candle_high'),
+    'SHORT': Direction('SHORT', operator.lt, operator.le, 'BidLow', 'BidHigh',
+                       calculate_stop_loss_SHORT, calculate_target_price_SHORT, 'lasthigh', 'candle_low'),
+}
+
+# eventi di on_bar
+BREAK = 'BREAK'                  # pattern rotto, segnale creato
+BREAK_NO_RR = 'BREAK_NO_RR'      # pattern rotto, R:R insufficiente
+UPDATE = 'UPDATE'                # nuovo estremo, segnale aggiornato
+UPDATE_NO_RR = 'UPDATE_NO_RR'    # nuovo estremo, R:R insufficiente
+RETEST = 'RETEST'                # retest del Fibonacci: trade a mercato
+TARGET = 'TARGET'                # target raggiunto senza retest
+
+# evento di run_breakout: candela, nome, Fibonacci ed estremo dopo la
+# candela, copia del segnale corrente (None prima della rottura)
+Event = namedtuple('Event', 'index name fib_78_6 extreme setup')
+
+_STATE_FIELDS = ('status', 'extreme', 'fib_78_6', 'setup', 'close_reason', 'last_ts')
+
+
+class BreakoutMachine:
+    def __init__(self, direction, pair, pattern_y1, anchor):
+        self.direction = DIRECTIONS[direction]
+        self.pair = pair
+        self.pattern_y1 = pattern_y1
+        self.anchor = anchor            # lastlow (LONG) / lasthigh (SHORT): Fibonacci 100
+        self.status = WAITING_BREAK
+        self.extreme = None             # estremo dopo la rottura: Fibonacci 0
+        self.fib_78_6 = None
+        self.setup = None               # ultimo segnale: entry, SL, target, R:R, data di rottura
+        self.close_reason = None        # 'rr' o 'target' se CLOSED
+        self.last_ts = None             # ultima candela consumata (epoch)
+
+    @property
+    def done(self):
+        return self.status in (IN_PROGRESS, CLOSED)
+
+    def on_bar(self, candle, kijun, ts=None):
+        """Consuma la candela successiva (dict FXCM) con la sua Kijun H4 di
+        riferimento (target). Ritorna l'evento, None se non cambia nulla."""
+        if ts is not None:
+            self.last_ts = int(ts)
+        d = self.direction
+        if self.status == WAITING_BREAK:
+            if d.beyond(candle['BidClose'], self.pattern_y1):
+                self.extreme = candle[d.extreme]
+                return self._signal(candle, kijun, BREAK)
+            return None
+        if self.status != WAITING_RETEST:
+            return None
+        if d.reaches(self.fib_78_6, candle[d.back]):
+            self.status = IN_PROGRESS
+            return RETEST
+        if d.reaches(candle[d.extreme], kijun):
+            self.status = CLOSED
+            self.close_reason = 'target'
+            return TARGET
+        if d.beyond(candle[d.extreme], self.extreme):
+            self.extreme = candle[d.extreme]
+            return self._signal(candle, kijun, UPDATE)
+        return None
+
+    def _signal(self, candle, kijun, event):
+        """Entry, stop loss, target e R:R con l'estremo corrente."""
+        self.fib_78_6 = fibonacci_78_6(self.anchor, self.extreme)
+        stop_loss_price = self.direction.stop_loss(self.pair, self.pattern_y1, self.anchor)
+        risk_reward = calculate_risk_reward_ratio(self.fib_78_6, kijun, stop_loss_price)
+        if risk_reward >= MIN_RISK_REWARD:
+            self.status = WAITING_RETEST
+            self.setup = {'entry_price': self.fib_78_6,
+                          'stop_loss_price': stop_loss_price,
+                          'target_price': kijun,
+                          'risk_reward': risk_reward,
+                          'breakup_date': candle['Date']}
+            return event
+        self.status = CLOSED
+        self.close_reason = 'rr'
+        return event + '_NO_RR'
+
+    def target_1_1(self):
+        """Target del trade PARTIAL (R:R 1:1) del segnale corrente."""
+        return self.direction.target_price(self.setup['entry_price'], self.setup['stop_loss_price'], 1)
+
+    def to_state(self):
+        return {field: getattr(self, field) for field in _STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, direction, pair, pattern_y1, anchor, state):
+        machine = cls(direction, pair, pattern_y1, anchor)
+        for field in _STATE_FIELDS:
+            setattr(machine, field, state[field])
+        if machine.setup is not None:
+            machine.setup = dict(machine.setup)
+        return machine
+
+    def copy(self):
+        return BreakoutMachine.from_state(self.direction.name, self.pair, self.pattern_y1,
+                                          self.anchor, self.to_state())
+
+
+def run_breakout(machine, history, kijun_h4, kijun_m15, start, key=None):
+    """Candele start .. len - 2 della storia M15 (l'ultima e' in formazione)
+    date alla macchina fino a uno stato finale.
+
+    Ritorna (eventi, macchina, stato): eventi e' la lista di Event
+    nell'ordine delle candele, la macchina e' lo stato dopo l'ultima candela.
+    Con key (chiave JSON del pattern) lo stato delle candele confermate e'
+    ripreso da breakout_states: si consumano solo le candele nuove. stato e'
+    il JSON delle candele confermate nel ciclo, None se non ce ne sono (o
+    senza key): il chiamante lo salva (save_breakout_state) dopo aver
+    eseguito gli eventi, cosi' un'interruzione li fa rigiocare invece di
+    perderli.
+    """
+    end = len(history) - 1
+    events = []
+
+    def feed(target, index, ts=None):
+        event = target.on_bar(history[index], kijun_m15[index], ts)
+        if event is not None:
+            setup = dict(target.setup) if target.setup is not None else None
+            events.append(Event(index, event, target.fib_78_6, target.extreme, setup))
+
+    if key is None:
+        for index in range(start, end):
+            if machine.done:
+                break
+            feed(machine, index)
+        return events, machine, None
+
+    ts = pattern_columns(history)[0]
+    record = get_breakout_state(machine.pair)
+    if record is not None and record[0] == key:
+        state = json.loads(record[1])
+        pos = int(np.searchsorted(ts, state['last_ts'])) if state['last_ts'] is not None else -1
+        if 0 <= pos < len(ts) and ts[pos] == state['last_ts']:
+            d = machine.direction
+            machine = BreakoutMachine.from_state(d.name, machine.pair, machine.pattern_y1,
+                                                 machine.anchor, state)
+            start = pos + 1
+
+    # confermate: candele chiuse prima dell'apertura dell'ultima candela H4
+    # (la loro Kijun, cioe' il target, non cambia piu')
+    key_ts, _ = kijun_keys(kijun_h4)
+    confirmed = start
+    if len(key_ts):
+        confirmed = max(min(int(np.searchsorted(ts, key_ts[-1])), end), start)
+
+    for index in range(start, confirmed):
+        if machine.done:
+            break
+        feed(machine, index, ts[index])
+    state = json.dumps(machine.to_state()) if confirmed > start else None
+
+    live = machine.copy()
+    for index in range(confirmed, end):
+        if live.done:
+            break
+        feed(live, index, ts[index])
+    return events, live, state
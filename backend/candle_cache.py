@@ -0,0 +1,169 @@
+"""
+Cache su disco dello storico FXCM.
+
+Un file .npy (memory-mappable) per coppia (strumento, timeframe) sotto
+cache/history/. A ogni richiesta vengono scaricate solo le candele dalla
+ultima in cache in poi (inclusa, perche' puo' essere ancora in formazione) e
+unite a quelle gia' salvate; la finestra restituita e' la stessa che avrebbe
+restituito fx.get_history con gli stessi parametri.
+
+Il backend di download e' un qualunque callable con la firma di
+fx.get_history(instrument, timeframe, date_from, date_to, quotes_count) che
+restituisce un array strutturato con i campi Date/BidOpen/BidHigh/BidLow/
+BidClose/Volume: in produzione fx.get_history, nei test una sorgente finta.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db_utils import CACHE_DIR
+
+HISTORY_CACHE_DIR = os.path.join(CACHE_DIR, 'history')
+
+CACHE_DTYPE = np.dtype([
+    ('Date', 'datetime64[s]'),
+    ('BidOpen', 'f8'),
+    ('BidHigh', 'f8'),
+    ('BidLow', 'f8'),
+    ('BidClose', 'f8'),
+    ('Volume', 'f8'),
+])
+
+
+def _dt64(value):
+    """datetime (naive UTC o con tzinfo) -> numpy datetime64[s]."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, 's')
+
+
+def _to_datetime(value):
+    """numpy datetime64 -> datetime UTC (stesso formato di valid_datetime)."""
+    ts = int(np.asarray(value, dtype='datetime64[s]').astype(np.int64))
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def _normalize(raw):
+    """Array del backend -> array CACHE_DTYPE ordinato e senza duplicati."""
+    if raw is None or len(raw) == 0:
+        return np.empty(0, dtype=CACHE_DTYPE)
+    data = np.empty(len(raw), dtype=CACHE_DTYPE)
+    for field in CACHE_DTYPE.names:
+        data[field] = np.asarray(raw[field]).astype(CACHE_DTYPE[field])
+    _, first = np.unique(data['Date'][::-1], return_index=True)
+    keep = len(data) - 1 - first  # a parita' di data vince l'ultima ricevuta
+    return data[np.sort(keep)]
+
+
+def _merge(cached, fresh):
+    """Le candele scaricate sostituiscono quelle in cache nello stesso intervallo."""
+    if cached is None or len(cached) == 0:
+        return fresh
+    if len(fresh) == 0:
+        return cached
+    dates = cached['Date']
+    before = cached[dates < fresh['Date'][0]]
+    after = cached[dates > fresh['Date'][-1]]
+    return np.concatenate([before, fresh, after])
+
+
+def _select(data, date_from, date_to, quotes_count, window):
+    """Stessa finestra di fx.get_history(date_from, date_to, quotes_count)."""
+    dates = data['Date']
+    lo = 0 if date_from is None else int(np.searchsorted(dates, _dt64(date_from)))
+    hi = len(data) if date_to is None else int(np.searchsorted(dates, _dt64(date_to), side='right'))
+    selected = data[lo:hi]
+    if quotes_count > 0:
+        selected = selected[-quotes_count:]
+    elif date_from is None and window:
+        selected = selected[-window:]
+    return np.array(selected)
+
+
+class CandleCache:
+    def __init__(self, fetch, root=HISTORY_CACHE_DIR):
+        self.fetch = fetch
+        self.root = root
+
+    def path(self, instrument, timeframe):
+        return os.path.join(self.root, f"{instrument.replace('/', '')}_{timeframe}.npy")
+
+    def load(self, instrument, timeframe):
+        """Candele in cache (memory-mapped, sola lettura) o None."""
+        path = self.path(instrument, timeframe)
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if data.dtype != CACHE_DTYPE:
+            return None
+        return data
+
+    def _load_meta(self, instrument, timeframe):
+        try:
+            with open(self.path(instrument, timeframe) + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, instrument, timeframe, data, meta):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(instrument, timeframe)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path + '.json')
+
+    @staticmethod
+    def _needs_backfill(cached, meta, date_from):
+        # 'from': date_from piu' vecchia gia' scaricata per intero (se FXCM non
+        # ha candele cosi' vecchie non ha senso riscaricare a ogni ciclo)
+        requested = _dt64(date_from)
+        if 'from' in meta and requested >= np.datetime64(meta['from'], 's'):
+            return False
+        return requested < cached['Date'][0]
+
+    @staticmethod
+    def _count_until(cached, date_to):
+        # candele in cache che _select puo' restituire per date_to
+        if date_to is None:
+            return len(cached)
+        return int(np.searchsorted(cached['Date'], _dt64(date_to), side='right'))
+
+    def get_history(self, instrument, timeframe, date_from=None, date_to=None, quotes_count=0):
+        """Drop-in di fx.get_history servito dalla cache con download delta."""
+        cached = self.load(instrument, timeframe)
+        meta = self._load_meta(instrument, timeframe)
+        # senza date_from e quotes_count FXCM restituisce una finestra di
+        # default: la sua ampiezza si impara dal primo download completo
+        default_window = date_from is None and quotes_count <= 0
+
+        if (cached is None or len(cached) == 0
+                or (default_window and 'window' not in meta)
+                or (date_from is not None and self._needs_backfill(cached, meta, date_from))
+                or (date_from is None and quotes_count > self._count_until(cached, date_to))):
+            fresh = _normalize(self.fetch(instrument, timeframe, date_from, date_to, quotes_count))
+            if default_window:
+                meta['window'] = len(fresh)
+            if date_from is not None:
+                meta['from'] = int(_dt64(date_from).astype(np.int64))
+            data = _merge(cached, fresh)
+        elif date_to is None or _dt64(date_to) > cached['Date'][-1]:
+            # solo le candele dall'ultima in cache (inclusa) in poi
+            since = _to_datetime(cached['Date'][-1])
+            fresh = _normalize(self.fetch(instrument, timeframe, since, date_to, 0))
+            data = _merge(cached, fresh)
+        else:
+            data = cached
+
+        if data is not cached:
+            # rilascia il memory-map prima di sostituire il file (Windows)
+            cached = None
+            self._save(instrument, timeframe, data, meta)
+        return _select(data, date_from, date_to, quotes_count, meta.get('window'))
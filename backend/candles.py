@@ -0,0 +1,192 @@
+"""
+Serie storiche OHLC in formato colonnare (NumPy).
+
+CandleSeries sostituisce la lista di dict prodotta da format_history: le
+candele sono memorizzate in array contigui (float64 per open/high/low/close/
+volume, int64 per il timestamp epoch in secondi, UTC) costruiti direttamente
+dall'array strutturato restituito da fx.get_history, senza parse delle date
+riga per riga.
+
+Per compatibilita' con il codice della strategia, series[i] restituisce una
+vista di riga (CandleRow) che si comporta come il vecchio dict:
+    candle['Date']      -> stringa '%m.%d.%Y %H:%M:%S' (formattata lazy, in cache)
+    candle['BidClose']  -> float
+I percorsi critici possono invece leggere direttamente gli array
+(series.close, series.ts, ...).
+"""
+
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+from range_query import SparseTable
+
+DATE_FORMAT = '%m.%d.%Y %H:%M:%S'
+
+# Nome del campo FXCM -> attributo della CandleSeries
+_FIELDS = (
+    ('BidOpen', 'open'),
+    ('BidHigh', 'high'),
+    ('BidLow', 'low'),
+    ('BidClose', 'close'),
+    ('Volume', 'volume'),
+)
+_ROW_KEYS = ('Date',) + tuple(field for field, _ in _FIELDS)
+_ATTR_BY_FIELD = dict(_FIELDS)
+
+SECONDS_PER_DAY = 86400
+SATURDAY = 5
+
+
+def format_epoch(ts):
+    """Timestamp epoch (secondi, UTC) -> stringa nel formato delle date FXCM."""
+    return time.strftime(DATE_FORMAT, time.gmtime(int(ts)))
+
+
+def to_epoch_seconds(dates):
+    """Converte una colonna di date (datetime64, Timestamp, datetime naive UTC)
+    in un array int64 di secondi epoch."""
+    return np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+
+
+def weekday_of(ts):
+    """Giorno della settimana (lunedi' = 0) di un array di timestamp epoch.
+    Il 01.01.1970 era un giovedi' (3)."""
+    return (ts // SECONDS_PER_DAY + 3) % 7
+
+
+class CandleRow(Mapping):
+    """Vista dict-like su una candela di una CandleSeries (nessuna copia)."""
+
+    __slots__ = ('_series', '_i')
+
+    def __init__(self, series, i):
+        self._series = series
+        self._i = i
+
+    def __getitem__(self, key):
+        if key == 'Date':
+            return self._series.date_str(self._i)
+        attr = _ATTR_BY_FIELD.get(key)
+        if attr is None:
+            raise KeyError(key)
+        return float(getattr(self._series, attr)[self._i])
+
+    def __iter__(self):
+        return iter(_ROW_KEYS)
+
+    def __len__(self):
+        return len(_ROW_KEYS)
+
+    def _key(self):
+        s, i = self._series, self._i
+        return (s.ts[i], s.open[i], s.high[i], s.low[i], s.close[i], s.volume[i])
+
+    def __eq__(self, other):
+        if isinstance(other, CandleRow):
+            if other._series is self._series:
+                return other._i == self._i
+            return self._key() == other._key()
+        return Mapping.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    @property
+    def ts(self):
+        return int(self._series.ts[self._i])
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CandleSeries:
+    """Serie OHLC colonnare con accesso per indice compatibile con la vecchia
+    lista di dict (indici negativi, slicing, iterazione, len)."""
+
+    __slots__ = ('ts', 'open', 'high', 'low', 'close', 'volume', '_dates', '_tables')
+
+    def __init__(self, ts, open, high, low, close, volume, _dates=None):
+        self.ts = np.ascontiguousarray(ts, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+        # cache delle date formattate, riempita solo quando servono
+        self._dates = _dates if _dates is not None else [None] * len(self.ts)
+        # SparseTable per (colonna, min/max), costruite solo quando servono
+        self._tables = {}
+
+    @classmethod
+    def from_history(cls, hist, drop_saturdays=False):
+        """Costruisce la serie dall'array strutturato di fx.get_history (o da
+        qualunque oggetto indicizzabile per colonna: DataFrame, dict di array)."""
+        ts = to_epoch_seconds(hist['Date'])
+        columns = [np.asarray(hist[field], dtype=np.float64) for field, _ in _FIELDS]
+        if drop_saturdays:
+            keep = weekday_of(ts) != SATURDAY
+            ts = ts[keep]
+            columns = [col[keep] for col in columns]
+        return cls(ts, *columns)
+
+    @classmethod
+    def empty(cls):
+        return cls(*(np.empty(0) for _ in range(6)))
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return CandleSeries(self.ts[item], self.open[item], self.high[item],
+                                self.low[item], self.close[item], self.volume[item],
+                                self._dates[item])
+        n = len(self.ts)
+        i = int(item)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError('candle index out of range')
+        return CandleRow(self, i)
+
+    def __iter__(self):
+        for i in range(len(self.ts)):
+            yield CandleRow(self, i)
+
+    def date_str(self, i):
+        date = self._dates[i]
+        if date is None:
+            date = format_epoch(self.ts[i])
+            self._dates[i] = date
+        return date
+
+    def range_table(self, field, kind):
+        """SparseTable (range_query) della colonna field, 'min' o 'max'."""
+        table = self._tables.get((field, kind))
+        if table is None:
+            table = SparseTable(getattr(self, field), kind)
+            self._tables[(field, kind)] = table
+        return table
+
+    def index_of(self, ts):
+        """Indice della candela con timestamp ts, -1 se assente."""
+        pos = int(np.searchsorted(self.ts, ts))
+        if pos < len(self.ts) and self.ts[pos] == ts:
+            return pos
+        return -1
+
+    def to_records(self):
+        """Copia come lista di dict (formato storico di format_history)."""
+        return [dict(row) for row in self]
+
+    def __repr__(self):
+        if len(self.ts) == 0:
+            return 'CandleSeries([])'
+        return f'CandleSeries({len(self.ts)} bars, {self.date_str(0)} -> {self.date_str(len(self.ts) - 1)})'
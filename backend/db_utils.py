@@ -1,19 +1,29 @@
+import atexit
+import functools
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from dotenv import load_dotenv
+from dotenv import load_dotenv, dotenv_values
 import os
 from pathlib import Path
 import certifi
 import ssl
 from ssl import SSLContext
 
+from schema import migrate as migrate_trades, to_epoch
+
 # Project root (parent of backend/): .env and database live there
 _REPO_ROOT = Path(__file__).resolve().parent.parent
 load_dotenv(_REPO_ROOT / '.env')
 
 DB_PATH = str(_REPO_ROOT / 'my_database.db')
+# Stato persistente tra i cicli del bot (indicatori incrementali, cache)
+CACHE_DIR = str(_REPO_ROOT / 'cache')
 
 # ============================================================================
 # CONFIGURAZIONE MODALITÀ SIMULAZIONE
@@ -30,124 +40,154 @@ if not SIMULATION_MODE:
 else:
     mt5 = None  # MT5 non disponibile in modalità simulazione
 
-def initialize_db():
-    # Create a database file named 'my_database.db'
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Create table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS trades (
-            pair TEXT,
-            status TEXT,
-            trade_type TEXT,
-            entry_date TEXT,
-            close_date TEXT,
-            entry_price REAL,
-            entry_price_index INTEGER,
-            stop_loss REAL, 
-            target REAL,
-            direction TEXT,
-            initial_risk_reward REAL,
-            final_risk_reward REAL,
-            profit TEXT,
-            result TEXT,
-            zones_rectX1_DLY TEXT,
-            zones_rectY1_DLY REAL, 
-            zones_rectY2_DLY REAL,
-            zones_rectX1_H4 TEXT,
-            zones_rectY1_H4 REAL, 
-            zones_rectY2_H4 REAL,
-            pattern_x1 TEXT,
-            pattern_y1 REAL,
-            pattern_y2 REAL,
-            breakup_date TEXT,
-            fibonacci100 REAL
-        )
-    ''')
-
-    # Migrazione per database creati con lo schema precedente (senza fibonacci100)
-    c.execute("PRAGMA table_info(trades)")
-    existing_columns = {row[1] for row in c.fetchall()}
-    if 'fibonacci100' not in existing_columns:
-        c.execute('ALTER TABLE trades ADD COLUMN fibonacci100 REAL')
-    if 'breakup_date' not in existing_columns:
-        c.execute('ALTER TABLE trades ADD COLUMN breakup_date TEXT')
+# ============================================================================
+# CONNESSIONE SQLITE - Una connessione per thread, WAL, transazioni
+# ============================================================================
+# Attesa massima su un lock del DB (bot_runner, backtest_runner e API Flask
+# usano lo stesso file) prima di sollevare "database is locked"
+BUSY_TIMEOUT = 10.0
+# Statement preparati tenuti in cache da ogni connessione
+STATEMENT_CACHE_SIZE = 256
 
-    # Save (commit) the changes
-    conn.commit()
-    conn.close()
+_local = threading.local()
 
-    print(f"DB initialized.")
 
+def get_connection():
+    """
+    Connessione SQLite del thread corrente a DB_PATH, aperta al primo uso e
+    poi riusata (bot_runner analizza le coppie su piu' thread). Journal WAL:
+    le letture dell'API non bloccano le scritture del bot e viceversa;
+    synchronous NORMAL: un fsync per checkpoint invece che per commit.
+    Riaperta se cambia DB_PATH o dopo un fork.
+    """
+    key = (DB_PATH, os.getpid())
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.key != key:
+        if conn is not None and _local.key[1] == key[1]:
+            conn.close()
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn, _local.key, _local.depth = conn, key, 0
     return conn
 
 
+@contextmanager
+def transaction(row_factory=None):
+    """
+    Cursore sulla connessione del thread (get_connection) dentro una
+    transazione: commit all'uscita dal blocco, rollback se il blocco solleva
+    un'eccezione. Una transazione aperta dentro un'altra nello stesso thread
+    ne fa parte (commit o rollback solo all'uscita da quella esterna).
+    La transazione esterna inizia con BEGIN IMMEDIATE: prende subito il lock
+    di scrittura del DB, cosi' le scritture dei worker di bot_runner (thread
+    o processi martina.py) sono serializzate e una lettura seguita da una
+    scrittura non fallisce con "database is locked" a meta' transazione.
+
+        with transaction(sqlite3.Row) as c:
+            c.execute(...)
+    """
+    conn = get_connection()
+    if _local.depth == 0:
+        conn.execute('BEGIN IMMEDIATE')
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory
+    _local.depth += 1
+    try:
+        yield cursor
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.rollback()
+        raise
+    else:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.commit()
+    finally:
+        cursor.close()
+
+def _mt5_serialized(func):
+    """
+    Esegue func (ordini e posizioni MT5, in simulazione la tabella signals)
+    dentro transaction(): con il lock di scrittura del DB una sola chiamata
+    MT5 alla volta tra tutti i thread e i processi del bot, che usano lo
+    stesso terminale (ogni chiamata fa initialize / shutdown).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def initialize_db():
+    # Tabella trades: crea o aggiorna lo schema (migrazioni in schema.py)
+    migrate_trades(get_connection())
+
+    print(f"DB initialized.")
+
+
 def initialize_signals_db():
     """
     Inizializza la tabella per i segnali MT5 in modalità simulazione.
     Questa tabella registra tutti i comandi che sarebbero stati inviati a MT5.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Tabella per i segnali di trading (ordini pendenti)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS mt5_signals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            signal_type TEXT,
-            pair TEXT,
-            symbol TEXT,
-            action TEXT,
-            order_type TEXT,
-            volume REAL,
-            price REAL,
-            stop_loss REAL,
-            take_profit REAL,
-            deviation INTEGER,
-            comment TEXT,
-            status TEXT,
-            ticket INTEGER,
-            processed INTEGER DEFAULT 0
-        )
-    ''')
-
-    # Tabella per le modifiche agli ordini/posizioni
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS mt5_modifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            pair TEXT,
-            symbol TEXT,
-            action TEXT,
-            old_sl REAL,
-            new_sl REAL,
-            old_tp REAL,
-            new_tp REAL,
-            position_ticket INTEGER,
-            comment TEXT,
-            processed INTEGER DEFAULT 0
-        )
-    ''')
-
-    # Tabella per le chiusure
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS mt5_closures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            pair TEXT,
-            symbol TEXT,
-            action TEXT,
-            volume REAL,
-            close_price REAL,
-            comment TEXT,
-            processed INTEGER DEFAULT 0
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        # Tabella per i segnali di trading (ordini pendenti)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS mt5_signals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                signal_type TEXT,
+                pair TEXT,
+                symbol TEXT,
+                action TEXT,
+                order_type TEXT,
+                volume REAL,
+                price REAL,
+                stop_loss REAL,
+                take_profit REAL,
+                deviation INTEGER,
+                comment TEXT,
+                status TEXT,
+                ticket INTEGER,
+                processed INTEGER DEFAULT 0
+            )
+        ''')
+
+        # Tabella per le modifiche agli ordini/posizioni
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS mt5_modifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                pair TEXT,
+                symbol TEXT,
+                action TEXT,
+                old_sl REAL,
+                new_sl REAL,
+                old_tp REAL,
+                new_tp REAL,
+                position_ticket INTEGER,
+                comment TEXT,
+                processed INTEGER DEFAULT 0
+            )
+        ''')
+
+        # Tabella per le chiusure
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS mt5_closures (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                pair TEXT,
+                symbol TEXT,
+                action TEXT,
+                volume REAL,
+                close_price REAL,
+                comment TEXT,
+                processed INTEGER DEFAULT 0
+            )
+        ''')
     print("MT5 Signals DB initialized (SIMULATION MODE).")
 
 
@@ -157,23 +197,19 @@ def log_mt5_signal(signal_type, pair, action, order_type=None, volume=None,
     """
     Registra un segnale MT5 nel database SQLite (modalità simulazione).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    symbol = pair.replace("/", "") if pair else None
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as c:
+        symbol = pair.replace("/", "") if pair else None
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    c.execute('''
-        INSERT INTO mt5_signals 
-        (timestamp, signal_type, pair, symbol, action, order_type, volume, 
-         price, stop_loss, take_profit, deviation, comment, status, ticket)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (timestamp, signal_type, pair, symbol, action, order_type, volume,
-          price, stop_loss, take_profit, deviation, comment, 'PENDING', ticket))
+        c.execute('''
+            INSERT INTO mt5_signals 
+            (timestamp, signal_type, pair, symbol, action, order_type, volume, 
+             price, stop_loss, take_profit, deviation, comment, status, ticket)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, signal_type, pair, symbol, action, order_type, volume,
+              price, stop_loss, take_profit, deviation, comment, 'PENDING', ticket))
     
-    conn.commit()
-    signal_id = c.lastrowid
-    conn.close()
+        signal_id = c.lastrowid
     
     print(f"[SIMULATION] Signal logged: {signal_type} - {pair} - {action} @ {price}")
     return signal_id
@@ -184,22 +220,17 @@ def log_mt5_modification(pair, action, old_sl=None, new_sl=None,
     """
     Registra una modifica MT5 nel database SQLite (modalità simulazione).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    symbol = pair.replace("/", "") if pair else None
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    c.execute('''
-        INSERT INTO mt5_modifications 
-        (timestamp, pair, symbol, action, old_sl, new_sl, old_tp, new_tp, 
-         position_ticket, comment)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (timestamp, pair, symbol, action, old_sl, new_sl, old_tp, new_tp,
-          position_ticket, comment))
-    
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        symbol = pair.replace("/", "") if pair else None
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+        c.execute('''
+            INSERT INTO mt5_modifications 
+            (timestamp, pair, symbol, action, old_sl, new_sl, old_tp, new_tp, 
+             position_ticket, comment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, pair, symbol, action, old_sl, new_sl, old_tp, new_tp,
+              position_ticket, comment))
     
     print(f"[SIMULATION] Modification logged: {pair} - {action} - SL: {old_sl}->{new_sl}, TP: {old_tp}->{new_tp}")
 
@@ -208,20 +239,15 @@ def log_mt5_closure(pair, action, volume=None, close_price=None, comment=None):
     """
     Registra una chiusura MT5 nel database SQLite (modalità simulazione).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    symbol = pair.replace("/", "") if pair else None
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as c:
+        symbol = pair.replace("/", "") if pair else None
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    c.execute('''
-        INSERT INTO mt5_closures 
-        (timestamp, pair, symbol, action, volume, close_price, comment)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (timestamp, pair, symbol, action, volume, close_price, comment))
-    
-    conn.commit()
-    conn.close()
+        c.execute('''
+            INSERT INTO mt5_closures 
+            (timestamp, pair, symbol, action, volume, close_price, comment)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (timestamp, pair, symbol, action, volume, close_price, comment))
     
     print(f"[SIMULATION] Closure logged: {pair} - {action}")
 
@@ -231,14 +257,9 @@ def get_pending_signals():
     Recupera tutti i segnali pendenti (non ancora processati).
     Utile quando si passa da SIMULATION_MODE a produzione.
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM mt5_signals WHERE processed = 0 ORDER BY timestamp")
-    signals = c.fetchall()
-    
-    conn.close()
+    with transaction(sqlite3.Row) as c:
+        c.execute("SELECT * FROM mt5_signals WHERE processed = 0 ORDER BY timestamp")
+        signals = c.fetchall()
     return signals
 
 
@@ -246,13 +267,8 @@ def mark_signal_processed(signal_id):
     """
     Marca un segnale come processato.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("UPDATE mt5_signals SET processed = 1 WHERE id = ?", (signal_id,))
-    
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("UPDATE mt5_signals SET processed = 1 WHERE id = ?", (signal_id,))
 
 
 # ============================================================================
@@ -263,79 +279,250 @@ def initialize_activity_logs_db():
     """
     Inizializza la tabella activity_logs per il sistema di logging in tempo reale.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS activity_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            type TEXT NOT NULL,
-            message TEXT NOT NULL,
-            pair TEXT,
-            details TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Crea indice per query veloci sui log recenti
-    c.execute('''
-        CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp 
-        ON activity_logs(timestamp DESC)
-    ''')
+    with transaction() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS activity_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                type TEXT NOT NULL,
+                message TEXT NOT NULL,
+                pair TEXT,
+                details TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
     
-    conn.commit()
-    conn.close()
+        # Crea indice per query veloci sui log recenti
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_activity_logs_timestamp 
+            ON activity_logs(timestamp DESC)
+        ''')
     print("[DB] Activity logs table initialized")
 
 
+# Scrittura asincrona: add_activity_log accoda la riga e ritorna subito, un
+# thread scrittore la inserisce in blocco (executemany, una transazione) ogni
+# LOG_FLUSH_INTERVAL secondi o appena in coda ci sono LOG_BATCH_SIZE righe
+LOG_FLUSH_INTERVAL = 0.25
+LOG_BATCH_SIZE = 200
+# Righe massime in coda: oltre (DB bloccato) le nuove sono scartate
+LOG_QUEUE_SIZE = 20000
+
+
+class ActivityLogWriter:
+    """
+    Coda in memoria dei log di activity_logs svuotata da un thread scrittore.
+    La coda e' una deque (append e popleft atomici, senza lock): si puo'
+    accodare e fare flush anche da un signal handler.
+    """
+
+    def __init__(self):
+        self.rows = deque()
+        self.dropped = 0
+        self.busy = False
+        self.thread = None
+        self.wake = threading.Event()
+        self.start_lock = threading.Lock()
+
+    def put(self, row):
+        if len(self.rows) >= LOG_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self.rows.append(row)
+        if self.thread is None or not self.thread.is_alive():
+            self._start()
+        if len(self.rows) >= LOG_BATCH_SIZE:
+            self.wake.set()
+
+    def _start(self):
+        with self.start_lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name='activity-log', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            self.wake.wait(LOG_FLUSH_INTERVAL)
+            self.wake.clear()
+            self._write()
+
+    def _write(self):
+        # busy prima di togliere righe dalla coda: flush attende anche il
+        # blocco in scrittura
+        self.busy = True
+        try:
+            while self.rows:
+                batch = []
+                while self.rows and len(batch) < LOG_BATCH_SIZE:
+                    batch.append(self.rows.popleft())
+                try:
+                    with transaction() as c:
+                        c.executemany('''
+                            INSERT INTO activity_logs (timestamp, type, message, pair, details)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', batch)
+                except sqlite3.Error as e:
+                    print(f"[DB] {len(batch)} activity logs lost: {e}")
+            if self.dropped:
+                print(f"[DB] Activity log queue full: {self.dropped} logs dropped")
+                self.dropped = 0
+        finally:
+            self.busy = False
+
+    def flush(self, timeout=5.0):
+        """Attende che le righe in coda siano scritte (al massimo timeout secondi)."""
+        if self.thread is None or not self.thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        self.wake.set()
+        while (self.rows or self.busy) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+_activity_log_writer = ActivityLogWriter()
+atexit.register(_activity_log_writer.flush)
+
+
+def flush_activity_logs(timeout=5.0):
+    """
+    Scrive subito i log ancora in coda (chiusura del bot).
+    """
+    _activity_log_writer.flush(timeout)
+
+
+# Livelli dei log: un tipo e' scritto se il suo livello e' >= LOG_LEVEL.
+# TRADER (traccia dettagliata della strategia) e' DEBUG: spento di default
+# in produzione, acceso per tutte le coppie con LOG_LEVEL=DEBUG o solo per
+# quelle in LOG_DEBUG_PAIRS (es. 'EUR/USD,GBP/JPY')
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_TYPE_LEVELS = {
+    'TRADER': 'DEBUG',
+    'INFO': 'INFO', 'SUCCESS': 'INFO', 'SYSTEM': 'INFO', 'TRADE': 'INFO', 'SIGNAL': 'INFO',
+    'WARNING': 'WARNING',
+    'ERROR': 'ERROR',
+}
+# Chiavi di .env lette da configure_logging (modificabili dalla UI)
+LOG_CONFIG_KEYS = ('LOG_LEVEL', 'LOG_DEBUG_PAIRS', 'LOG_SAMPLE_LIMIT', 'LOG_SAMPLE_SECONDS')
+
+_log_level = LOG_LEVELS['INFO']
+_log_debug_pairs = frozenset()
+# Campionamento dei log DEBUG ripetuti: al massimo _log_sample_limit
+# messaggi con lo stesso template per coppia ogni _log_sample_seconds
+# secondi (0 = nessun limite)
+_log_sample_limit = 0
+_log_sample_seconds = 60.0
+_log_samples = {}
+_log_samples_lock = threading.Lock()
+
+
+def configure_logging(level=None, debug_pairs=None, sample_limit=None, sample_seconds=None):
+    """
+    Imposta livello, coppie in debug e campionamento dei log. I parametri
+    None sono letti dall'ambiente (LOG_LEVEL, LOG_DEBUG_PAIRS,
+    LOG_SAMPLE_LIMIT, LOG_SAMPLE_SECONDS); valori non validi lasciano il
+    default.
+    """
+    global _log_level, _log_debug_pairs, _log_sample_limit, _log_sample_seconds
+    level = (level or os.getenv('LOG_LEVEL') or 'INFO').strip().upper()
+    _log_level = LOG_LEVELS.get(level, LOG_LEVELS['INFO'])
+    if debug_pairs is None:
+        debug_pairs = os.getenv('LOG_DEBUG_PAIRS', '')
+    if isinstance(debug_pairs, str):
+        debug_pairs = debug_pairs.split(',')
+    _log_debug_pairs = frozenset(p.strip() for p in debug_pairs if p.strip())
+    try:
+        _log_sample_limit = max(0, int(sample_limit if sample_limit is not None
+                                       else os.getenv('LOG_SAMPLE_LIMIT', 0)))
+    except ValueError:
+        _log_sample_limit = 0
+    try:
+        _log_sample_seconds = max(1.0, float(sample_seconds if sample_seconds is not None
+                                             else os.getenv('LOG_SAMPLE_SECONDS', 60)))
+    except ValueError:
+        _log_sample_seconds = 60.0
+    with _log_samples_lock:
+        _log_samples.clear()
+
+
+def reload_log_config():
+    """
+    Rilegge da .env solo le chiavi dei log e riconfigura: le modifiche
+    dalla UI valgono dal ciclo successivo senza riavviare il bot.
+    """
+    values = dotenv_values(_REPO_ROOT / '.env')
+    for key in LOG_CONFIG_KEYS:
+        if values.get(key) is not None:
+            os.environ[key] = values[key]
+        else:
+            os.environ.pop(key, None)
+    configure_logging()
+
+
+def log_enabled(log_type, pair=None):
+    """True se un log di tipo log_type (per la coppia pair) va scritto."""
+    level = LOG_LEVELS[LOG_TYPE_LEVELS.get(log_type, 'INFO')]
+    return level >= _log_level or (pair is not None and pair in _log_debug_pairs)
+
+
+def _sample(pair, template):
+    """
+    Campionamento per (coppia, template): ritorna (scrivi, soppressi), con
+    soppressi i messaggi scartati nella finestra precedente, da riportare
+    nel primo messaggio scritto della finestra nuova.
+    """
+    if not _log_sample_limit:
+        return True, 0
+    now = time.monotonic()
+    key = (pair, template)
+    with _log_samples_lock:
+        start, count, suppressed = _log_samples.get(key, (now, 0, 0))
+        if now - start >= _log_sample_seconds:
+            start, count = now, 0
+        if count < _log_sample_limit:
+            _log_samples[key] = (start, count + 1, 0)
+            return True, suppressed
+        _log_samples[key] = (start, count, suppressed + 1)
+        return False, 0
+
+
+configure_logging()
+
+
 def add_activity_log(log_type, message, pair=None, details=None):
     """
-    Aggiunge un log all'activity log.
+    Aggiunge un log all'activity log (in coda, scritto da ActivityLogWriter).
+    Scartato senza scrivere ne' stampare se il livello del tipo e' sotto
+    LOG_LEVEL (vedi log_enabled).
     
     Args:
-        log_type: 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'SYSTEM', 'TRADE', 'SIGNAL'
+        log_type: 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'SYSTEM', 'TRADE', 'SIGNAL', 'TRADER'
         message: Il messaggio del log
         pair: Coppia forex opzionale (es. 'EUR/USD')
         details: Dettagli aggiuntivi opzionali (JSON string)
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    if not log_enabled(log_type, pair):
+        return
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    c.execute('''
-        INSERT INTO activity_logs (timestamp, type, message, pair, details)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (timestamp, log_type, message, pair, details))
-    
-    conn.commit()
-    log_id = c.lastrowid
-    conn.close()
+    _activity_log_writer.put((timestamp, log_type, message, pair, details))
     
     # Stampa anche su console per debug
     print(f"[{log_type}] {message}")
-    
-    return log_id
 
 
 def get_recent_logs(limit=100):
     """
     Recupera i log più recenti.
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT id, timestamp, type, message, pair, details
-        FROM activity_logs
-        ORDER BY id DESC
-        LIMIT ?
-    ''', (limit,))
+    with transaction(sqlite3.Row) as c:
+        c.execute('''
+            SELECT id, timestamp, type, message, pair, details
+            FROM activity_logs
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (limit,))
     
-    logs = [dict(row) for row in c.fetchall()]
-    conn.close()
+        logs = [dict(row) for row in c.fetchall()]
     
     return logs
 
@@ -344,19 +531,15 @@ def get_logs_after_id(last_id):
     """
     Recupera i log con ID maggiore di last_id (per SSE streaming).
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    with transaction(sqlite3.Row) as c:
+        c.execute('''
+            SELECT id, timestamp, type, message, pair, details
+            FROM activity_logs
+            WHERE id > ?
+            ORDER BY id ASC
+        ''', (last_id,))
     
-    c.execute('''
-        SELECT id, timestamp, type, message, pair, details
-        FROM activity_logs
-        WHERE id > ?
-        ORDER BY id ASC
-    ''', (last_id,))
-    
-    logs = [dict(row) for row in c.fetchall()]
-    conn.close()
+        logs = [dict(row) for row in c.fetchall()]
     
     return logs
 
@@ -365,13 +548,10 @@ def clear_activity_logs():
     """
     Pulisce tutti i log (opzionale, per manutenzione).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('DELETE FROM activity_logs')
-    
-    conn.commit()
-    conn.close()
+    # i log in coda sono precedenti alla pulizia
+    flush_activity_logs()
+    with transaction() as c:
+        c.execute('DELETE FROM activity_logs')
     print("[DB] Activity logs cleared")
 
 
@@ -379,13 +559,9 @@ def get_latest_log_id():
     """
     Ottiene l'ID dell'ultimo log (per inizializzare SSE).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT MAX(id) FROM activity_logs')
-    result = c.fetchone()[0]
-    
-    conn.close()
+    with transaction() as c:
+        c.execute('SELECT MAX(id) FROM activity_logs')
+        result = c.fetchone()[0]
     return result or 0
 
 
@@ -490,59 +666,57 @@ def log_heartbeat():
     add_activity_log('SYSTEM', 'Heartbeat: Connection to FXCM API stable')
 
 
-def log_trader(message, pair=None):
-    """Log trader debug message - for detailed trading flow"""
+def log_trader(message, *args, pair=None):
+    """
+    Log trader debug message - for detailed trading flow.
+    Formattazione pigra: message e' un template %-style formattato con args
+    solo se il log va scritto (DEBUG attivo per la coppia e non scartato
+    dal campionamento), es. log_trader('zones: %s', zones, pair=pair).
+    """
+    if not log_enabled('TRADER', pair):
+        return
+    keep, suppressed = _sample(pair, message)
+    if not keep:
+        return
+    if args:
+        message = message % args
+    if suppressed:
+        message = f'{message} [{suppressed} similar messages suppressed]'
     add_activity_log('TRADER', message, pair=pair)
 
 
 def check_in_progress_trade(pair):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
-    
-    c = conn.cursor()
-
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS' and trade_type = 'FULL'", (pair,))
+    with transaction(sqlite3.Row) as c:
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS' and trade_type = 'FULL'", (pair,))
 
     
 
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+        # Fetch the first record
+        record = c.fetchone()
 
     return record
 
 def check_in_retest_trade(pair):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
+    with transaction(sqlite3.Row) as c:
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN RETEST'", (pair,))
 
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN RETEST'", (pair,))
-
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+        # Fetch the first record
+        record = c.fetchone()
 
     return record
 
 def fetch_trades_from_db(pair):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
-
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' 
-    c.execute("SELECT * FROM trades WHERE pair = ?", (pair,))
-
-    # Fetch all rows from the executed query
-    records = c.fetchall()
+    with transaction(sqlite3.Row) as c:
+        # Execute a SQL statement to find trades with the given 'pair' 
+        c.execute("SELECT * FROM trades WHERE pair = ?", (pair,))
 
-    conn.close()
+        # Fetch all rows from the executed query
+        records = c.fetchall()
     return records
 
+@_mt5_serialized
 def fetch_trades_from_mt5(pair):
     
     orders = None
@@ -564,91 +738,233 @@ def fetch_trades_from_mt5(pair):
     return orders, positions
 
 def check_in_closed_trade(pair, pattern_rectX1):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
+    with transaction(sqlite3.Row) as c:
+        status = 'CLOSED'
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        c.execute("SELECT * FROM trades WHERE pair = ? AND pattern_x1 = ? AND status = ?", (pair,pattern_rectX1, status))
 
-    status = 'CLOSED'
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND pattern_x1 = ? AND status = ?", (pair,pattern_rectX1, status))
-
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+        # Fetch the first record
+        record = c.fetchone()
 
     return record
 
 def get_closed_trades_after_date(pair, pattern_rectX1):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
+    with transaction(sqlite3.Row) as c:
+        status = 'CLOSED'
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        # close_ts: chiusura in epoch (schema.py), confronto corretto anche tra anni diversi
+        c.execute("SELECT * FROM trades WHERE pair = ? AND status = ? AND close_ts > ?", (pair,status, to_epoch(pattern_rectX1)))
 
-    status = 'CLOSED'
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND status = ? AND close_date > ?", (pair,status, pattern_rectX1))
+        # Fetch the first record
+        record = c.fetchone()
 
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+    return record
+
+# ============================================================================
+# PATTERN TRACKER - Stato della ricerca incrementale dei pattern M15
+# ============================================================================
 
+def initialize_pattern_trackers_db():
+    """
+    Inizializza la tabella pattern_trackers: stato dei PatternTracker
+    (pattern_tracker.py), una riga per coppia e lato (SUP/RES) con la zona
+    H4 a cui si riferisce.
+    """
+    with transaction() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS pattern_trackers (
+                pair TEXT NOT NULL,
+                side TEXT NOT NULL,
+                zone_x1 TEXT,
+                state TEXT NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (pair, side)
+            )
+        ''')
+
+
+def get_pattern_tracker_state(pair, side):
+    """
+    Stato salvato del PatternTracker di pair/side: (zone_x1, state JSON),
+    None se non c'e'.
+    """
+    with transaction() as c:
+        c.execute("SELECT zone_x1, state FROM pattern_trackers WHERE pair = ? AND side = ?", (pair, side))
+        record = c.fetchone()
     return record
 
-def drop_all_tables():
-    # Connect to SQLite database
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
 
-    # Fetch all table names
-    c.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = c.fetchall()
+def save_pattern_tracker_state(pair, side, zone_x1, state):
+    """
+    Salva (sovrascrive) lo stato JSON del PatternTracker di pair/side.
+    """
+    with transaction() as c:
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            INSERT OR REPLACE INTO pattern_trackers (pair, side, zone_x1, state, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (pair, side, zone_x1, state, updated_at))
+
+
+# ============================================================================
+# BREAKOUT - Stato della macchina rottura/retest del pattern M15
+# ============================================================================
+
+def initialize_breakout_states_db():
+    """
+    Inizializza la tabella breakout_states: stato delle BreakoutMachine
+    (breakout.py), una riga per coppia con la chiave del pattern a cui si
+    riferisce.
+    """
+    with transaction() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS breakout_states (
+                pair TEXT PRIMARY KEY,
+                setup_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TEXT
+            )
+        ''')
+
 
-    # Drop each table
-    for table_name in tables:
-        c.execute(f'DROP TABLE {table_name[0]}')
+def get_breakout_state(pair):
+    """
+    Stato salvato della BreakoutMachine di pair: (setup_key, state JSON),
+    None se non c'e'.
+    """
+    with transaction() as c:
+        c.execute("SELECT setup_key, state FROM breakout_states WHERE pair = ?", (pair,))
+        record = c.fetchone()
+    return record
 
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
+
+def save_breakout_state(pair, setup_key, state):
+    """
+    Salva (sovrascrive) lo stato JSON della BreakoutMachine di pair.
+    """
+    with transaction() as c:
+        updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            INSERT OR REPLACE INTO breakout_states (pair, setup_key, state, updated_at)
+            VALUES (?, ?, ?, ?)
+        ''', (pair, setup_key, state, updated_at))
+
+
+# ============================================================================
+# TRADE MANAGER - Stato della gestione incrementale dei trade in corso
+# ============================================================================
+
+def initialize_trade_managers_db():
+    """
+    Inizializza la tabella trade_managers: stato dei TradeManager
+    (trade_manager.py), una riga per coppia con la chiave del trade in corso
+    a cui si riferisce.
+    """
+    with transaction() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS trade_managers (
+                pair TEXT PRIMARY KEY,
+                trade_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at TEXT
+            )
+        ''')
+
+
+def get_trade_manager_state(pair):
+    """
+    Stato salvato del TradeManager di pair: (trade_key, state JSON),
+    None se non c'e'.
+    """
+    with transaction() as c:
+        c.execute("SELECT trade_key, state FROM trade_managers WHERE pair = ?", (pair,))
+        record = c.fetchone()
+    return record
+
+
+def _set_trade_manager_state(cursor, pair, trade_key, state):
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('''
+        INSERT OR REPLACE INTO trade_managers (pair, trade_key, state, updated_at)
+        VALUES (?, ?, ?, ?)
+    ''', (pair, trade_key, state, updated_at))
+
+
+def save_trade_manager_state(pair, trade_key, state):
+    """
+    Salva (sovrascrive) lo stato JSON del TradeManager di pair.
+    """
+    with transaction() as c:
+        _set_trade_manager_state(c, pair, trade_key, state)
+
+
+def apply_trade_updates(pair, updates, trade_key=None, state=None):
+    """
+    Applica in una sola transazione le modifiche al trade di pair raccolte da
+    trade_manager.TradeWrites, in ordine: ('target', target, rr),
+    ('stop_loss', stop_loss, entry_price_index, rr) e
+    ('closed', result, trade_type, close_date, risk_reward), come
+    update_trade_target / update_trade_stoploss / update_trade_closed.
+    Con trade_key e state salva nella stessa transazione anche lo stato del
+    TradeManager: un'interruzione lascia o tutto o niente.
+    Target e stop loss sono inviati a MT5 (o registrati in simulazione) dopo
+    il commit.
+    """
+    with transaction(sqlite3.Row) as c:
+        for kind, *args in updates:
+            if kind == 'target':
+                _set_trade_target(c, pair, *args)
+            elif kind == 'stop_loss':
+                _set_trade_stoploss(c, pair, *args)
+            elif kind == 'closed':
+                _set_trade_closed(c, pair, *args)
+        if state is not None:
+            _set_trade_manager_state(c, pair, trade_key, state)
+
+    for kind, *args in updates:
+        if kind == 'target':
+            _mt5_update_target(pair, *args)
+        elif kind == 'stop_loss':
+            _mt5_update_stoploss(pair, *args)
+
+def drop_all_tables():
+    with transaction() as c:
+        # Fetch all table names
+        c.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = c.fetchall()
+
+        # Drop each table
+        for table_name in tables:
+            c.execute(f'DROP TABLE {table_name[0]}')
+
+        # Commit changes and close connection
 
     print("All tables dropped.")
 
 def drop_table(table_name):
-    # Connect to SQLite database
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Drop table
-    c.execute(f'DROP TABLE IF EXISTS {table_name}')
+    with transaction() as c:
+        # Drop table
+        c.execute(f'DROP TABLE IF EXISTS {table_name}')
 
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
+        # Commit changes and close connection
 
     print(f"Table {table_name} dropped.")
 
 def clean_table(table_name):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with transaction() as c:
+        # SQL statement to delete all records from the table
+        delete_all_records_sql = f'DELETE FROM {table_name}'
     
-    # SQL statement to delete all records from the table
-    delete_all_records_sql = f'DELETE FROM {table_name}'
-    
-    c.execute(delete_all_records_sql)
-    conn.commit()
-    conn.close()
+        c.execute(delete_all_records_sql)
 
     print(f"Table {table_name} cleaned.")
 
 def update_trade_in_progress(pair, entry_price_index, entry_price_date):
 
-    conn = sqlite3.connect(DB_PATH)
     table = 'trades'
     status = 'IN PROGRESS'
     status_to_check = 'IN RETEST'
-    with conn:
-        cursor = conn.cursor()
+    with transaction() as cursor:
         cursor.execute(f"""
             UPDATE {table} 
             SET status = ?, entry_price_index = ?, entry_date = ?
@@ -658,15 +974,10 @@ def update_trade_in_progress(pair, entry_price_index, entry_price_date):
                 WHERE pair = ? AND status = ? 
             )
         """, (status, entry_price_index, entry_price_date, pair, status_to_check))
-        conn.commit()
-    conn.close()
-
-def update_trade_stoploss(pair, new_stop_loss, entry_price_index, rr):
-    conn = sqlite3.connect(DB_PATH)
 
+def _set_trade_stoploss(cursor, pair, new_stop_loss, entry_price_index, rr):
     table = 'trades'
     status_to_check = 'IN PROGRESS'
-    cursor = conn.cursor()
     cursor.execute(f"""
         UPDATE {table} 
         SET stop_loss = ?, entry_price_index = ?, final_risk_reward = ?
@@ -677,10 +988,9 @@ def update_trade_stoploss(pair, new_stop_loss, entry_price_index, rr):
             LIMIT 1
             )
     """, (new_stop_loss, entry_price_index, rr, pair, status_to_check))
-    
-    conn.commit()
-    conn.close()
-    
+
+@_mt5_serialized
+def _mt5_update_stoploss(pair, new_stop_loss, entry_price_index, rr):
     # Alzo stoploss
     if SIMULATION_MODE:
         log_mt5_modification(pair, 'UPDATE_SL', new_sl=new_stop_loss, 
@@ -710,191 +1020,176 @@ def update_trade_stoploss(pair, new_stop_loss, entry_price_index, rr):
             result = mt5.order_send(request)
             send_slack_message(os.getenv('SLACK_CHANNEL', 'general'), str(result))
 
+def update_trade_stoploss(pair, new_stop_loss, entry_price_index, rr):
+    with transaction() as cursor:
+        _set_trade_stoploss(cursor, pair, new_stop_loss, entry_price_index, rr)
+    _mt5_update_stoploss(pair, new_stop_loss, entry_price_index, rr)
+
 def upsert_order_waiting_retest(trade_setup,target_1_1):
     print('upsert_order_waiting_retest')
     print('target_1_1: '+str(target_1_1))
     print('target: '+str(trade_setup['target_price']))
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Check if a trade for the instrument with status 'IN RETEST' already exists
-    c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN RETEST'", (trade_setup['pair'],))
-    existing_trade = c.fetchone()
-    #print("trade in retest: "+str(existing_trade))
-    # If not, create two new trades
-    if not existing_trade:
-        #insert full trade
-
-        adjusted_entry_price_full = mt5_place_order(trade_setup)
-        trade_setup['entry_price'] = adjusted_entry_price_full  # Update entry_price for database insert
-
-        c.execute("""
-            INSERT INTO trades (pair, status, trade_type, entry_price, stop_loss, target, direction, initial_risk_reward, zones_rectX1_DLY, zones_rectY1_DLY, zones_rectY2_DLY, zones_rectX1_H4, zones_rectY1_H4, zones_rectY2_H4, pattern_x1, pattern_y1, pattern_y2, breakup_date, fibonacci100)
-            VALUES (:pair, :status, :trade_type, :entry_price, :stop_loss, :target, :direction, :initial_risk_reward, :zones_rectX1_DLY, :zones_rectY1_DLY, :zones_rectY2_DLY, :zones_rectX1_H4, :zones_rectY1_H4, :zones_rectY2_H4, :pattern_x1, :pattern_y1, :pattern_y2, :breakup_date, :fibonacci100)
-        """, {
-            'pair': trade_setup['pair'],
-            'status': 'IN RETEST',
-            'trade_type': 'FULL',
-            'entry_price': trade_setup['entry_price'],
-            'stop_loss': trade_setup['stop_loss_price'],
-            'target': trade_setup['target_price'],
-            'direction': trade_setup['direction'],
-            'initial_risk_reward': trade_setup['risk_reward'],
-            'zones_rectX1_DLY': trade_setup['zones_rectX1_DLY'],
-            'zones_rectY1_DLY': trade_setup['zones_rectY1_DLY'],
-            'zones_rectY2_DLY': trade_setup['zones_rectY2_DLY'],
-            'zones_rectX1_H4': trade_setup['zones_rectX1_H4'],
-            'zones_rectY1_H4': trade_setup['zones_rectY1_H4'],
-            'zones_rectY2_H4': trade_setup['zones_rectY2_H4'],
-            'pattern_x1': trade_setup['pattern_x1'],
-            'pattern_y1': trade_setup['pattern_y1'],
-            'pattern_y2': trade_setup['pattern_y2'],
-            'breakup_date': trade_setup['breakup_date'],
-            'fibonacci100': trade_setup['fibonacci100']
-        })
+    with transaction() as c:
+        # Check if a trade for the instrument with status 'IN RETEST' already exists
+        c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN RETEST'", (trade_setup['pair'],))
+        existing_trade = c.fetchone()
+        #print("trade in retest: "+str(existing_trade))
+        # If not, create two new trades
+        if not existing_trade:
+            #insert full trade
+
+            adjusted_entry_price_full = mt5_place_order(trade_setup)
+            trade_setup['entry_price'] = adjusted_entry_price_full  # Update entry_price for database insert
+
+            c.execute("""
+                INSERT INTO trades (pair, status, trade_type, entry_price, stop_loss, target, direction, initial_risk_reward, zones_rectX1_DLY, zones_rectY1_DLY, zones_rectY2_DLY, zones_rectX1_H4, zones_rectY1_H4, zones_rectY2_H4, pattern_x1, pattern_y1, pattern_y2, breakup_date, fibonacci100)
+                VALUES (:pair, :status, :trade_type, :entry_price, :stop_loss, :target, :direction, :initial_risk_reward, :zones_rectX1_DLY, :zones_rectY1_DLY, :zones_rectY2_DLY, :zones_rectX1_H4, :zones_rectY1_H4, :zones_rectY2_H4, :pattern_x1, :pattern_y1, :pattern_y2, :breakup_date, :fibonacci100)
+            """, {
+                'pair': trade_setup['pair'],
+                'status': 'IN RETEST',
+                'trade_type': 'FULL',
+                'entry_price': trade_setup['entry_price'],
+                'stop_loss': trade_setup['stop_loss_price'],
+                'target': trade_setup['target_price'],
+                'direction': trade_setup['direction'],
+                'initial_risk_reward': trade_setup['risk_reward'],
+                'zones_rectX1_DLY': trade_setup['zones_rectX1_DLY'],
+                'zones_rectY1_DLY': trade_setup['zones_rectY1_DLY'],
+                'zones_rectY2_DLY': trade_setup['zones_rectY2_DLY'],
+                'zones_rectX1_H4': trade_setup['zones_rectX1_H4'],
+                'zones_rectY1_H4': trade_setup['zones_rectY1_H4'],
+                'zones_rectY2_H4': trade_setup['zones_rectY2_H4'],
+                'pattern_x1': trade_setup['pattern_x1'],
+                'pattern_y1': trade_setup['pattern_y1'],
+                'pattern_y2': trade_setup['pattern_y2'],
+                'breakup_date': trade_setup['breakup_date'],
+                'fibonacci100': trade_setup['fibonacci100']
+            })
         
-        # mt5_place_order(trade_setup)
-
-        #insert partial trade
-
-        trade_setup['target_price'] = target_1_1
-        trade_setup['type'] = 'PARTIAL'
-        adjusted_entry_price_partial = mt5_place_order(trade_setup)
-        trade_setup['entry_price'] = adjusted_entry_price_partial  # Update entry_price for partial trade
-
-        c.execute("""
-            INSERT INTO trades (pair, status, trade_type, entry_price, stop_loss, target, direction, initial_risk_reward, zones_rectX1_DLY, zones_rectY1_DLY, zones_rectY2_DLY, zones_rectX1_H4, zones_rectY1_H4, zones_rectY2_H4, pattern_x1, pattern_y1, pattern_y2, breakup_date, fibonacci100)
-            VALUES (:pair, :status, :trade_type, :entry_price, :stop_loss, :target, :direction, :initial_risk_reward, :zones_rectX1_DLY, :zones_rectY1_DLY, :zones_rectY2_DLY, :zones_rectX1_H4, :zones_rectY1_H4, :zones_rectY2_H4, :pattern_x1, :pattern_y1, :pattern_y2, :breakup_date, :fibonacci100)
-        """, {
-            'pair': trade_setup['pair'],
-            'status': 'IN RETEST',
-            'trade_type': 'PARTIAL',
-            'entry_price': trade_setup['entry_price'],
-            'stop_loss': trade_setup['stop_loss_price'],
-            'target': target_1_1,
-            'direction': trade_setup['direction'],
-            'initial_risk_reward': 1,
-            'final_risk_reward': 1,
-            'zones_rectX1_DLY': trade_setup['zones_rectX1_DLY'],
-            'zones_rectY1_DLY': trade_setup['zones_rectY1_DLY'],
-            'zones_rectY2_DLY': trade_setup['zones_rectY2_DLY'],
-            'zones_rectX1_H4': trade_setup['zones_rectX1_H4'],
-            'zones_rectY1_H4': trade_setup['zones_rectY1_H4'],
-            'zones_rectY2_H4': trade_setup['zones_rectY2_H4'],
-            'pattern_x1': trade_setup['pattern_x1'],
-            'pattern_y1': trade_setup['pattern_y1'],
-            'pattern_y2': trade_setup['pattern_y2'],
-            'breakup_date': trade_setup['breakup_date'],
-            'fibonacci100':trade_setup['fibonacci100']
-        })
+            # mt5_place_order(trade_setup)
+
+            #insert partial trade
+
+            trade_setup['target_price'] = target_1_1
+            trade_setup['type'] = 'PARTIAL'
+            adjusted_entry_price_partial = mt5_place_order(trade_setup)
+            trade_setup['entry_price'] = adjusted_entry_price_partial  # Update entry_price for partial trade
+
+            c.execute("""
+                INSERT INTO trades (pair, status, trade_type, entry_price, stop_loss, target, direction, initial_risk_reward, final_risk_reward, zones_rectX1_DLY, zones_rectY1_DLY, zones_rectY2_DLY, zones_rectX1_H4, zones_rectY1_H4, zones_rectY2_H4, pattern_x1, pattern_y1, pattern_y2, breakup_date, fibonacci100)
+                VALUES (:pair, :status, :trade_type, :entry_price, :stop_loss, :target, :direction, :initial_risk_reward, :final_risk_reward, :zones_rectX1_DLY, :zones_rectY1_DLY, :zones_rectY2_DLY, :zones_rectX1_H4, :zones_rectY1_H4, :zones_rectY2_H4, :pattern_x1, :pattern_y1, :pattern_y2, :breakup_date, :fibonacci100)
+            """, {
+                'pair': trade_setup['pair'],
+                'status': 'IN RETEST',
+                'trade_type': 'PARTIAL',
+                'entry_price': trade_setup['entry_price'],
+                'stop_loss': trade_setup['stop_loss_price'],
+                'target': target_1_1,
+                'direction': trade_setup['direction'],
+                'initial_risk_reward': 1,
+                'final_risk_reward': 1,
+                'zones_rectX1_DLY': trade_setup['zones_rectX1_DLY'],
+                'zones_rectY1_DLY': trade_setup['zones_rectY1_DLY'],
+                'zones_rectY2_DLY': trade_setup['zones_rectY2_DLY'],
+                'zones_rectX1_H4': trade_setup['zones_rectX1_H4'],
+                'zones_rectY1_H4': trade_setup['zones_rectY1_H4'],
+                'zones_rectY2_H4': trade_setup['zones_rectY2_H4'],
+                'pattern_x1': trade_setup['pattern_x1'],
+                'pattern_y1': trade_setup['pattern_y1'],
+                'pattern_y2': trade_setup['pattern_y2'],
+                'breakup_date': trade_setup['breakup_date'],
+                'fibonacci100':trade_setup['fibonacci100']
+            })
         
-        # trade_setup['target_price'] = target_1_1
-        # trade_setup['type'] = 'PARTIAL'
-        # mt5_place_order(trade_setup)
+            # trade_setup['target_price'] = target_1_1
+            # trade_setup['type'] = 'PARTIAL'
+            # mt5_place_order(trade_setup)
         
-    else:
-        print('trade direction: '+str(trade_setup['direction']))
-        mt5_close_order(trade_setup['pair'])
+        else:
+            print('trade direction: '+str(trade_setup['direction']))
+            mt5_close_order(trade_setup['pair'])
 
-        # Update full trade
-        adjusted_entry_price_update = mt5_place_order(trade_setup)
-        trade_setup['entry_price'] = adjusted_entry_price_update
+            # Update full trade
+            adjusted_entry_price_update = mt5_place_order(trade_setup)
+            trade_setup['entry_price'] = adjusted_entry_price_update
 
-        c.execute("""
-            UPDATE trades 
-            SET entry_price = :entry_price, 
-                stop_loss = :stop_loss_price, 
-                target = :target_price,  
-                direction = :direction, 
-                initial_risk_reward = :risk_reward,
-                zones_rectX1_DLY = :zones_rectX1_DLY, 
-                zones_rectY1_DLY = :zones_rectY1_DLY, 
-                zones_rectY2_DLY = :zones_rectY2_DLY,
-                zones_rectX1_H4 = :zones_rectX1_H4, 
-                zones_rectY1_H4 = :zones_rectY1_H4, 
-                zones_rectY2_H4 = :zones_rectY2_H4,
-                pattern_x1 = :pattern_x1, 
-                pattern_y1 = :pattern_y1, 
-                pattern_y2 = :pattern_y2,
-                breakup_date = :breakup_date
-            WHERE pair = :pair AND status = 'IN RETEST' AND trade_type = 'FULL'
-        """, trade_setup)
+            c.execute("""
+                UPDATE trades 
+                SET entry_price = :entry_price, 
+                    stop_loss = :stop_loss_price, 
+                    target = :target_price,  
+                    direction = :direction, 
+                    initial_risk_reward = :risk_reward,
+                    zones_rectX1_DLY = :zones_rectX1_DLY, 
+                    zones_rectY1_DLY = :zones_rectY1_DLY, 
+                    zones_rectY2_DLY = :zones_rectY2_DLY,
+                    zones_rectX1_H4 = :zones_rectX1_H4, 
+                    zones_rectY1_H4 = :zones_rectY1_H4, 
+                    zones_rectY2_H4 = :zones_rectY2_H4,
+                    pattern_x1 = :pattern_x1, 
+                    pattern_y1 = :pattern_y1, 
+                    pattern_y2 = :pattern_y2,
+                    breakup_date = :breakup_date
+                WHERE pair = :pair AND status = 'IN RETEST' AND trade_type = 'FULL'
+            """, trade_setup)
         
-        # mt5_place_order(trade_setup)
-
-        # Update partial trade
-        partial_trade_setup = trade_setup.copy()
-        partial_trade_setup['target_price'] = target_1_1
-        partial_trade_setup['initial_risk_reward'] = 1
-        partial_trade_setup['final_risk_reward'] = 1
-        c.execute("""
-            UPDATE trades 
-            SET entry_price = :entry_price, 
-                stop_loss = :stop_loss_price, 
-                target = :target_price,  
-                direction = :direction, 
-                initial_risk_reward = :initial_risk_reward,
-                final_risk_reward = :final_risk_reward,
-                zones_rectX1_DLY = :zones_rectX1_DLY, 
-                zones_rectY1_DLY = :zones_rectY1_DLY, 
-                zones_rectY2_DLY = :zones_rectY2_DLY,
-                zones_rectX1_H4 = :zones_rectX1_H4, 
-                zones_rectY1_H4 = :zones_rectY1_H4, 
-                zones_rectY2_H4 = :zones_rectY2_H4,
-                pattern_x1 = :pattern_x1, 
-                pattern_y1 = :pattern_y1, 
-                pattern_y2 = :pattern_y2,
-                breakup_date = :breakup_date
-            WHERE pair = :pair AND status = 'IN RETEST' AND trade_type = 'PARTIAL'
-        """, partial_trade_setup)
-
-        trade_setup['target_price'] = target_1_1
-        trade_setup['type'] = 'PARTIAL'
-        mt5_place_order(trade_setup)
-
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
-
-def update_trade_closed(pair, result, trade_type, close_date, risk_reward):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    with conn:
-        cursor = conn.cursor()
-
-        if trade_type == 'FULL' and result == 'TARGET':
-            cursor.execute("""
-                SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS'
-            """, (pair,))
-
-            trades_in_progress = cursor.fetchall()
-            for trade in trades_in_progress:
-                final_risk_reward = risk_reward
-                initial_risk_reward = trade['initial_risk_reward']
-                profit = str(risk_reward)
-
-                # if trade type is 'PARTIAL' update with 1 on final_risk_reward and profit columns
-                if trade[2] == 'PARTIAL':
-                    initial_risk_reward = 1
-                    if risk_reward > 0:
-                        final_risk_reward = 1
-                        profit = '1'
-                    else:
-                        final_risk_reward = 0
-                        profit = '0'
-                
-                cursor.execute("""
-                    UPDATE trades 
-                    SET status = 'CLOSED', 
-                        result = ?, 
-                        close_date = ?, 
-                        initial_risk_reward = ?,
-                        final_risk_reward = ?, 
-                        profit = ?
-                    WHERE pair = ? AND status = 'IN PROGRESS'
-                """, (result, str(close_date), initial_risk_reward, final_risk_reward, profit, pair))
-
-        elif trade_type == 'PARTIAL' and result == 'TARGET':
+            # mt5_place_order(trade_setup)
+
+            # Update partial trade
+            partial_trade_setup = trade_setup.copy()
+            partial_trade_setup['target_price'] = target_1_1
+            partial_trade_setup['initial_risk_reward'] = 1
+            partial_trade_setup['final_risk_reward'] = 1
+            c.execute("""
+                UPDATE trades 
+                SET entry_price = :entry_price, 
+                    stop_loss = :stop_loss_price, 
+                    target = :target_price,  
+                    direction = :direction, 
+                    initial_risk_reward = :initial_risk_reward,
+                    final_risk_reward = :final_risk_reward,
+                    zones_rectX1_DLY = :zones_rectX1_DLY, 
+                    zones_rectY1_DLY = :zones_rectY1_DLY, 
+                    zones_rectY2_DLY = :zones_rectY2_DLY,
+                    zones_rectX1_H4 = :zones_rectX1_H4, 
+                    zones_rectY1_H4 = :zones_rectY1_H4, 
+                    zones_rectY2_H4 = :zones_rectY2_H4,
+                    pattern_x1 = :pattern_x1, 
+                    pattern_y1 = :pattern_y1, 
+                    pattern_y2 = :pattern_y2,
+                    breakup_date = :breakup_date
+                WHERE pair = :pair AND status = 'IN RETEST' AND trade_type = 'PARTIAL'
+            """, partial_trade_setup)
+
+            trade_setup['target_price'] = target_1_1
+            trade_setup['type'] = 'PARTIAL'
+            mt5_place_order(trade_setup)
+
+        # Commit the changes and close the connection
+
+def _set_trade_closed(cursor, pair, result, trade_type, close_date, risk_reward):
+    # cursor di una connessione con row_factory = sqlite3.Row
+    if trade_type == 'FULL' and result == 'TARGET':
+        cursor.execute("""
+            SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS'
+        """, (pair,))
+
+        trades_in_progress = cursor.fetchall()
+        for trade in trades_in_progress:
+            final_risk_reward = risk_reward
+            initial_risk_reward = trade['initial_risk_reward']
+            profit = str(risk_reward)
+
+            # if trade type is 'PARTIAL' update with 1 on final_risk_reward and profit columns
+            if trade['trade_type'] == 'PARTIAL':
+                initial_risk_reward = 1
+                if risk_reward > 0:
+                    final_risk_reward = 1
+                    profit = '1'
+                else:
+                    final_risk_reward = 0
+                    profit = '0'
+            
             cursor.execute("""
                 UPDATE trades 
                 SET status = 'CLOSED', 
@@ -903,75 +1198,72 @@ def update_trade_closed(pair, result, trade_type, close_date, risk_reward):
                     initial_risk_reward = ?,
                     final_risk_reward = ?, 
                     profit = ?
-                WHERE pair = ? AND status = 'IN PROGRESS' AND trade_type = 'PARTIAL'
-            """, (result, str(close_date), risk_reward, risk_reward, str(risk_reward), pair))
+                WHERE pair = ? AND status = 'IN PROGRESS' AND trade_type = ?
+            """, (result, str(close_date), initial_risk_reward, final_risk_reward, profit, pair, trade['trade_type']))
 
-        elif result == 'STOP LOSS':
-            cursor.execute("""
-                UPDATE trades 
-                SET status = 'CLOSED', 
-                    result = ?, 
-                    close_date = ?, 
-                    profit = ? 
-                WHERE pair = ? AND status = 'IN PROGRESS'
-            """, (result, str(close_date), str(risk_reward), pair))
+    elif trade_type == 'PARTIAL' and result == 'TARGET':
+        cursor.execute("""
+            UPDATE trades 
+            SET status = 'CLOSED', 
+                result = ?, 
+                close_date = ?, 
+                initial_risk_reward = ?,
+                final_risk_reward = ?, 
+                profit = ?
+            WHERE pair = ? AND status = 'IN PROGRESS' AND trade_type = 'PARTIAL'
+        """, (result, str(close_date), risk_reward, risk_reward, str(risk_reward), pair))
+
+    elif result == 'STOP LOSS':
+        cursor.execute("""
+            UPDATE trades 
+            SET status = 'CLOSED', 
+                result = ?, 
+                close_date = ?, 
+                profit = ? 
+            WHERE pair = ? AND status = 'IN PROGRESS'
+        """, (result, str(close_date), str(risk_reward), pair))
 
-        conn.commit()
-    conn.close()
 
-def get_partial_trade_closed(pair, entry_date):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
+def update_trade_closed(pair, result, trade_type, close_date, risk_reward):
+    with transaction(sqlite3.Row) as cursor:
+        _set_trade_closed(cursor, pair, result, trade_type, close_date, risk_reward)
 
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND entry_date = ? AND trade_type = 'PARTIAL'", (pair,entry_date))
+def get_partial_trade_closed(pair, entry_date):
+    with transaction(sqlite3.Row) as c:
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        c.execute("SELECT * FROM trades WHERE pair = ? AND entry_date = ? AND trade_type = 'PARTIAL'", (pair,entry_date))
 
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+        # Fetch the first record
+        record = c.fetchone()
 
     return record
 
 def get_partial_trade(pair):
-    conn = sqlite3.connect(DB_PATH)
-    # Set the row_factory attribute to sqlite3.Row
-    conn.row_factory = sqlite3.Row
+    with transaction(sqlite3.Row) as c:
+        # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
+        c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS' AND trade_type = 'PARTIAL'", (pair,))
 
-    c = conn.cursor()
-    # Execute a SQL statement to find trades with the given 'pair' and 'IN PROGRESS' status
-    c.execute("SELECT * FROM trades WHERE pair = ? AND status = 'IN PROGRESS' AND trade_type = 'PARTIAL'", (pair,))
-
-    # Fetch the first record
-    record = c.fetchone()
-    conn.close()
+        # Fetch the first record
+        record = c.fetchone()
 
     return record
 
 def remove_closed_trades(pair, entry_date, pattern_x1, pattern_y1, pattern_y2):
-    conn = sqlite3.connect(DB_PATH)
+    with transaction() as cursor:
+        table = 'trades'
+        status_to_check = 'CLOSED'
 
-    table = 'trades'
-    status_to_check = 'CLOSED'
-    cursor = conn.cursor()
-
-    cursor.execute(f"""
-        DELETE FROM {table} 
-        WHERE pair = ? AND entry_date = ? AND pattern_x1 = ? AND pattern_y1 = ? AND pattern_y2 = ? AND status = ?
-    """, (pair, entry_date, pattern_x1, pattern_y1, pattern_y2, status_to_check))
-
-    conn.commit()
-    conn.close()
+        cursor.execute(f"""
+            DELETE FROM {table} 
+            WHERE pair = ? AND entry_date = ? AND pattern_x1 = ? AND pattern_y1 = ? AND pattern_y2 = ? AND status = ?
+        """, (pair, entry_date, pattern_x1, pattern_y1, pattern_y2, status_to_check))
 
 def close_trade_in_retest(pair):
     print('close_trade_in_retest')
-    conn = sqlite3.connect(DB_PATH)
     table = 'trades'
     status = 'CLOSED'
     status_to_check = 'IN RETEST'
-    with conn:
-        cursor = conn.cursor()
+    with transaction() as cursor:
         cursor.execute(f"""
             UPDATE {table} 
             SET status = ?
@@ -981,33 +1273,26 @@ def close_trade_in_retest(pair):
                 WHERE pair = ? AND status = ? 
             )
         """, (status, pair, status_to_check))
-        conn.commit()
-    conn.close()
     mt5_close_order(pair)
     mt5_close_positions(pair)
 
 def get_stop_loss(pair, entry_date):
-    # Connect to SQLite database
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # SQL statement to select the stop_loss
-    c.execute("SELECT stop_loss FROM trades WHERE pair = ? AND entry_date = ? AND trade_type = 'PARTIAL'", (pair, entry_date))
+    with transaction() as c:
+        # SQL statement to select the stop_loss
+        c.execute("SELECT stop_loss FROM trades WHERE pair = ? AND entry_date = ? AND trade_type = 'PARTIAL'", (pair, entry_date))
 
-    # Fetch the first result
-    result = c.fetchone()
+        # Fetch the first result
+        result = c.fetchone()
 
-    # If the result is not None, return the stop_loss value
-    if result is not None:
-        stop_loss = result[0]
-    else:
-        stop_loss = None
-
-    # Close the database connection
-    conn.close()
+        # If the result is not None, return the stop_loss value
+        if result is not None:
+            stop_loss = result[0]
+        else:
+            stop_loss = None
 
     return stop_loss
 
+@_mt5_serialized
 def mt5_place_order(trade):
     symbol = trade['pair'].replace("/", "")
     
@@ -1134,6 +1419,7 @@ def mt5_place_order(trade):
     # Return the adjusted entry price regardless of trade execution outcome
     return adjusted_entry_price
 
+@_mt5_serialized
 def mt5_close_order(pair):
 
     symbol = pair.replace("/", "")
@@ -1251,19 +1537,14 @@ def calculate_trade_size(symbol, entry_price, risk_per_trade, stop_loss_price):
 
     return position_size
 
+@_mt5_serialized
 def close_mt5_orders_already_processed():
     # SIMULATION MODE
     if SIMULATION_MODE:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        # Query the database for closed trades
-        cursor.execute("SELECT * FROM trades WHERE status = 'CLOSED'")
-        closed_trades = cursor.fetchall()
-        
-        conn.close()
+        with transaction(sqlite3.Row) as cursor:
+            # Query the database for closed trades
+            cursor.execute("SELECT * FROM trades WHERE status = 'CLOSED'")
+            closed_trades = cursor.fetchall()
         
         if closed_trades:
             log_mt5_closure(None, 'CLEANUP_PROCESSED_ORDERS', 
@@ -1285,14 +1566,10 @@ def close_mt5_orders_already_processed():
         if orders is None or len(orders) == 0:
             print("No pending orders found.")
 
-        # Connect to the SQLite database
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
         # Query the database for closed trades
-        cursor.execute("SELECT * FROM trades WHERE status = 'CLOSED'")
-        closed_trades = cursor.fetchall()
+        with transaction(sqlite3.Row) as cursor:
+            cursor.execute("SELECT * FROM trades WHERE status = 'CLOSED'")
+            closed_trades = cursor.fetchall()
 
         # Print information about each pending order
         for order in orders:
@@ -1318,6 +1595,7 @@ def close_mt5_orders_already_processed():
     # Disconnect from MetaTrader 5
     mt5.shutdown()
 
+@_mt5_serialized
 def close_mt5_partial_positions(pair):
     symbol = pair.replace("/", "")
     
@@ -1357,6 +1635,7 @@ def close_mt5_partial_positions(pair):
         else:
             print("No PARTIAL positions to close or error in retrieving positions")
 
+@_mt5_serialized
 def mt5_close_positions(pair):
     symbol = pair.replace("/", "")
     
@@ -1395,11 +1674,9 @@ def mt5_close_positions(pair):
     mt5.shutdown() 
 
 
-def update_trade_target(pair, new_target, rr):
-    conn = sqlite3.connect(DB_PATH)
+def _set_trade_target(cursor, pair, new_target, rr):
     #print ('pair: '+str(pair)+' - new target: '+str(new_target)+' - rr: '+str(rr))
     table = 'trades'
-    cursor = conn.cursor()
     cursor.execute(f"""
         UPDATE {table} 
         SET target = ?, final_risk_reward = ?
@@ -1410,10 +1687,9 @@ def update_trade_target(pair, new_target, rr):
             LIMIT 1
             )
     """, (new_target, rr, pair))
-    
-    conn.commit()
-    conn.close()
 
+@_mt5_serialized
+def _mt5_update_target(pair, new_target, rr):
     # SIMULATION MODE
     if SIMULATION_MODE:
         log_mt5_modification(pair, 'UPDATE_TARGET', new_tp=new_target, 
@@ -1443,6 +1719,12 @@ def update_trade_target(pair, new_target, rr):
             # send a trading request
             result = mt5.order_send(request)
 
+def update_trade_target(pair, new_target, rr):
+    with transaction() as cursor:
+        _set_trade_target(cursor, pair, new_target, rr)
+    _mt5_update_target(pair, new_target, rr)
+
+@_mt5_serialized
 def update_trade_target_ALL(pair, new_target, rr):
     symbol = pair.replace("/", "")
     
@@ -0,0 +1,90 @@
+"""
+Sessione ForexConnect condivisa dal bot_runner.
+
+Un solo login FXCM per tutta la vita del processo: tutte le coppie di un
+ciclo (e tutti i cicli successivi) scaricano lo storico dalla stessa
+sessione. Lo stato della sessione viene seguito tramite la stessa callback
+usata da martina.py (common_samples.session_status_changed); se la sessione
+cade viene riaperta al primo get_history successivo.
+
+Le richieste sono serializzate da self.lock: i worker di bot_runner
+scaricano in parallelo solo la parte servita dalla cache (candle_cache),
+ForexConnect non garantisce richieste concorrenti sulla stessa sessione.
+"""
+
+import threading
+
+import common_samples
+from forexconnect import ForexConnect, fxcorepy
+
+_STATUS = fxcorepy.AO2GSessionStatus.O2GSessionStatus
+# stati in cui la sessione non e' piu' utilizzabile e va riaperta
+_LOST_STATUSES = (_STATUS.DISCONNECTED, _STATUS.SESSION_LOST)
+
+
+class FXSession:
+    def __init__(self, user_id, password, url, connection, session_id='Trade', pin=None):
+        self.user_id = user_id
+        self.password = password
+        self.url = url
+        self.connection = connection
+        self.session_id = session_id
+        self.pin = pin
+        self.fx = None
+        self.status = None
+        self.lock = threading.RLock()
+
+    def _status_changed(self, session, status):
+        self.status = status
+        common_samples.session_status_changed(session, status)
+
+    @property
+    def connected(self):
+        return self.fx is not None and self.status not in _LOST_STATUSES
+
+    def connect(self):
+        with self.lock:
+            self.close()
+            self.fx = ForexConnect()
+            self.fx.login(self.user_id, self.password, self.url,
+                          self.connection, self.session_id, self.pin,
+                          self._status_changed)
+            self.status = _STATUS.CONNECTED
+            return self.fx
+
+    def ensure_connected(self):
+        with self.lock:
+            if not self.connected:
+                self.connect()
+            return self.fx
+
+    def get_history(self, instrument, timeframe, date_from=None, date_to=None, quotes_count=0):
+        """fx.get_history sulla sessione condivisa, una richiesta alla volta.
+        Se la richiesta fallisce perche' la sessione e' caduta, riconnette e
+        riprova una volta."""
+        with self.lock:
+            fx = self.ensure_connected()
+            try:
+                return fx.get_history(instrument, timeframe, date_from, date_to, quotes_count)
+            except Exception:
+                if self.connected:
+                    raise
+            return self.connect().get_history(instrument, timeframe, date_from, date_to, quotes_count)
+
+    def close(self):
+        with self.lock:
+            if self.fx is None:
+                return
+            try:
+                self.fx.logout()
+            except Exception as e:
+                common_samples.print_exception(e)
+            self.fx = None
+            self.status = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,19 +1,303 @@
-import pandas as pd
-
-
-def calculate_kijun(history, kijun_period):
-    kijun = {}
-
-    for i in range(kijun_period, len(history)):
-        dt = pd.to_datetime(history[i]["Date"])
-        kijun_value = 0
-        highestBidHigh = -100000
-        lowestBidLow = 100000
-        for j in range(i-kijun_period, i):
-            highestBidHigh = history[j]["BidHigh"] if history[j]["BidHigh"] > highestBidHigh else highestBidHigh
-            lowestBidLow = history[j]["BidLow"] if history[j]["BidLow"] < lowestBidLow else lowestBidLow
-
-        kijun_value =  (highestBidHigh + lowestBidLow) / 2
-        kijun[dt] = kijun_value
-
-    return kijun
+"""
+Motore Ichimoku vettoriale (Kijun-sen, Tenkan-sen, Senkou Span B).
+
+Ogni linea e' la media tra il massimo dei BidHigh e il minimo dei BidLow
+delle `period` candele PRECEDENTI la candela i (finestra i-period .. i-1),
+esattamente come il vecchio doppio ciclo di calculate_kijun. Massimi e minimi
+mobili sono calcolati in O(n) indipendentemente dal periodo (algoritmo
+van Herk / Gil-Werman a blocchi, tutto in NumPy).
+"""
+
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+TENKAN_PERIOD = 9
+KIJUN_PERIOD = 26
+SENKOU_B_PERIOD = 52
+
+
+class _KijunDict(dict):
+    """dict {Timestamp: kijun} con indici precalcolati.
+
+    by_date:     ultima chiave di ogni giorno (in ordine di inserimento)
+    sorted_keys: chiavi in ordine cronologico (per bisect)
+    ts / line:   timestamp epoch della serie H4 e linea allineata alla serie
+                 (NaN sulle prime `period` candele)
+    """
+    __slots__ = ('by_date', 'sorted_keys', 'ts', 'line')
+
+
+def rolling_max(values, period):
+    """Massimo sulle finestre [k, k+period) per k = 0 .. n-period."""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if period <= 0 or n < period:
+        return np.empty(0)
+    size = -(-n // period) * period
+    padded = np.full(size, -np.inf)
+    padded[:n] = values
+    blocks = padded.reshape(-1, period)
+    # prefix[k]: max dall'inizio del blocco di k fino a k
+    # suffix[k]: max da k fino alla fine del suo blocco
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    k = np.arange(n - period + 1)
+    return np.maximum(suffix[k], prefix[k + period - 1])
+
+
+def rolling_min(values, period):
+    """Minimo sulle finestre [k, k+period) per k = 0 .. n-period."""
+    return -rolling_max(-np.asarray(values, dtype=np.float64), period)
+
+
+def midline(high, low, period):
+    """(max(high) + min(low)) / 2 sulle `period` candele precedenti, allineata
+    alla serie: out[i] usa high/low[i-period:i], NaN per i < period."""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    n = len(high)
+    out = np.full(n, np.nan)
+    if n <= period:
+        return out
+    highest = rolling_max(high, period)[:n - period]
+    lowest = rolling_min(low, period)[:n - period]
+    out[period:] = (highest + lowest) / 2
+    return out
+
+
+def ichimoku_lines(high, low):
+    """Tenkan (9), Kijun (26) e Senkou Span B (52) allineate alla serie.
+    Le linee non sono traslate in avanti: lo shift di 26 candele della nuvola
+    e' a carico di chi disegna/usa la Senkou."""
+    return {
+        'tenkan': midline(high, low, TENKAN_PERIOD),
+        'kijun': midline(high, low, KIJUN_PERIOD),
+        'senkou_b': midline(high, low, SENKOU_B_PERIOD),
+    }
+
+
+def history_arrays(history):
+    """(ts, high, low) di una storia: CandleSeries o lista di dict FXCM."""
+    if hasattr(history, 'ts'):
+        return history.ts, history.high, history.low
+    dates = pd.to_datetime([candle['Date'] for candle in history], format='%m.%d.%Y %H:%M:%S')
+    ts = np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+    high = np.array([candle['BidHigh'] for candle in history], dtype=np.float64)
+    low = np.array([candle['BidLow'] for candle in history], dtype=np.float64)
+    return ts, high, low
+
+
+def build_kijun_dict(ts, line, start):
+    """_KijunDict dalle candele ts[start:] (le prime hanno linea NaN)."""
+    kijun = _KijunDict()
+    ts = np.asarray(ts, dtype=np.int64)
+    keys = pd.to_datetime(ts[start:], unit='s')
+    kijun.update(zip(keys, line[start:].tolist()))
+
+    # Indici per lookup O(1)/O(log n): stessa semantica delle scansioni lineari
+    # (by_date: ultima chiave di ogni giorno)
+    days = ts[start:] // 86400
+    last_of_day = np.ones(len(days), dtype=bool)
+    last_of_day[:-1] = days[1:] != days[:-1]
+    if len(days) and np.all(days[1:] >= days[:-1]):
+        kijun.by_date = dict(zip(keys[last_of_day].date, keys[last_of_day]))
+        kijun.sorted_keys = list(keys)
+    else:
+        kijun.by_date = {}
+        for _k in kijun.keys():
+            kijun.by_date[_k.date()] = _k
+        kijun.sorted_keys = sorted(kijun.keys())
+    kijun.ts = ts
+    kijun.line = line
+    return kijun
+
+
+def calculate_kijun(history, kijun_period):
+    ts, high, low = history_arrays(history)
+    line = midline(high, low, kijun_period)
+    return build_kijun_dict(ts, line, min(kijun_period, len(ts)))
+
+
+# Le candele H4 FXCM aprono alle 01/05/09/13/17/21 UTC
+H4_SECONDS = 14400
+H4_OFFSET = 3600
+
+
+def kijun_keys(kijun_h4):
+    """(timestamp epoch, valori) delle chiavi di una Kijun in ordine cronologico."""
+    line = getattr(kijun_h4, 'line', None)
+    if line is not None:
+        # le chiavi sono le ultime len(kijun_h4) candele di ts
+        start = len(kijun_h4.ts) - len(kijun_h4)
+        return (np.asarray(kijun_h4.ts[start:], dtype=np.int64),
+                np.asarray(line[start:], dtype=np.float64))
+    keys = sorted(kijun_h4.keys())
+    ts = np.asarray(pd.DatetimeIndex(keys), dtype='datetime64[s]').astype(np.int64)
+    return ts, np.array([kijun_h4[key] for key in keys], dtype=np.float64)
+
+
+def lower_kijun_h4_array(ts, kijun_h4):
+    """get_nearest_lower_kijun_h4 (utils) per un intero array di timestamp
+    M15: Kijun della candela H4 aperta per ultima (01/05/09/13/17/21 dello
+    stesso giorno, prima delle 01:00 le 21:00 del giorno precedente); se la
+    chiave manca, la chiave piu' vicina (a parita' di distanza la precedente).
+    NaN se la Kijun e' vuota."""
+    ts = np.asarray(ts, dtype=np.int64)
+    key_ts, values = kijun_keys(kijun_h4)
+    if len(key_ts) == 0:
+        return np.full(len(ts), np.nan)
+    key = (ts - H4_OFFSET) // H4_SECONDS * H4_SECONDS + H4_OFFSET
+    pos = np.searchsorted(key_ts, key)
+    after = np.minimum(pos, len(key_ts) - 1)
+    before = np.maximum(pos - 1, 0)
+    exact = key_ts[after] == key
+    use_before = (pos > 0) & ((pos == len(key_ts)) | (key - key_ts[before] <= key_ts[after] - key))
+    return values[np.where(exact, after, np.where(use_before, before, after))]
+
+
+def lower_kijun_h4_series(history, kijun_h4):
+    """lower_kijun_h4_array allineato alle candele di una storia M15, come
+    lista di float (history[i] -> valori[i])."""
+    return lower_kijun_h4_array(history_arrays(history)[0], kijun_h4).tolist()
+
+
+# ---------------------------------------------------------------------------
+# Aggiornamento incrementale per il loop live.
+# Il valore della candela i dipende solo dalle `period` candele chiuse che la
+# precedono: la candela in formazione (l'ultima della storia) non entra mai
+# nella propria finestra, quindi puo' essere aggiornata liberamente e viene
+# consolidata nei deque monotoni solo quando arriva la candela successiva.
+# ---------------------------------------------------------------------------
+
+class KijunState:
+    """Stato incrementale della Kijun: append / update della candela in
+    formazione in O(1) ammortizzato, serializzabile su disco tra i cicli.
+    L'output di kijun_dict() coincide con calculate_kijun sulla stessa storia."""
+
+    def __init__(self, period=KIJUN_PERIOD, max_bars=5000):
+        self.period = period
+        self.max_bars = max_bars
+        self.count = 0          # candele chiuse consolidate
+        self.window = deque()   # (n, ts, high, low) delle ultime `period` chiuse
+        self._max = deque()     # (n, high) decrescenti
+        self._min = deque()     # (n, low) crescenti
+        self.pending = None     # (ts, high, low) dell'ultima candela ricevuta
+        self.ts = []            # timestamp delle candele con un valore
+        self.values = []
+
+    def _commit(self, ts, high, low):
+        n = self.count
+        self.window.append((n, ts, high, low))
+        while self._max and self._max[-1][1] <= high:
+            self._max.pop()
+        self._max.append((n, high))
+        while self._min and self._min[-1][1] >= low:
+            self._min.pop()
+        self._min.append((n, low))
+        self.count += 1
+        oldest = self.count - self.period
+        while self.window and self.window[0][0] < oldest:
+            self.window.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+
+    def push(self, ts, high, low):
+        """Aggiunge una candela o aggiorna quella in formazione (stesso ts).
+        Ritorna il valore Kijun della candela (None se non ancora disponibile)."""
+        if self.pending is not None:
+            if ts == self.pending[0]:
+                self.pending = (ts, high, low)
+                return self.values[-1] if self.ts and self.ts[-1] == ts else None
+            if ts < self.pending[0]:
+                raise ValueError('KijunState: candle older than the last one received')
+            self._commit(*self.pending)
+        self.pending = (ts, high, low)
+        if self.count < self.period:
+            return None
+        value = (self._max[0][1] + self._min[0][1]) / 2
+        self.ts.append(ts)
+        self.values.append(value)
+        if len(self.ts) > self.max_bars:
+            del self.ts[:len(self.ts) - self.max_bars]
+            del self.values[:len(self.values) - self.max_bars]
+        return value
+
+    def sync(self, ts, high, low):
+        """Allinea lo stato a una storia (array ts/high/low) consumando solo le
+        candele dalla penultima ricevuta in poi. Se la storia non si aggancia
+        allo stato (buco, dati diversi, finestra nel passato) lo ricostruisce."""
+        start = 0
+        if self.pending is not None:
+            start = int(np.searchsorted(ts, self.pending[0]))
+            hooked = start < len(ts) and ts[start] == self.pending[0]
+            if hooked and start > 0 and self.window:
+                _, last_ts, last_high, last_low = self.window[-1]
+                hooked = (ts[start - 1] == last_ts and high[start - 1] == last_high
+                          and low[start - 1] == last_low)
+            if not hooked:
+                self.__init__(self.period, self.max_bars)
+                start = 0
+        for i in range(start, len(ts)):
+            self.push(int(ts[i]), float(high[i]), float(low[i]))
+
+    def kijun_dict(self, start_ts=None, end_ts=None):
+        """_KijunDict dei valori con start_ts <= ts <= end_ts."""
+        ts = np.asarray(self.ts, dtype=np.int64)
+        line = np.asarray(self.values, dtype=np.float64)
+        lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts))
+        hi = len(ts) if end_ts is None else int(np.searchsorted(ts, end_ts, side='right'))
+        return build_kijun_dict(ts[lo:hi], line[lo:hi], 0)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        window = np.array([w[1:] for w in self.window], dtype=np.float64).reshape(-1, 3)
+        pending = np.array(self.pending if self.pending is not None else (), dtype=np.float64)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, period=self.period, count=self.count, window=window,
+                     pending=pending, ts=np.asarray(self.ts, dtype=np.int64),
+                     values=np.asarray(self.values, dtype=np.float64))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, period=KIJUN_PERIOD, max_bars=5000):
+        """Stato salvato su disco; uno stato vuoto se il file manca, e' illeggibile
+        o e' stato salvato con un periodo diverso."""
+        state = cls(period, max_bars)
+        try:
+            with np.load(path) as data:
+                if int(data['period']) != period:
+                    return state
+                state.count = int(data['count']) - len(data['window'])
+                for ts, high, low in data['window']:
+                    state._commit(int(ts), float(high), float(low))
+                if len(data['pending']):
+                    ts, high, low = data['pending']
+                    state.pending = (int(ts), float(high), float(low))
+                state.ts = data['ts'].tolist()
+                state.values = data['values'].tolist()
+        except (OSError, KeyError, ValueError):
+            return cls(period, max_bars)
+        return state
+
+
+def update_kijun_state(history, kijun_period, state_path):
+    """Kijun della storia calcolata in modo incrementale a partire dallo stato
+    salvato in state_path (aggiornato in uscita). Stesso risultato di
+    calculate_kijun(history, kijun_period): se lo stato non risale fino a
+    ts[kijun_period] (storia piu' lunga di quella da cui e' stato costruito,
+    valori tagliati da max_bars) la Kijun e' calcolata sull'intera storia."""
+    ts, high, low = history_arrays(history)
+    state = KijunState.load(state_path, kijun_period)
+    state.sync(ts, high, low)
+    state.save(state_path)
+    if len(ts) <= kijun_period:
+        return build_kijun_dict(ts[:0], np.empty(0), 0)
+    if not state.ts or state.ts[0] > ts[kijun_period]:
+        return build_kijun_dict(ts, midline(high, low, kijun_period), kijun_period)
+    return state.kijun_dict(int(ts[kijun_period]), int(ts[-1]))
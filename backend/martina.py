@@ -1,4 +1,5 @@
 import argparse
+import json
 import pandas as pd
 import common_samples
 import os
@@ -8,15 +9,25 @@ from datetime import datetime, timedelta, time
 from db_utils import (
     check_in_retest_trade, check_in_progress_trade, get_stop_loss, 
     check_in_closed_trade, remove_closed_trades, update_trade_in_progress, 
-    upsert_order_waiting_retest, close_trade_in_retest, get_closed_trades_after_date, 
-    initialize_signals_db, SIMULATION_MODE,
+    upsert_order_waiting_retest, close_trade_in_retest, get_closed_trades_after_date, save_breakout_state,
+    initialize_signals_db, SIMULATION_MODE, CACHE_DIR,
     # Activity Log functions
     initialize_activity_logs_db, add_activity_log, log_bot_start, log_bot_stop,
     log_pair_scan, log_zone_detected, log_pattern_detected, log_trade_signal,
     log_trade_opened, log_trade_closed, log_retest_waiting, log_rr_rejected,
-    log_api_connection, log_heartbeat, log_trader
+    log_api_connection, log_heartbeat, log_trader,
+    initialize_pattern_trackers_db, initialize_breakout_states_db, initialize_trade_managers_db
 )
 from utils import *
+from kijun import update_kijun_state
+from candle_cache import CandleCache
+from zone_cache import ZoneCache, history_key, kijun_hash
+from schema import to_epoch
+from pattern_tracker import track_pattern_m15
+from breakout import (
+    BreakoutMachine, run_breakout, BREAK, BREAK_NO_RR, UPDATE, UPDATE_NO_RR, RETEST, TARGET,
+    WAITING_RETEST, IN_PROGRESS, CLOSED
+)
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Process command parameters.') 
@@ -27,10 +38,481 @@ def parse_args():
     # Flag to indicate script is called from bot_runner (skip redundant logs)
     parser.add_argument('--from-runner', action='store_true',
                         help='Called from bot_runner.py - skip startup logs')
+    parser.add_argument('--reuse-zones', action='store_true',
+                        help='Reuse the D1/H4 zones saved by the previous run until a new D1/H4 bar closes')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Download the full history from FXCM (skip the on-disk candle cache)')
     args = parser.parse_args()
     return args
 
 
+def fetch_histories(history_source, str_instrument, date_from=None, date_to=None, quotes_count=0):
+    """Storico D1, H4 e m15 gia' formattato. history_source e' qualunque oggetto
+    con get_history(instrument, timeframe, date_from, date_to, quotes_count):
+    ForexConnect, CandleCache o la sessione condivisa del bot_runner."""
+    history_DLY = history_source.get_history(str_instrument, 'D1', date_from, date_to, quotes_count)
+    history_DLY = format_history(history_DLY,'DLY')
+    history_H4 = history_source.get_history(str_instrument, 'H4', date_from, date_to, quotes_count)
+    history_H4 = format_history(history_H4,'H4')
+    history_m15 = history_source.get_history(str_instrument, 'm15', date_from, date_to, quotes_count)
+    history_m15 = format_history(history_m15,'m15')
+    return history_DLY, history_H4, history_m15
+
+
+def find_zones_DLY(str_instrument, history_DLY, kijun_h4, index, str_session='Trade'):
+    """Zone D1 sulla candela index e prima zona valida (validate_support /
+    validate_resistence). Ritorna un dict con le liste di get_zones ('DLY'),
+    la zona scelta, l'esito della validazione e la data della candela D1."""
+    zones = {'DLY': None, 'dly_zone': None, 'DLY_valid_zone': False, 'DLY_candle_date': None}
+
+    zones_rectX1_DLY, zones_rectX2_DLY, zones_rectY1_DLY, zones_rectY2_DLY, final_zones_DLY, zone_type_DLY = get_zones(history_DLY, kijun_h4, index, 'DLY', str_session, None, str_instrument)
+    zones['DLY'] = (zones_rectX1_DLY, zones_rectX2_DLY, zones_rectY1_DLY, zones_rectY2_DLY, final_zones_DLY, zone_type_DLY)
+    log_trader('final_zones_DLY: %s', final_zones_DLY, pair=str_instrument)
+    if len(final_zones_DLY) == 0:
+        return zones
+    log_trader('zone_type_DLY: %s', zone_type_DLY, pair=str_instrument)
+
+    for zone in final_zones_DLY:
+        log_trader('zones_rectX1_DLY[%s]: %s', zone, zones_rectX1_DLY[zone], pair=str_instrument)
+    DLY_valid_zone = False
+    for zone in reversed(final_zones_DLY):
+        if zone_type_DLY == 'SUP':
+            DLY_candle, DLY_zone_valid_for_kijun, DLY_valid_zone, anchor = validate_support(zones_rectX1_DLY[zone], zones_rectX2_DLY[zone], zones_rectY1_DLY[zone], zones_rectY2_DLY[zone], history_DLY, 'DLY', kijun_h4, str_instrument, 'Trade')
+        elif zone_type_DLY == 'RES':
+            DLY_candle, DLY_zone_valid_for_kijun, DLY_valid_zone, anchor = validate_resistence(zones_rectX1_DLY[zone], zones_rectX2_DLY[zone], zones_rectY1_DLY[zone], zones_rectY2_DLY[zone], history_DLY, 'DLY', kijun_h4, str_instrument, 'Trade')
+
+        dly_zone = zone
+        log_trader('DLY zone X1: %s, Y1: %s, Y2: %s', zones_rectX1_DLY[dly_zone], zones_rectY1_DLY[dly_zone], zones_rectY2_DLY[dly_zone], pair=str_instrument)
+        log_trader('DLY_valid_zone: %s', DLY_valid_zone, pair=str_instrument)
+        if DLY_valid_zone:
+            break
+    zones['dly_zone'] = dly_zone
+    zones['DLY_valid_zone'] = DLY_valid_zone
+    if DLY_valid_zone:
+        zones['DLY_candle_date'] = DLY_candle["Date"]
+    return zones
+
+
+def find_zones_H4(str_instrument, history_H4, kijun_h4, zones_DLY, str_session='Trade', date_to=None):
+    """Zone H4 dentro la zona D1 valida di zones_DLY (risultato di find_zones_DLY)
+    e prima zona H4 valida. Ritorna un dict con le liste di get_zones ('H4'),
+    la zona scelta, l'esito della validazione e l'anchor M15."""
+    zones = {'H4': None, 'h4_zone': -1, 'H4_valid_zone': False, 'anchor_15_min': None}
+    zones_rectX1_DLY, zones_rectX2_DLY, zones_rectY1_DLY, zones_rectY2_DLY, final_zones_DLY, zone_type_DLY = zones_DLY['DLY']
+    dly_zone = zones_DLY['dly_zone']
+
+    #search in H4 timeframe
+    print('dly candle: '+str(zones_DLY['DLY_candle_date']))
+    index_of_last_candle = get_index_of_last_h4_candle_on_daily_date(history_H4, zones_DLY['DLY_candle_date'], str_session, date_to)
+    print('index of last candle: '+str(index_of_last_candle))
+    zones_rectX1_H4, zones_rectX2_H4, zones_rectY1_H4, zones_rectY2_H4, final_zones_H4, zone_type_H4 = get_zones(history_H4, kijun_h4,len(history_H4)-1 , 'H4', str_session, zones_rectX1_DLY[dly_zone], str_instrument)
+    zones['H4'] = (zones_rectX1_H4, zones_rectX2_H4, zones_rectY1_H4, zones_rectY2_H4, final_zones_H4, zone_type_H4)
+    h4_zone = -1
+    H4_valid_zone = False
+    anchor_15_min = None
+    if zone_type_H4 == 'SUP':
+        for zone in reversed(final_zones_H4):
+            if (zones_rectY1_H4[zone] <= zones_rectY2_DLY[dly_zone] and
+            history_H4[-2]['BidClose'] >= zones_rectY1_H4[zone]):
+                h4_zone = zone
+                H4_candle, H4_zone_valid_for_kijun, H4_valid_zone, anchor_15_min = validate_support(zones_rectX1_H4[h4_zone], zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], history_H4, 'H4', kijun_h4, str_instrument, 'Trade')
+                if H4_valid_zone:
+                    break
+        if len(zones_rectX1_H4) != 0:
+            log_trader('H4 zone X1: %s, Y1: %s, Y2: %s', zones_rectX1_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], pair=str_instrument)
+        log_trader('H4_valid_zone: %s', H4_valid_zone, pair=str_instrument)
+
+    elif zone_type_H4 == 'RES':
+        for zone in reversed(final_zones_H4):
+            if (zones_rectY1_H4[zone] >= zones_rectY2_DLY[dly_zone] and
+            history_H4[-2]['BidClose'] <= zones_rectY1_H4[zone]):
+                h4_zone = zone
+                H4_candle, H4_zone_valid_for_kijun, H4_valid_zone, anchor_15_min = validate_resistence (zones_rectX1_H4[h4_zone], zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], history_H4, 'H4', kijun_h4, str_instrument, str_session)
+                if H4_valid_zone:
+                    break
+        if len(zones_rectX1_H4) != 0:
+            log_trader('H4 zone X1: %s, Y1: %s, Y2: %s', zones_rectX1_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], pair=str_instrument)
+
+    zones['h4_zone'] = h4_zone
+    zones['H4_valid_zone'] = H4_valid_zone
+    zones['anchor_15_min'] = anchor_15_min
+    return zones
+
+
+def find_zones(str_instrument, history_DLY, history_H4, kijun_h4, index, str_session='Trade', date_to=None):
+    """Zone D1 sulla candela index e, se una e' valida, zone H4 al suo interno:
+    dict con i campi di find_zones_DLY e find_zones_H4.
+    Solo calcolo e log di debug: log per la UI e pattern restano in analyze_pair."""
+    zones = find_zones_DLY(str_instrument, history_DLY, kijun_h4, index, str_session)
+    zones.update({'H4': None, 'h4_zone': -1, 'H4_valid_zone': False, 'anchor_15_min': None})
+    if zones['DLY_valid_zone']:
+        zones.update(find_zones_H4(str_instrument, history_H4, kijun_h4, zones, str_session, date_to))
+    return zones
+
+
+zone_cache = ZoneCache()
+
+
+def find_zones_cached(str_instrument, history_DLY, history_H4, kijun_h4, index, str_session='Trade', date_to=None, reuse_zones=False):
+    """find_zones con memo persistente (zone_cache.py) per timeframe: le zone D1
+    si ricalcolano solo se cambiano le candele D1 chiuse o la Kijun, le zone H4
+    solo se cambiano anche le candele H4 chiuse o la zona D1. Con reuse_zones
+    le candele D1/H4 in formazione restano quelle viste al momento del calcolo."""
+    if not reuse_zones:
+        return find_zones(str_instrument, history_DLY, history_H4, kijun_h4, index, str_session, date_to)
+
+    khash = kijun_hash(kijun_h4)
+    key_DLY = [index, str_session, history_key(history_DLY), khash]
+    zones = zone_cache.get(str_instrument, 'D1', key_DLY)
+    if zones is None:
+        zones = find_zones_DLY(str_instrument, history_DLY, kijun_h4, index, str_session)
+        zone_cache.put(str_instrument, 'D1', key_DLY, zones)
+    else:
+        log_trader('D1 zones unchanged since last cycle - reused', pair=str_instrument)
+
+    zones_H4 = {'H4': None, 'h4_zone': -1, 'H4_valid_zone': False, 'anchor_15_min': None}
+    if zones['DLY_valid_zone']:
+        key_H4 = [key_DLY, zones['dly_zone'], history_key(history_H4)]
+        zones_H4 = zone_cache.get(str_instrument, 'H4', key_H4)
+        if zones_H4 is None:
+            zones_H4 = find_zones_H4(str_instrument, history_H4, kijun_h4, zones, str_session, date_to)
+            zone_cache.put(str_instrument, 'H4', key_H4, zones_H4)
+        else:
+            log_trader('H4 zones unchanged since last cycle - reused', pair=str_instrument)
+    return dict(zones, **zones_H4)
+
+
+def follow_breakout(str_instrument, direction, history_m15, kijun_h4, kijun_m15, pattern, fibonacci100, zone_fields, watchlist, reuse_zones=False):
+    """Rottura e retest del pattern M15 (breakout.BreakoutMachine) dalla candela
+    pattern_rectX2, per LONG e SHORT: esegue ordini, DB e log degli eventi della
+    macchina e aggiunge alla watchlist lo stato finale.
+    pattern: (rectX1, rectX2, rectY1, rectY2); fibonacci100: lastlow / lasthigh;
+    zone_fields: campi zones_* del segnale. Con reuse_zones lo stato e' ripreso
+    dal ciclo precedente e si consumano solo le candele M15 nuove."""
+    pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2 = pattern
+    machine = BreakoutMachine(direction, str_instrument, pattern_rectY1, fibonacci100)
+    key = None
+    if reuse_zones:
+        key = json.dumps([direction, str(pattern_rectX1), pattern_rectY1, pattern_rectY2, fibonacci100])
+    events, machine, state = run_breakout(machine, history_m15, kijun_h4, kijun_m15, pattern_rectX2, key)
+    d = machine.direction
+
+    def signal(setup):
+        return dict({'pair': str_instrument,
+                     'entry_price': setup['entry_price'],
+                     'stop_loss_price': setup['stop_loss_price'],
+                     'target_price': setup['target_price'],
+                     'direction': direction,
+                     'type': 'FULL',
+                     'risk_reward': setup['risk_reward']},
+                    **zone_fields,
+                    pattern_x1=str(pattern_rectX1),
+                    pattern_y1=pattern_rectY1,
+                    pattern_y2=pattern_rectY2,
+                    breakup_date=setup['breakup_date'],
+                    fibonacci100=fibonacci100)
+
+    # I segnali consecutivi (rottura e nuovi estremi senza altri eventi in
+    # mezzo) sono coalescenti: al broker e al DB va solo l'ultimo, una volta
+    # per ciclo, prima dell'evento successivo (retest, chiusura) o alla fine.
+    # Lo stato finale dei trade e' lo stesso di un upsert per ogni segnale.
+    trade_setup = []
+    pending = []
+
+    def send_signal():
+        if not pending:
+            return
+        setup = pending[-1].setup
+        trade_setup.append(signal(setup))
+        target_1_1 = d.target_price(setup['entry_price'], setup['stop_loss_price'], 1)
+        upsert_order_waiting_retest(trade_setup[-1], target_1_1)
+        # Log trade signal
+        log_trade_signal(str_instrument, direction,
+                         trade_setup[-1]['entry_price'],
+                         trade_setup[-1]['stop_loss_price'],
+                         trade_setup[-1]['target_price'],
+                         trade_setup[-1]['risk_reward'])
+        log_retest_waiting(str_instrument, trade_setup[-1]['entry_price'])
+        if pending[0].name == BREAK:
+            add_activity_log('SUCCESS', f'{str_instrument}: {direction} signal created - Entry: {round(setup["entry_price"], 5)}, SL: {round(setup["stop_loss_price"], 5)}, R:R: {round(setup["risk_reward"], 2)}', pair=str_instrument)
+        else:
+            add_activity_log('SUCCESS', f'{str_instrument}: {direction} signal updated - Entry: {round(setup["entry_price"], 5)}, R:R: {round(setup["risk_reward"], 2)}', pair=str_instrument)
+        del pending[:]
+
+    for event in events:
+        if event.name in (BREAK, BREAK_NO_RR):
+            log_trader('Fib 78.6: %s, %s: %s, %s: %s', event.fib_78_6, d.anchor_name, fibonacci100, d.extreme_name, event.extreme, pair=str_instrument)
+
+        if event.name in (BREAK, UPDATE):
+            pending.append(event)
+            continue
+        send_signal()
+
+        if event.name in (BREAK_NO_RR, UPDATE_NO_RR):
+            print('NO R:R')
+            log_rr_rejected(str_instrument, 0, 2.0)
+            mt5_close_order(str_instrument) #if there was a previous order placed in retest.
+            close_trade_in_retest(str_instrument)
+
+        elif event.name == RETEST:
+            if not trade_setup:
+                # segnale creato in un ciclo precedente
+                trade_setup.append(signal(event.setup))
+            log_trader('Fibonacci level broken at: %s', history_m15[event.index]["Date"], pair=str_instrument)
+            log_trader('Signal: %s', trade_setup[-1], pair=str_instrument)
+            update_trade_in_progress(trade_setup[-1]['pair'], event.index, history_m15[event.index]['Date'])
+
+        elif event.name == TARGET:
+            print('trade chiuso per aver raggiunto il target senza retest')
+            close_trade_in_retest(str_instrument)
+    send_signal()
+    # stato delle candele confermate salvato solo dopo ordini e DB dei loro
+    # eventi: se il processo si interrompe prima, il ciclo successivo li rigioca
+    if state is not None:
+        save_breakout_state(str_instrument, key, state)
+
+    if machine.status == WAITING_RETEST:
+        watchlist.append(':ballot_box_with_check: In attesa di retest pattern: '+str_instrument)
+    elif machine.status == IN_PROGRESS:
+        watchlist.append(':ballot_box_with_check: A mercato: '+str_instrument)
+    elif machine.status == CLOSED and machine.close_reason == 'rr':
+        watchlist.append(':ballot_box_with_check: pattern senza R:R valido: '+str_instrument)
+    elif machine.status == CLOSED:
+        watchlist.append(':ballot_box_with_check: trade chiuso per aver raggiunto il target senza retest: '+str_instrument)
+    else:
+        # Log if pattern was not broken
+        add_activity_log('INFO', f'{str_instrument}: M15 pattern not yet broken - waiting for breakout', pair=str_instrument)
+    return machine
+
+
+def analyze_pair(str_instrument, history_DLY, history_H4, history_m15, str_session='Trade', date_to=None, reuse_zones=False):
+    """Strategia su una coppia a partire dagli storici gia' scaricati: trade in
+    retest / in corso, zone D1 e H4, pattern M15 e rottura del pattern
+    (follow_breakout).
+    reuse_zones: riusa le zone D1/H4 salvate se nel frattempo non si e' chiusa
+    una nuova candela D1 o H4 (vedi find_zones_cached), cerca il pattern M15 e
+    ne segue la rottura con lo stato salvato del ciclo precedente
+    (track_pattern_m15, follow_breakout)."""
+    watchlist = []
+    if str_session == 'Trade' or str_session == 'BT' or str_session == 'BTLOG':
+        kijun_period = 26
+        
+        lastclosearray = []
+        zones_rectX1 = []
+        zones_rectX2 = []
+        zones_rectY1 = []
+        zones_rectY2 = []
+        final_zones =  []
+        enddate = None
+        DLY_valid_zone = False
+
+        
+        # Kijun incrementale: lo stato salvato al ciclo precedente viene
+        # aggiornato solo con le candele H4 nuove (stesso risultato di calculate_kijun)
+        kijun_state_path = os.path.join(CACHE_DIR, 'kijun', f"{str_instrument.replace('/', '')}_H4_{kijun_period}.npz")
+        kijun_h4 = update_kijun_state(history_H4, kijun_period, kijun_state_path)
+        # Kijun H4 di riferimento di ogni candela M15 (get_nearest_lower_kijun_h4)
+        kijun_m15 = lower_kijun_h4_series(history_m15, kijun_h4)
+        continue_logic = True
+        start_session = len(history_DLY)-1 
+        
+        trade_in_retest = check_in_retest_trade(str_instrument)
+
+        log_trader('Trade in retest: %s', trade_in_retest, pair=str_instrument)
+        
+        if trade_in_retest is not None:
+            continue_logic = process_trade_in_retest(trade_in_retest, history_m15, kijun_h4, history_H4)
+
+        trade_in_progress = None
+        if continue_logic:
+            trade_in_progress = check_in_progress_trade(str_instrument)
+        
+        log_trader('Trade in progress: %s', trade_in_progress, pair=str_instrument)
+
+        if trade_in_progress is not None:
+            # per nome e non per posizione: trades ha anche le colonne generate (schema.py)
+            trade_in_progress = {key.lower(): trade_in_progress[key] for key in trade_in_progress.keys()}
+            print('trade_in_progress: '+str(trade_in_progress))
+            if trade_in_progress['direction'] == 'LONG':
+                initial_stop_loss = get_stop_loss(str_instrument, trade_in_progress['entry_date'])
+                print('initial_stop_loss: '+str(initial_stop_loss))
+                continue_logic, enddate = process_trades_LONG(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'],  initial_stop_loss, trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'], reuse_zones)
+                print('continue_logic: '+str(continue_logic))
+            
+            elif trade_in_progress['direction'] == 'SHORT':
+                initial_stop_loss = get_stop_loss(str_instrument, trade_in_progress['entry_date'])
+                print('initial_stop_loss: '+str(initial_stop_loss))
+                continue_logic, enddate = process_trades_SHORT(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], initial_stop_loss, trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'], reuse_zones)
+                print('continue_logic: '+str(continue_logic))
+         
+        #continue_logic = False #to break the flow
+        print('continue_logic: '+str(continue_logic))
+        if continue_logic:
+            # Track if any valid zones were found during analysis
+            found_valid_d1_zone = False
+            found_valid_h4_zone = False
+            found_valid_pattern = False
+            
+            for index in range(start_session, len(history_DLY)):
+
+                zones = find_zones_cached(str_instrument, history_DLY, history_H4, kijun_h4, index, str_session, date_to, reuse_zones)
+                zones_rectX1_DLY, zones_rectX2_DLY, zones_rectY1_DLY, zones_rectY2_DLY, final_zones_DLY, zone_type_DLY = zones['DLY']
+                if len(final_zones_DLY) == 0:
+                    continue
+                dly_zone = zones['dly_zone']
+                DLY_valid_zone = zones['DLY_valid_zone']
+                
+                if DLY_valid_zone:
+                    found_valid_d1_zone = True
+                    log_zone_detected(str_instrument, f'D1 {zone_type_DLY}', zones_rectY1_DLY[dly_zone])
+                    add_activity_log('INFO', f'{str_instrument}: Valid D1 {zone_type_DLY} zone - checking H4...', pair=str_instrument)
+                    watchlist.append(':ballot_box_with_check: In attesa della zona H4 su: '+str_instrument)
+                    zones_rectX1_H4, zones_rectX2_H4, zones_rectY1_H4, zones_rectY2_H4, final_zones_H4, zone_type_H4 = zones['H4']
+                    h4_zone = zones['h4_zone']
+                    H4_valid_zone = zones['H4_valid_zone']
+                    anchor_15_min = zones['anchor_15_min']
+                    if zone_type_H4 == 'SUP':
+                        if H4_valid_zone:
+                            found_valid_h4_zone = True
+                            log_zone_detected(str_instrument, f'H4 {zone_type_H4}', zones_rectY1_H4[h4_zone])
+                            add_activity_log('INFO', f'{str_instrument}: Valid H4 {zone_type_H4} zone - searching M15 pattern...', pair=str_instrument)
+                            watchlist.append(':ballot_box_with_check: In attesa di un pattern: '+str_instrument)
+                            
+                            log_trader('Searching M15 pattern', pair=str_instrument)
+                            if reuse_zones:
+                                # stato salvato nel DB: solo le candele M15 nuove (pattern_tracker.py)
+                                pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lastlow = track_pattern_m15(str_instrument, history_m15, kijun_h4, anchor_15_min, 'SUP')
+                            else:
+                                pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lastlow = get_pattern_m15_SUP(history_m15, kijun_h4, anchor_15_min, zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone],str_instrument,str_session)
+
+                            if(pattern_rectX1 is not None):
+                                found_valid_pattern = True
+                                add_activity_log('INFO', f'{str_instrument}: M15 pattern found - analyzing entry...', pair=str_instrument)
+                                
+                                #check if the same pattern was closed 
+                                trade_closed = check_in_closed_trade(str_instrument, pattern_rectX1)
+                                if trade_closed:
+                                    print('pattern already evaluated')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern already evaluated - skipping', pair=str_instrument)
+                                    break
+
+                                if enddate is not None and to_epoch(pattern_rectX1) < to_epoch(enddate):
+                                    print('the pattern preceding a just-closed trade')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a just-closed trade - skipping', pair=str_instrument)
+                                    break
+                                
+                                result = get_closed_trades_after_date(str_instrument, pattern_rectX1)
+                                if result:
+                                    print('the pattern preceding a closed trade')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a closed trade - skipping', pair=str_instrument)
+                                    break
+
+
+                                watchlist.append(':ballot_box_with_check: In attesa rottura pattern: '+str_instrument)
+
+                                log_trader('Pattern: X1=%s, X2=%s, Y1=%s, Y2=%s', pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, pair=str_instrument)
+
+                                #start of the analysis to open a position (breakout.py)
+                                zone_fields = {'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
+                                               'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
+                                               'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
+                                               'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
+                                               'zones_rectY1_H4': zones_rectY1_H4[h4_zone],
+                                               'zones_rectY2_H4': zones_rectY2_H4[h4_zone]}
+                                follow_breakout(str_instrument, 'LONG', history_m15, kijun_h4, kijun_m15,
+                                                (pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2), lastlow,
+                                                zone_fields, watchlist, reuse_zones)
+                                
+                    elif zone_type_H4 == 'RES':
+                        if H4_valid_zone:
+                            found_valid_h4_zone = True
+                            log_zone_detected(str_instrument, f'H4 {zone_type_H4}', zones_rectY1_H4[h4_zone])
+                            add_activity_log('INFO', f'{str_instrument}: Valid H4 {zone_type_H4} zone - searching M15 pattern...', pair=str_instrument)
+                            watchlist.append(':ballot_box_with_check: In attesa di un pattern: '+str_instrument)
+
+                            log_trader('Searching M15 pattern', pair=str_instrument)
+                            if reuse_zones:
+                                # stato salvato nel DB: solo le candele M15 nuove (pattern_tracker.py)
+                                pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lasthigh = track_pattern_m15(str_instrument, history_m15, kijun_h4, anchor_15_min, 'RES')
+                            else:
+                                pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lasthigh = get_pattern_m15_RES(history_m15, kijun_h4, anchor_15_min, zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone],str_instrument,str_session)
+                            
+                            if(pattern_rectX1 is not None):
+                                found_valid_pattern = True
+                                add_activity_log('INFO', f'{str_instrument}: M15 pattern found - analyzing entry...', pair=str_instrument)
+
+                                #check if the same pattern was closed 
+                                trade_closed = check_in_closed_trade(str_instrument, pattern_rectX1)
+                                if trade_closed:
+                                    print('pattern already evaluated')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern already evaluated - skipping', pair=str_instrument)
+                                    break
+
+                                if enddate is not None and to_epoch(pattern_rectX1) < to_epoch(enddate):
+                                    print('the pattern preceding a just-closed trade')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a just-closed trade - skipping', pair=str_instrument)
+                                    break
+
+                                result = get_closed_trades_after_date(str_instrument, pattern_rectX1)
+                                if result:
+                                    print('the pattern preceding a closed trade')
+                                    add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a closed trade - skipping', pair=str_instrument)
+                                    break
+                                   
+                                watchlist.append(':ballot_box_with_check: In attesa rottura pattern: '+str_instrument)
+
+                                log_trader('Pattern: X1=%s, X2=%s, Y1=%s, Y2=%s', pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, pair=str_instrument)
+
+                                #start of the analysis to open a position (breakout.py)
+                                zone_fields = {'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
+                                               'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
+                                               'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
+                                               'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
+                                               'zones_rectY1_H4': zones_rectY1_H4[h4_zone],
+                                               'zones_rectY2_H4': zones_rectY2_H4[h4_zone]}
+                                follow_breakout(str_instrument, 'SHORT', history_m15, kijun_h4, kijun_m15,
+                                                (pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2), lasthigh,
+                                                zone_fields, watchlist, reuse_zones)
+            
+            # Log summary if no valid zones/patterns found
+            if not found_valid_d1_zone:
+                add_activity_log('INFO', f'{str_instrument}: No valid D1 zones found', pair=str_instrument)
+            elif not found_valid_h4_zone:
+                add_activity_log('INFO', f'{str_instrument}: D1 zone found, but no valid H4 confirmation', pair=str_instrument)
+            elif not found_valid_pattern:
+                add_activity_log('INFO', f'{str_instrument}: D1+H4 zones found, but no M15 pattern', pair=str_instrument)
+                                
+            ######## process trade in progress ########
+            trade_in_progress = check_in_progress_trade(str_instrument)
+            if trade_in_progress is not None:
+                #remove the same trades in close state
+                remove_closed_trades(str_instrument, trade_in_progress['entry_date'], trade_in_progress['pattern_x1'],trade_in_progress['pattern_y1'],trade_in_progress['pattern_y2'])
+                print('trade_in_progress:')
+                if trade_in_progress['direction'] == 'SHORT':
+                    #print('trade_in_progress: '+str(trade_in_progress['stop_loss'])+' - '+str(trade_in_progress['entry_price_index']))
+                    continue_logic, enddate = process_trades_SHORT(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], trade_in_progress['stop_loss'], trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'], reuse_zones)
+                if trade_in_progress['direction'] == 'LONG':
+                    continue_logic, enddate = process_trades_LONG(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], trade_in_progress['stop_loss'], trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'], reuse_zones)                                 
+                    
+                        
+            if len(watchlist) != 0:
+                send_slack_message(os.getenv('SLACK_CHANNEL', 'mt-bot'), watchlist[-1])
+
+
+def run_pair(history_source, str_instrument, str_session='Trade', date_from=None, date_to=None, quotes_count=0, reuse_zones=False):
+    """Ciclo completo su una coppia con una sessione FXCM gia' aperta
+    (usato da main() e, in-process, da bot_runner)."""
+    print("")
+    print("Requesting a price history...")
+    history_DLY, history_H4, history_m15 = fetch_histories(history_source, str_instrument, date_from, date_to, quotes_count)
+    print("history retrieved.")
+
+    analyze_pair(str_instrument, history_DLY, history_H4, history_m15, str_session, date_to, reuse_zones)
+
+    #close mt5 orders already processed
+    clean_trades()
+
+
 def main():
     args = parse_args()
     str_user_id = args.l
@@ -45,10 +527,12 @@ def main():
     date_from = args.datefrom
     date_to = args.dateto
     str_session = args.session
-    watchlist = []
     
     # Inizializza il database dei segnali MT5 e Activity Logs
     initialize_activity_logs_db()
+    initialize_pattern_trackers_db()
+    initialize_breakout_states_db()
+    initialize_trade_managers_db()
     
     # Only log startup messages if NOT called from bot_runner
     from_runner = getattr(args, 'from_runner', False)
@@ -77,501 +561,10 @@ def main():
             # Only log connection if NOT called from bot_runner
             if not from_runner:
                 log_api_connection('connected', 'FXCM')
-            print("")
-            print("Requesting a price history...")
-
-            history_DLY = fx.get_history(str_instrument, 'D1', date_from, date_to, quotes_count)
-            history_DLY = format_history(history_DLY,'DLY')
-            history_H4 = fx.get_history(str_instrument, 'H4', date_from, date_to, quotes_count)
-            history_H4 = format_history(history_H4,'H4')
-            history_m15 = fx.get_history(str_instrument, 'm15', date_from, date_to, quotes_count)
-            history_m15 = format_history(history_m15,'m15')
-            
-            print("history retrieved.")
-
-            if str_session == 'Trade' or str_session == 'BT' or str_session == 'BTLOG':
-                kijun_period = 26
-                
-                lastclosearray = []
-                zones_rectX1 = []
-                zones_rectX2 = []
-                zones_rectY1 = []
-                zones_rectY2 = []
-                final_zones =  []
-                zone = 0
-                enddate = None
-                DLY_valid_zone = False
-                trade_keys = ['pair', 'status', 'trade_type', 'entry_date', 'close_date', 'entry_price', 'entry_price_index', 'stop_loss', 'target', 'direction', 'initial_risk_reward', 'final_risk_reward', 'profit', 'result', 'zones_rectx1_dly', 'zones_recty1_dly', 'zones_recty2_dly', 'zones_rectx1_h4', 'zones_recty1_h4', 'zones_recty2_h4', 'patter_x1', 'patter_y1', 'patter_y2']
-
-                
-                kijun_h4 = calculate_kijun(history_H4, kijun_period)
-                continue_logic = True
-                start_session = len(history_DLY)-1 
-                
-                trade_in_retest = check_in_retest_trade(str_instrument)
-
-                log_trader(f'Trade in retest: {trade_in_retest}', pair=str_instrument)
-                
-                if trade_in_retest is not None:
-                    continue_logic = process_trade_in_retest(trade_in_retest, history_m15, kijun_h4, history_H4)
-
-                trade_in_progress = None
-                if continue_logic:
-                    trade_in_progress = check_in_progress_trade(str_instrument)
-                
-                log_trader(f'Trade in progress: {trade_in_progress}', pair=str_instrument)
-
-                if trade_in_progress is not None:
-                    trade_in_progress = dict(zip(trade_keys, trade_in_progress))
-                    print('trade_in_progress: '+str(trade_in_progress))
-                    if trade_in_progress['direction'] == 'LONG':
-                        initial_stop_loss = get_stop_loss(str_instrument, trade_in_progress['entry_date'])
-                        print('initial_stop_loss: '+str(initial_stop_loss))
-                        continue_logic, enddate = process_trades_LONG(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'],  initial_stop_loss, trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'])
-                        print('continue_logic: '+str(continue_logic))
-                    
-                    elif trade_in_progress['direction'] == 'SHORT':
-                        initial_stop_loss = get_stop_loss(str_instrument, trade_in_progress['entry_date'])
-                        print('initial_stop_loss: '+str(initial_stop_loss))
-                        continue_logic, enddate = process_trades_SHORT(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], initial_stop_loss, trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'])
-                        print('continue_logic: '+str(continue_logic))
-                 
-                #continue_logic = False #to break the flow
-                print('continue_logic: '+str(continue_logic))
-                if continue_logic:
-                    # Track if any valid zones were found during analysis
-                    found_valid_d1_zone = False
-                    found_valid_h4_zone = False
-                    found_valid_pattern = False
-                    
-                    for index in range(start_session, len(history_DLY)):
-        
-                        zones_rectX1_DLY, zones_rectX2_DLY, zones_rectY1_DLY, zones_rectY2_DLY, final_zones_DLY, zone_type_DLY = get_zones(history_DLY, kijun_h4, index, 'DLY', str_session, None, str_instrument)
-                        log_trader(f'final_zones_DLY: {final_zones_DLY}', pair=str_instrument)
-                        if len(final_zones_DLY) != 0:
-                            log_trader(f'zone_type_DLY: {zone_type_DLY}', pair=str_instrument)
-                            
-                        if len(final_zones_DLY) == 0:
-                            continue
-                        for zone in final_zones_DLY:
-                            log_trader(f'zones_rectX1_DLY[{zone}]: {zones_rectX1_DLY[zone]}', pair=str_instrument)
-                        for zone in reversed(final_zones_DLY):
-                            if zone_type_DLY == 'SUP':
-                                DLY_candle, DLY_zone_valid_for_kijun, DLY_valid_zone, anchor = validate_support(zones_rectX1_DLY[zone], zones_rectX2_DLY[zone], zones_rectY1_DLY[zone], zones_rectY2_DLY[zone], history_DLY, 'DLY', kijun_h4, str_instrument, 'Trade')
-                            elif zone_type_DLY == 'RES':
-                                DLY_candle, DLY_zone_valid_for_kijun, DLY_valid_zone, anchor = validate_resistence(zones_rectX1_DLY[zone], zones_rectX2_DLY[zone], zones_rectY1_DLY[zone], zones_rectY2_DLY[zone], history_DLY, 'DLY', kijun_h4, str_instrument, 'Trade')
-                            
-                            dly_zone = zone
-                            log_trader(f'DLY zone X1: {zones_rectX1_DLY[dly_zone]}, Y1: {zones_rectY1_DLY[dly_zone]}, Y2: {zones_rectY2_DLY[dly_zone]}', pair=str_instrument)
-                            log_trader(f'DLY_valid_zone: {DLY_valid_zone}', pair=str_instrument)
-                            if DLY_valid_zone:
-                                found_valid_d1_zone = True
-                                break
 
-                        
-                        if DLY_valid_zone:
-                            log_zone_detected(str_instrument, f'D1 {zone_type_DLY}', zones_rectY1_DLY[dly_zone])
-                            add_activity_log('INFO', f'{str_instrument}: Valid D1 {zone_type_DLY} zone - checking H4...', pair=str_instrument)
-                            watchlist.append(':ballot_box_with_check: In attesa della zona H4 su: '+str_instrument)
-                            #search in H4 timeframe
-                            print('dly candle: '+str(DLY_candle["Date"]))
-                            index_of_last_candle = get_index_of_last_h4_candle_on_daily_date(history_H4, DLY_candle["Date"], str_session, date_to)
-                            print('index of last candle: '+str(index_of_last_candle))
-                            #input()
-                            zones_rectX1_H4, zones_rectX2_H4, zones_rectY1_H4, zones_rectY2_H4, final_zones_H4, zone_type_H4 = get_zones(history_H4, kijun_h4,len(history_H4)-1 , 'H4', str_session, zones_rectX1_DLY[dly_zone], str_instrument)
-                            h4_zone = -1                        
-                            H4_valid_zone = False
-                            if zone_type_H4 == 'SUP':
-                                for zone in reversed(final_zones_H4):
-                                    if (zones_rectY1_H4[zone] <= zones_rectY2_DLY[dly_zone] and
-                                    history_H4[-2]['BidClose'] >= zones_rectY1_H4[zone]):
-                                        h4_zone = zone
-                                        H4_candle, H4_zone_valid_for_kijun, H4_valid_zone, anchor_15_min = validate_support(zones_rectX1_H4[h4_zone], zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], history_H4, 'H4', kijun_h4, str_instrument, 'Trade')
-                                        if H4_valid_zone:
-                                            break
-                                if len(zones_rectX1_H4) != 0:
-                                    log_trader(f'H4 zone X1: {zones_rectX1_H4[h4_zone]}, Y1: {zones_rectY1_H4[h4_zone]}, Y2: {zones_rectY2_H4[h4_zone]}', pair=str_instrument)
-                            
-                                log_trader(f'H4_valid_zone: {H4_valid_zone}', pair=str_instrument)
-                                if H4_valid_zone:
-                                    found_valid_h4_zone = True
-                                    log_zone_detected(str_instrument, f'H4 {zone_type_H4}', zones_rectY1_H4[h4_zone])
-                                    add_activity_log('INFO', f'{str_instrument}: Valid H4 {zone_type_H4} zone - searching M15 pattern...', pair=str_instrument)
-                                    watchlist.append(':ballot_box_with_check: In attesa di un pattern: '+str_instrument)
-                                    
-                                    log_trader('Searching M15 pattern', pair=str_instrument)
-                                    pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lastlow = get_pattern_m15_SUP(history_m15, kijun_h4, anchor_15_min, zones_rectX2_H4[zone], zones_rectY1_H4[zone], zones_rectY2_H4[zone],str_instrument,str_session)
-
-                                    if(pattern_rectX1 is not None):
-                                        found_valid_pattern = True
-                                        add_activity_log('INFO', f'{str_instrument}: M15 pattern found - analyzing entry...', pair=str_instrument)
-                                        
-                                        #check if the same pattern was closed 
-                                        trade_closed = check_in_closed_trade(str_instrument, pattern_rectX1)
-                                        if trade_closed:
-                                            print('pattern already evaluated')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern already evaluated - skipping', pair=str_instrument)
-                                            break
-
-                                        if enddate is not None and pattern_rectX1 < enddate:
-                                            print('the pattern preceding a just-closed trade')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a just-closed trade - skipping', pair=str_instrument)
-                                            break
-                                        
-                                        result = get_closed_trades_after_date(str_instrument, pattern_rectX1)
-                                        if result:
-                                            print('the pattern preceding a closed trade')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a closed trade - skipping', pair=str_instrument)
-                                            break
-
-
-                                        watchlist.append(':ballot_box_with_check: In attesa rottura pattern: '+str_instrument)
-
-                                        log_trader(f'Pattern: X1={pattern_rectX1}, X2={pattern_rectX2}, Y1={pattern_rectY1}, Y2={pattern_rectY2}', pair=str_instrument)
-
-                                        #start of the analysis to open a position
-                                        pattern_breaking = False
-                                        pattern_breaking_candle = []
-                                        pattern_breaking_candle_high = 0
-                                        fib_78_6 = 0
-                                        index_lastlow = 0
-                                        trade_setup = []
-                                        for index in range(pattern_rectX2, len(history_m15)-1):
-                                            
-                                            if (pattern_breaking == False and 
-                                                history_m15[index]['BidClose'] > pattern_rectY1):
-
-                                                pattern_breaking = True 
-                                                pattern_breaking_candle = history_m15[index]
-                                                pattern_breaking_candle_high = history_m15[index]['BidHigh']
-                                                fib_78_6 = fibonacci_78_6(lastlow, pattern_breaking_candle_high)
-
-                                                log_trader(f'Fib 78.6: {fib_78_6}, lastlow: {lastlow}, candle_high: {pattern_breaking_candle_high}', pair=str_instrument)
-                                                ###################
-                                                stop_loss_price = calculate_stop_loss_LONG(str_instrument,pattern_rectY1, lastlow)
-                                                target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
-                                                risk_reward = calculate_risk_reward_ratio(fib_78_6, target_price, stop_loss_price)
-                                                if  risk_reward >= 2:
-                                                    trade_setup.append({'pair': str_instrument, 
-                                                                        'entry_price': fib_78_6, 
-                                                                        'stop_loss_price':stop_loss_price, 
-                                                                        'target_price': target_price, 
-                                                                        'direction': 'LONG', 
-                                                                        'type':'FULL',
-                                                                        'risk_reward': risk_reward, 
-                                                                        'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
-                                                                        'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
-                                                                        'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
-                                                                        'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
-                                                                        'zones_rectY1_H4': zones_rectY1_H4[h4_zone], 
-                                                                        'zones_rectY2_H4': zones_rectY2_H4[h4_zone],
-                                                                        'pattern_x1': str(pattern_rectX1),
-                                                                        'pattern_y1': pattern_rectY1,
-                                                                        'pattern_y2': pattern_rectY2,
-                                                                        'breakup_date':history_m15[index]['Date'],
-                                                                        'fibonacci100':lastlow})
-                                                    
-                                                    target_1_1 = calculate_target_price_LONG(trade_setup[-1]['entry_price'], trade_setup[-1]['stop_loss_price'], 1)
-                                                    upsert_order_waiting_retest(trade_setup[-1], target_1_1)
-                                                    # Log trade signal
-                                                    log_trade_signal(str_instrument, 'LONG', 
-                                                                   trade_setup[-1]['entry_price'], 
-                                                                   trade_setup[-1]['stop_loss_price'],
-                                                                   trade_setup[-1]['target_price'],
-                                                                   trade_setup[-1]['risk_reward'])
-                                                    log_retest_waiting(str_instrument, trade_setup[-1]['entry_price'])
-                                                    add_activity_log('SUCCESS', f'{str_instrument}: LONG signal created - Entry: {round(fib_78_6, 5)}, SL: {round(stop_loss_price, 5)}, R:R: {round(risk_reward, 2)}', pair=str_instrument)
-                                                else:
-                                                    print('NO R:R')
-                                                    log_rr_rejected(str_instrument, 0, 2.0)
-                                                    watchlist.append(':ballot_box_with_check: pattern senza R:R valido: '+str_instrument)
-                                                    mt5_close_order(str_instrument) #if there was a previous order placed in retest.
-                                                    close_trade_in_retest(str_instrument)
-                                                    break
-                                                
-                                                ###################
-                                                watchlist.append(':ballot_box_with_check: In attesa di retest pattern: '+str_instrument)
-                                            
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidLow'] <= fib_78_6):
-
-                                                watchlist.append(':ballot_box_with_check: A mercato: '+str_instrument)
-
-                                                log_trader(f'Fibonacci level broken at: {history_m15[index]["Date"]}', pair=str_instrument)
-                                                log_trader(f'Signal: {trade_setup[-1]}', pair=str_instrument)
-                                                update_trade_in_progress(trade_setup[-1]['pair'], index, history_m15[index]['Date'])
-                                                break
-
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidHigh'] >= get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)):
-                                                print('trade chiuso per aver raggiunto il target senza retest')
-                                                watchlist.append(':ballot_box_with_check: trade chiuso per aver raggiunto il target senza retest: '+str_instrument)
-                                                close_trade_in_retest(str_instrument)
-                                                break
-
-                                            
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidHigh'] > pattern_breaking_candle_high):
-                                                    pattern_breaking_candle_high = history_m15[index]['BidHigh']
-                                                    fib_78_6 = fibonacci_78_6(lastlow, pattern_breaking_candle_high)
-                                                    
-                                                    ###################
-                                                    stop_loss_price = calculate_stop_loss_LONG(str_instrument,pattern_rectY1, lastlow)
-                                                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
-                                                    risk_reward = calculate_risk_reward_ratio(fib_78_6, target_price, stop_loss_price)
-                                                    if risk_reward >= 2:
-                                                        trade_setup.append({'pair': str_instrument, 
-                                                                        'entry_price': fib_78_6, 
-                                                                        'stop_loss_price':stop_loss_price, 
-                                                                        'target_price': target_price, 
-                                                                        'direction': 'LONG', 
-                                                                        'type':'FULL',
-                                                                        'risk_reward': risk_reward, 
-                                                                        'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
-                                                                        'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
-                                                                        'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
-                                                                        'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
-                                                                        'zones_rectY1_H4': zones_rectY1_H4[h4_zone], 
-                                                                        'zones_rectY2_H4': zones_rectY2_H4[h4_zone],
-                                                                        'pattern_x1': str(pattern_rectX1),
-                                                                        'pattern_y1': pattern_rectY1,
-                                                                        'pattern_y2': pattern_rectY2,
-                                                                        'breakup_date':history_m15[index]['Date'],
-                                                                        'fibonacci100':lastlow})
-
-                                                        target_1_1 = calculate_target_price_LONG(trade_setup[-1]['entry_price'], trade_setup[-1]['stop_loss_price'], 1)
-                                                        upsert_order_waiting_retest(trade_setup[-1], target_1_1)
-                                                        # Log trade signal
-                                                        log_trade_signal(str_instrument, 'LONG', 
-                                                                       trade_setup[-1]['entry_price'], 
-                                                                       trade_setup[-1]['stop_loss_price'],
-                                                                       trade_setup[-1]['target_price'],
-                                                                       trade_setup[-1]['risk_reward'])
-                                                        log_retest_waiting(str_instrument, trade_setup[-1]['entry_price'])
-                                                        add_activity_log('SUCCESS', f'{str_instrument}: LONG signal updated - Entry: {round(fib_78_6, 5)}, R:R: {round(risk_reward, 2)}', pair=str_instrument)
-                                                    else:
-                                                        print('NO R:R')
-                                                        log_rr_rejected(str_instrument, 0, 2.0)
-                                                        watchlist.append(':ballot_box_with_check: pattern senza R:R valido: '+str_instrument)
-                                                        mt5_close_order(str_instrument) #if there was a previous order placed in retest.
-                                                        close_trade_in_retest(str_instrument)
-                                                        break
-                                                    ###################
-                                        
-                                        # Log if pattern was not broken
-                                        if not pattern_breaking:
-                                            add_activity_log('INFO', f'{str_instrument}: M15 pattern not yet broken - waiting for breakout', pair=str_instrument)
-                                        
-                            elif zone_type_H4 == 'RES':
-                                #print('final_zones_H4: '+str(final_zones_H4))
-                                for zone in reversed(final_zones_H4):
-                                    if (zones_rectY1_H4[zone] >= zones_rectY2_DLY[dly_zone] and
-                                    history_H4[-2]['BidClose'] <= zones_rectY1_H4[zone]):
-                                        h4_zone = zone
-                                        H4_candle, H4_zone_valid_for_kijun, H4_valid_zone, anchor_15_min = validate_resistence (zones_rectX1_H4[h4_zone], zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone], history_H4, 'H4', kijun_h4, str_instrument, str_session)
-                                        if H4_valid_zone:
-                                            break
-
-                                if len(zones_rectX1_H4) != 0:
-                                    log_trader(f'H4 zone X1: {zones_rectX1_H4[h4_zone]}, Y1: {zones_rectY1_H4[h4_zone]}, Y2: {zones_rectY2_H4[h4_zone]}', pair=str_instrument)
-                                
-                                if H4_valid_zone:
-                                    found_valid_h4_zone = True
-                                    log_zone_detected(str_instrument, f'H4 {zone_type_H4}', zones_rectY1_H4[h4_zone])
-                                    add_activity_log('INFO', f'{str_instrument}: Valid H4 {zone_type_H4} zone - searching M15 pattern...', pair=str_instrument)
-                                    watchlist.append(':ballot_box_with_check: In attesa di un pattern: '+str_instrument)
-
-                                    log_trader('Searching M15 pattern', pair=str_instrument)
-                                    pattern_rectX1, pattern_rectX2, pattern_rectY1, pattern_rectY2, lasthigh = get_pattern_m15_RES(history_m15, kijun_h4, anchor_15_min, zones_rectX2_H4[h4_zone], zones_rectY1_H4[h4_zone], zones_rectY2_H4[h4_zone],str_instrument,str_session)
-                                    
-                                    if(pattern_rectX1 is not None):
-                                        found_valid_pattern = True
-                                        add_activity_log('INFO', f'{str_instrument}: M15 pattern found - analyzing entry...', pair=str_instrument)
-
-                                        #check if the same pattern was closed 
-                                        trade_closed = check_in_closed_trade(str_instrument, pattern_rectX1)
-                                        if trade_closed:
-                                            print('pattern already evaluated')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern already evaluated - skipping', pair=str_instrument)
-                                            break
-
-                                        if enddate is not None and pattern_rectX1 < enddate:
-                                            print('the pattern preceding a just-closed trade')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a just-closed trade - skipping', pair=str_instrument)
-                                            break
-
-                                        result = get_closed_trades_after_date(str_instrument, pattern_rectX1)
-                                        if result:
-                                            print('the pattern preceding a closed trade')
-                                            add_activity_log('WARNING', f'{str_instrument}: Pattern precedes a closed trade - skipping', pair=str_instrument)
-                                            break
-                                           
-                                        watchlist.append(':ballot_box_with_check: In attesa rottura pattern: '+str_instrument)
-
-                                        log_trader(f'Pattern: X1={pattern_rectX1}, X2={pattern_rectX2}, Y1={pattern_rectY1}, Y2={pattern_rectY2}', pair=str_instrument)
-
-                                        #start of the analysis to open a position
-                                        pattern_breaking = False
-                                        pattern_breaking_candle = []
-                                        pattern_breaking_candle_low = 0
-                                        fib_78_6 = 0
-                                        index_lastlow = 0
-                                        trade_setup = []
-                                        for index in range(pattern_rectX2, len(history_m15)-1):
-                                            
-                                            if (pattern_breaking == False and 
-                                                history_m15[index]['BidClose'] < pattern_rectY1):
-
-                                                pattern_breaking = True 
-                                                pattern_breaking_candle = history_m15[index]
-                                                pattern_breaking_candle_low = history_m15[index]['BidLow']
-                                                fib_78_6 = fibonacci_78_6(lasthigh, history_m15[index]['BidLow'])
-                                                
-
-                                                log_trader(f'Fib 78.6: {fib_78_6}, lasthigh: {lasthigh}, candle_low: {pattern_breaking_candle_low}', pair=str_instrument)
-                                            
-                                                ###################
-                                                stop_loss_price = calculate_stop_loss_SHORT(str_instrument,pattern_rectY1,lasthigh)
-                                                target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
-                                                risk_reward = calculate_risk_reward_ratio(fib_78_6, target_price, stop_loss_price)
-                                                
-                                                if  risk_reward >= 2:
-                                                    trade_setup.append({'pair': str_instrument, 
-                                                                        'entry_price': fib_78_6, 
-                                                                        'stop_loss_price':stop_loss_price, 
-                                                                        'target_price': target_price, 
-                                                                        'direction': 'SHORT', 
-                                                                        'type':'FULL',
-                                                                        'risk_reward': risk_reward, 
-                                                                        'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
-                                                                        'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
-                                                                        'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
-                                                                        'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
-                                                                        'zones_rectY1_H4': zones_rectY1_H4[h4_zone], 
-                                                                        'zones_rectY2_H4': zones_rectY2_H4[h4_zone],
-                                                                        'pattern_x1': str(pattern_rectX1),
-                                                                        'pattern_y1': pattern_rectY1,
-                                                                        'pattern_y2': pattern_rectY2,
-                                                                        'breakup_date':history_m15[index]['Date'],
-                                                                        'fibonacci100':lasthigh})
-                                                    
-                                                    target_1_1 = calculate_target_price_SHORT(trade_setup[-1]['entry_price'], trade_setup[-1]['stop_loss_price'], 1)
-                                                    upsert_order_waiting_retest(trade_setup[-1], target_1_1)
-                                                    # Log trade signal
-                                                    log_trade_signal(str_instrument, 'SHORT', 
-                                                                   trade_setup[-1]['entry_price'], 
-                                                                   trade_setup[-1]['stop_loss_price'],
-                                                                   trade_setup[-1]['target_price'],
-                                                                   trade_setup[-1]['risk_reward'])
-                                                    log_retest_waiting(str_instrument, trade_setup[-1]['entry_price'])
-                                                    add_activity_log('SUCCESS', f'{str_instrument}: SHORT signal created - Entry: {round(fib_78_6, 5)}, SL: {round(stop_loss_price, 5)}, R:R: {round(risk_reward, 2)}', pair=str_instrument)
-                                                else:
-                                                    print('NO R:R')
-                                                    log_rr_rejected(str_instrument, 0, 2.0)
-                                                    watchlist.append(':ballot_box_with_check: pattern senza R:R valido: '+str_instrument)
-                                                    mt5_close_order(str_instrument) #if there was a previous order placed in retest.
-                                                    close_trade_in_retest(str_instrument)
-                                                    break
-
-                                                watchlist.append(':ballot_box_with_check: In attesa di retest pattern: '+str_instrument)
-
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidHigh'] >= fib_78_6):
-                                                                                                
-                                                watchlist.append(':ballot_box_with_check: A mercato: '+str_instrument)
-
-                                                log_trader(f'Fibonacci level broken at: {history_m15[index]["Date"]}', pair=str_instrument)
-                                                log_trader(f'Signal: {trade_setup[-1]}', pair=str_instrument)
-                                                update_trade_in_progress(trade_setup[-1]['pair'], index, history_m15[index]['Date'])
-                                                break
-
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidLow'] <= get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)):
-                                                print('trade chiuso per aver raggiunto il target senza retest')
-                                                close_trade_in_retest(str_instrument)
-                                                watchlist.append(':ballot_box_with_check: trade chiuso per aver raggiunto il target senza retest: '+str_instrument)
-                                                break
-                                            
-                                            elif (pattern_breaking == True and 
-                                                history_m15[index]['BidLow'] < pattern_breaking_candle_low):
-                                                    pattern_breaking_candle_low = history_m15[index]['BidLow']
-                                                    fib_78_6 = fibonacci_78_6(lasthigh, pattern_breaking_candle_low)
-
-                                                    ###################
-                                                    stop_loss_price = calculate_stop_loss_SHORT(str_instrument,pattern_rectY1, lasthigh)
-                                                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
-                                                    risk_reward = calculate_risk_reward_ratio(fib_78_6, target_price, stop_loss_price)
-                                                    if risk_reward >= 2:
-                                                        trade_setup.append({'pair': str_instrument, 
-                                                                        'entry_price': fib_78_6, 
-                                                                        'stop_loss_price':stop_loss_price, 
-                                                                        'target_price': target_price, 
-                                                                        'direction': 'SHORT', 
-                                                                        'type': 'FULL',
-                                                                        'risk_reward': risk_reward, 
-                                                                        'zones_rectX1_DLY': str(zones_rectX1_DLY[dly_zone]),
-                                                                        'zones_rectY1_DLY': zones_rectY1_DLY[dly_zone],
-                                                                        'zones_rectY2_DLY': zones_rectY2_DLY[dly_zone],
-                                                                        'zones_rectX1_H4': str(zones_rectX1_H4[h4_zone]),
-                                                                        'zones_rectY1_H4': zones_rectY1_H4[h4_zone], 
-                                                                        'zones_rectY2_H4': zones_rectY2_H4[h4_zone],
-                                                                        'pattern_x1': str(pattern_rectX1),
-                                                                        'pattern_y1': pattern_rectY1,
-                                                                        'pattern_y2': pattern_rectY2,
-                                                                        'breakup_date':history_m15[index]['Date'],
-                                                                        'fibonacci100':lasthigh})
-                                                    
-                                                        target_1_1 = calculate_target_price_SHORT(trade_setup[-1]['entry_price'], trade_setup[-1]['stop_loss_price'], 1)
-                                                        upsert_order_waiting_retest(trade_setup[-1], target_1_1)
-                                                        # Log trade signal
-                                                        log_trade_signal(str_instrument, 'SHORT', 
-                                                                       trade_setup[-1]['entry_price'], 
-                                                                       trade_setup[-1]['stop_loss_price'],
-                                                                       trade_setup[-1]['target_price'],
-                                                                       trade_setup[-1]['risk_reward'])
-                                                        log_retest_waiting(str_instrument, trade_setup[-1]['entry_price'])
-                                                        add_activity_log('SUCCESS', f'{str_instrument}: SHORT signal updated - Entry: {round(fib_78_6, 5)}, R:R: {round(risk_reward, 2)}', pair=str_instrument)
-
-                                                    else:
-                                                        print('NO R:R')
-                                                        log_rr_rejected(str_instrument, 0, 2.0)
-                                                        watchlist.append(':ballot_box_with_check: pattern senza R:R valido: '+str_instrument)
-                                                        mt5_close_order(str_instrument) #if there was a previous order placed in retest.
-                                                        close_trade_in_retest(str_instrument)
-                                                        break
-                                                    ###################
-                                        
-                                        # Log if pattern was not broken
-                                        if not pattern_breaking:
-                                            add_activity_log('INFO', f'{str_instrument}: M15 pattern not yet broken - waiting for breakout', pair=str_instrument)
-                    
-                    # Log summary if no valid zones/patterns found
-                    if not found_valid_d1_zone:
-                        add_activity_log('INFO', f'{str_instrument}: No valid D1 zones found', pair=str_instrument)
-                    elif not found_valid_h4_zone:
-                        add_activity_log('INFO', f'{str_instrument}: D1 zone found, but no valid H4 confirmation', pair=str_instrument)
-                    elif not found_valid_pattern:
-                        add_activity_log('INFO', f'{str_instrument}: D1+H4 zones found, but no M15 pattern', pair=str_instrument)
-                                        
-                    ######## process trade in progress ########
-                    trade_in_progress = check_in_progress_trade(str_instrument)
-                    if trade_in_progress is not None:
-                        #remove the same trades in close state
-                        remove_closed_trades(str_instrument, trade_in_progress['entry_date'], trade_in_progress['pattern_x1'],trade_in_progress['pattern_y1'],trade_in_progress['pattern_y2'])
-                        print('trade_in_progress:')
-                        if trade_in_progress['direction'] == 'SHORT':
-                            #print('trade_in_progress: '+str(trade_in_progress['stop_loss'])+' - '+str(trade_in_progress['entry_price_index']))
-                            continue_logic, enddate = process_trades_SHORT(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], trade_in_progress['stop_loss'], trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'])
-                        if trade_in_progress['direction'] == 'LONG':
-                            continue_logic, enddate = process_trades_LONG(history_DLY, trade_in_progress['zones_recty1_dly'], history_m15, str_instrument, trade_in_progress['entry_price_index']+1, kijun_h4, trade_in_progress['stop_loss'], trade_in_progress['stop_loss'], trade_in_progress['entry_price'], trade_in_progress['target'], trade_in_progress['zones_recty1_h4'], history_H4, trade_in_progress['entry_date'])                                 
-                            
-                                
-                    if len(watchlist) != 0:
-                        send_slack_message(os.getenv('SLACK_CHANNEL', 'mt-bot'), watchlist[-1])
-                
-                #close mt5 orders already processed
-                clean_trades()
-                
+            # cache su disco: da FXCM arrivano solo le candele nuove
+            history_source = fx if args.no_cache else CandleCache(fx.get_history)
+            run_pair(history_source, str_instrument, str_session, date_from, date_to, quotes_count, args.reuse_zones)
 
         except Exception as e:
             common_samples.print_exception(e)
@@ -0,0 +1,260 @@
+"""
+Ricerca incrementale dei pattern M15 per il loop live (PatternTracker).
+
+get_pattern_m15_SUP / get_pattern_m15_RES (patterns.detect_pattern)
+ripercorrono a ogni ciclo la storia M15 dall'ultima candela all'indietro
+fino all'inizio della zona H4 o all'ultima candela che tocca la Kijun H4.
+PatternTracker tiene lo stato equivalente per una coppia e una zona H4
+attiva e lo aggiorna in avanti, una candela M15 alla volta:
+
+- una candela di stop (inizio della zona H4, touch della Kijun H4) azzera
+  lo stato;
+- i low dopo lo stop sono in uno stack monotono: il primo nuovo minimo
+  (lowestclose) della scansione all'indietro da una candela e' l'ultimo
+  elemento dello stack con low sotto il suo close (bisect), e ogni elemento
+  ricorda l'ultimo nuovo minimo della sua catena (la radice);
+- per ogni radice si tengono lastlow, l'ultimo pattern fino alla radice (il
+  primo pattern a sinistra) e il primo pattern dopo (l'ultimo a destra);
+- i template sono patterns.PATTERN_TEMPLATES sulle ultime 4 candele.
+
+Il lavoro per candela e' O(log n) (O(1) ammortizzato sullo stack) invece di
+O(candele dall'inizio della zona), e la sequenza di push e' deterministica:
+un backtest puo' rigiocare le candele una per una con lo stesso risultato.
+Il tracker non vede le candele precedenti alla prima consumata: sulle prime
+3 candele di una storia senza stop i template non scattano (la scansione
+all'indietro li valutava con indici negativi, cioe' sulla fine della lista).
+
+Nel loop live (track_pattern_m15) una candela e' confermata solo quando la
+sua Kijun H4 e' definitiva, cioe' quando la candela H4 che la contiene si e'
+chiusa; le candele piu' recenti si applicano a ogni ciclo a una copia dello
+stato. Lo stato confermato e' salvato nella tabella pattern_trackers
+(db_utils) e ripreso al ciclo successivo se la storia M15 contiene ancora
+l'ultima candela confermata.
+
+Come in patterns.py la RES e' la SUP sui prezzi negati.
+"""
+
+import json
+from bisect import bisect_left
+
+import numpy as np
+
+from db_utils import get_pattern_tracker_state, save_pattern_tracker_state
+from kijun import kijun_keys, lower_kijun_h4_array
+from patterns import SIDES, Candles, pattern_columns, pattern_offsets, zone_start_index
+
+_STATE_FIELDS = ('first_ts', 'stop_ts', 'last_ts', 'window', 'stopped', 'new_low',
+                 'lows', 'stack_roots', 'roots', 'open_roots', 'last_hit')
+
+
+class PatternTracker:
+    def __init__(self, side_name, zone_x1=None):
+        self.side = SIDES[side_name]
+        self.zone_x1 = zone_x1
+        self.first_ts = None    # prima candela da cui dipende lo stato
+        self.stop_ts = None     # ultima candela di stop, None se non ce ne sono
+        self.last_ts = None     # ultima candela consumata
+        self.window = []        # ultime 4 candele [ts, open, high, low, close] orientate SUP
+        self.stopped = True     # l'ultima candela consumata era uno stop
+        self.new_low = None     # radice dell'ultima candela, None se nessun nuovo minimo
+        self.lows = []          # stack: low strettamente crescenti
+        self.stack_roots = []   # radice di ogni elemento dello stack
+        self.roots = {}         # ts radice -> [min low prima/radice, low dopo, sinistra, destra]
+        self.open_roots = []    # radici ancora senza pattern a destra
+        self.last_hit = None    # ultimo pattern dopo lo stop: [ts, rectY1, rectY2]
+
+    def push(self, ts, open_, high, low, close, stop, offset=None):
+        """Consuma la candela successiva; stop: inizio della zona H4 o touch
+        della Kijun H4 (la scansione all'indietro si fermerebbe qui).
+        offset: valore di patterns.pattern_offsets per questa candela se gia'
+        calcolato sulla serie (altrimenti si valuta sulle ultime 4 candele)."""
+        ts = int(ts)
+        if self.side.sign > 0:
+            bar = [ts, float(open_), float(high), float(low), float(close)]
+        else:
+            bar = [ts, -float(open_), -float(low), -float(high), -float(close)]
+        prev = self.window[-1] if self.window else None
+        self.window.append(bar)
+        del self.window[:-4]
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        if prev is not None:
+            root = self.roots.get(prev[0])
+            if root is not None and root[1] is None:
+                root[1] = bar[3]
+
+        if stop:
+            # le candele prima dello stop servono solo ai template
+            self.first_ts = self.window[0][0]
+            self.stop_ts = ts
+            self.stopped = True
+            self.new_low = None
+            self.lows = []
+            self.stack_roots = []
+            self.roots = {}
+            self.open_roots = []
+            self.last_hit = None
+            return
+        self.stopped = False
+
+        hit = self._match(offset)
+        if hit is not None:
+            for root_ts in self.open_roots:
+                if root_ts in self.roots:
+                    self.roots[root_ts][3] = hit
+            self.open_roots = []
+            self.last_hit = hit
+
+        # candela precedente piu' recente con low sotto il close di questa
+        k = bisect_left(self.lows, bar[4]) - 1
+        parent = self.stack_roots[k] if k >= 0 else None
+        root_ts = parent
+        if root_ts is None:
+            root_ts = ts
+            around = min(prev[3], bar[3]) if prev is not None else bar[3]
+            self.roots[ts] = [around, None, self.last_hit, None]
+            self.open_roots.append(ts)
+        while self.lows and self.lows[-1] >= bar[3]:
+            self.lows.pop()
+            self.stack_roots.pop()
+        self.lows.append(bar[3])
+        self.stack_roots.append(root_ts)
+        self.new_low = root_ts if bar[3] < bar[4] or parent is not None else None
+
+        # solo le radici dello stack servono alle candele successive
+        if len(self.roots) > 2 * len(self.stack_roots) + 16:
+            live = set(self.stack_roots)
+            self.roots = {r: v for r, v in self.roots.items() if r in live}
+            self.open_roots = [r for r in self.open_roots if r in live]
+
+    def _match(self, offset=None):
+        """Pattern (ts candela di partenza, rectY1, rectY2) che termina
+        sull'ultima candela, None se nessun template corrisponde."""
+        if len(self.window) < 4:
+            return None
+        if offset is None:
+            columns = np.array([bar[1:] for bar in self.window]).T
+            offset = pattern_offsets(Candles(*columns))[-1]
+        offset = int(offset)
+        if offset == 0:
+            return None
+        anchor = 3 - offset
+        return [self.window[anchor][0], max(self.window[anchor][2], self.window[anchor + 1][2]),
+                self.window[anchor][4]]
+
+    def result(self, history, kijun_h4):
+        """(rectX1, rectX2, rectY1, rectY2, lastlow/lasthigh) come
+        get_pattern_m15_SUP/RES su una storia che termina con l'ultima
+        candela consumata."""
+        sign = self.side.sign
+        last = self.window[-1]
+        last_extreme = last[3]
+        if not last[4] < sign * next(reversed(kijun_h4.values())) or self.stopped:
+            return None, None, None, None, sign * last_extreme
+
+        if self.new_low is None:
+            left, right = self.last_hit, None
+        else:
+            around, after, left, right = self.roots[self.new_low]
+            last_extreme = around if after is None else min(around, after)
+        if left is not None and right is not None:
+            rect = right if left[2] > right[1] else left
+        else:
+            rect = left if left is not None else right
+        if rect is None:
+            return None, None, None, None, sign * last_extreme
+        anchor_ts, y1, y2 = rect
+        index = int(np.searchsorted(pattern_columns(history)[0], anchor_ts))
+        return history[index]['Date'], index, sign * y1, sign * y2, sign * last_extreme
+
+    def valid_for(self, first_ts):
+        """Lo stato vale per una storia che inizia con first_ts: senza stop
+        la scansione arriva fino alla prima candela della storia, che deve
+        essere la stessa; dopo uno stop basta che la storia contenga le
+        candele da cui dipende lo stato."""
+        if self.stop_ts is None:
+            return self.first_ts == first_ts
+        return self.first_ts >= first_ts
+
+    def to_state(self):
+        state = {field: getattr(self, field) for field in _STATE_FIELDS}
+        state['roots'] = [[root_ts] + values for root_ts, values in self.roots.items()]
+        return state
+
+    @classmethod
+    def from_state(cls, side_name, zone_x1, state):
+        tracker = cls(side_name, zone_x1)
+        for field in _STATE_FIELDS:
+            setattr(tracker, field, state[field])
+        tracker.window = [list(bar) for bar in state['window']]
+        tracker.lows = list(state['lows'])
+        tracker.stack_roots = list(state['stack_roots'])
+        tracker.roots = {root[0]: list(root[1:]) for root in state['roots']}
+        tracker.open_roots = list(state['open_roots'])
+        return tracker
+
+    def copy(self):
+        return PatternTracker.from_state(self.side.name, self.zone_x1, self.to_state())
+
+
+def track_pattern_m15(pair, history, kijun_h4, zone_rectX1_h4, side_name):
+    """get_pattern_m15_SUP / get_pattern_m15_RES (side_name 'SUP' o 'RES')
+    con lo stato salvato nel database: consuma solo le candele M15 nuove.
+    Ritorna (rectX1, rectX2, rectY1, rectY2, lastlow/lasthigh)."""
+    ts, open_, high, low, close = pattern_columns(history)
+    n = len(ts)
+    zone_start = zone_start_index(history, ts, zone_rectX1_h4)
+
+    tracker = None
+    start = 0
+    record = get_pattern_tracker_state(pair, side_name)
+    if record is not None and record[0] == zone_rectX1_h4:
+        saved = PatternTracker.from_state(side_name, zone_rectX1_h4, json.loads(record[1]))
+        pos = int(np.searchsorted(ts, saved.last_ts))
+        if pos < n and ts[pos] == saved.last_ts and saved.valid_for(int(ts[0])):
+            tracker = saved
+            start = pos + 1
+    if tracker is None:
+        tracker = PatternTracker(side_name, zone_rectX1_h4)
+        # le 3 candele prima della zona H4 servono solo ai template
+        start = max(zone_start - 3, 0) if zone_start >= 0 else 0
+
+    # stop: inizio della zona H4 o touch della Kijun H4 (sul lato della zona)
+    kijun = lower_kijun_h4_array(ts[start:], kijun_h4)
+    if side_name == 'SUP':
+        touches = high[start:] >= kijun
+    else:
+        touches = low[start:] <= kijun
+
+    # template sulle candele nuove in un colpo (con le 3 precedenti)
+    first = max(start - 3, 0)
+    sign = SIDES[side_name].sign
+    if sign > 0:
+        candles = Candles(open_[first:], high[first:], low[first:], close[first:])
+    else:
+        candles = Candles(-open_[first:], -low[first:], -high[first:], -close[first:])
+    offsets = pattern_offsets(candles)
+
+    # confermate: candele chiuse prima dell'apertura dell'ultima candela H4
+    # (la Kijun della loro candela H4 non cambia piu')
+    key_ts, _ = kijun_keys(kijun_h4)
+    confirmed = 0
+    if len(key_ts):
+        confirmed = min(int(np.searchsorted(ts, key_ts[-1])), n - 1)
+
+    def push(target, j):
+        # le prime 3 candele della storia non hanno le 3 precedenti
+        offset = offsets[j - first] if j >= 3 else None
+        target.push(ts[j], open_[j], high[j], low[j], close[j],
+                    j <= zone_start or bool(touches[j - start]), offset)
+
+    for j in range(start, confirmed):
+        push(tracker, j)
+    if confirmed > start:
+        save_pattern_tracker_state(pair, side_name, zone_rectX1_h4, json.dumps(tracker.to_state()))
+
+    live = tracker.copy()
+    for j in range(max(start, confirmed), n):
+        push(live, j)
+    return live.result(history, kijun_h4)
@@ -0,0 +1,227 @@
+"""
+Ricerca dei pattern M15 di inversione (motore di get_pattern_m15_SUP /
+get_pattern_m15_RES).
+
+Stesso output della scansione all'indietro originale, che dall'ultima
+candela M15 risale fino all'inizio della zona H4 o alla prima candela che
+tocca la Kijun H4, tiene i pattern trovati a sinistra dell'ultimo nuovo
+minimo (lowestclose) separati da quelli a destra e alla fine sceglie il
+rettangolo tra il primo pattern a sinistra e l'ultimo a destra.
+
+Invece di valutare i template candela per candela, i quattro template sono
+maschere NumPy calcolate in un colpo su tutta la serie (PATTERN_TEMPLATES:
+un nuovo template e' una nuova funzione di maschera). La candela di stop e'
+l'ultima candela oltre la Kijun (o l'inizio della zona H4); i nuovi minimi
+all'indietro si seguono con la sparse table dei low (range_query), e la
+scelta sinistra/destra guarda solo l'ultimo nuovo minimo e gli indici dei
+pattern trovati.
+
+La RES e' la SUP specchiata: template e scelta sono scritti una volta per il
+lato SUP e applicati ai prezzi negati (high e low scambiati). La negazione e'
+esatta, quindi confronti e max/min danno esattamente gli stessi valori.
+"""
+
+import calendar
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from candles import DATE_FORMAT
+from kijun import lower_kijun_h4_array
+from range_query import range_table
+
+# sign:  +1 prezzi cosi' come sono (SUP), -1 prezzi negati (RES)
+# table: colonna e tipo della sparse table per i nuovi minimi (massimi per RES)
+Side = namedtuple('Side', 'name sign table')
+
+SIDES = {
+    'SUP': Side('SUP', 1.0, ('low', 'min')),
+    'RES': Side('RES', -1.0, ('high', 'max')),
+}
+
+
+def pattern_columns(history):
+    """(ts, open, high, low, close) di una storia: CandleSeries o lista di dict FXCM."""
+    if hasattr(history, 'ts'):
+        return history.ts, history.open, history.high, history.low, history.close
+    dates = pd.to_datetime([candle['Date'] for candle in history], format=DATE_FORMAT)
+    ts = np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+    columns = [np.array([candle[field] for candle in history], dtype=np.float64)
+               for field in ('BidOpen', 'BidHigh', 'BidLow', 'BidClose')]
+    return (ts, *columns)
+
+
+class Candles:
+    """Colonne (open, high, low, close) orientate sul lato SUP, lette alla
+    candela i - k per ogni i. Per i < k l'indice negativo riparte dalla fine
+    della serie, come history[i - k] nella scansione originale."""
+
+    def __init__(self, open_, high, low, close):
+        self._columns = {'open': open_, 'high': high, 'low': low, 'close': close}
+        self._shifted = {}
+
+    def _at(self, field, k):
+        shifted = self._shifted.get((field, k))
+        if shifted is None:
+            shifted = np.roll(self._columns[field], k)
+            self._shifted[(field, k)] = shifted
+        return shifted
+
+    def open(self, k):
+        return self._at('open', k)
+
+    def high(self, k):
+        return self._at('high', k)
+
+    def low(self, k):
+        return self._at('low', k)
+
+    def close(self, k):
+        return self._at('close', k)
+
+    def bearish(self, k):
+        return self.open(k) > self.close(k)
+
+    def bullish(self, k):
+        return self.open(k) < self.close(k)
+
+
+# Template sul lato SUP (sulla RES ribassista e rialzista si scambiano)
+def _due_candele_due_candele(c):
+    return c.bearish(0) & c.bearish(1) & c.bullish(2) & c.bullish(3)
+
+
+def _engulfing_due_candele(c):
+    return (c.bearish(0) & c.bearish(1) & c.bullish(2) & c.bearish(3)
+            & (c.close(2) > c.high(3)))
+
+
+def _engulfing_engulfing(c):
+    return (c.bearish(0) & c.bullish(1) & c.bearish(2)
+            & (c.close(1) > c.high(2)) & (c.close(0) < c.low(1)))
+
+
+def _due_candele_engulfing(c):
+    return (c.bearish(0) & c.bullish(1) & c.bullish(2)
+            & (c.close(0) < c.low(1)))
+
+
+# (nome, maschera, offset): in ordine di priorita', sulla candela i vince il
+# primo template che corrisponde; il rettangolo parte dalla candela i - offset
+# (high massimo tra i - offset e la successiva, close della i - offset)
+PATTERN_TEMPLATES = [
+    ('due candele + due candele', _due_candele_due_candele, 2),
+    ('engulfing + due candele', _engulfing_due_candele, 2),
+    ('engulfing + engulfing', _engulfing_engulfing, 1),
+    ('due candele + enfulfing', _due_candele_engulfing, 1),
+]
+
+
+def pattern_offsets(candles):
+    """Per ogni candela i l'offset del primo template che corrisponde in i,
+    0 se nessuno."""
+    masks = [mask(candles) for _, mask, _ in PATTERN_TEMPLATES]
+    offsets = [offset for _, _, offset in PATTERN_TEMPLATES]
+    return np.select(masks, offsets, 0)
+
+
+def zone_start_index(history, ts, zone_rectX1_h4):
+    """Ultima candela con Date == zone_rectX1_h4, -1 se non c'e'."""
+    try:
+        zone_ts = calendar.timegm(time.strptime(zone_rectX1_h4, DATE_FORMAT))
+    except (TypeError, ValueError):
+        return -1
+    pos = int(np.searchsorted(ts, zone_ts, side='right')) - 1
+    if pos >= 0 and history[pos]['Date'] == zone_rectX1_h4:
+        return pos
+    return -1
+
+
+def _rect(candles, offsets, i):
+    """(candela di partenza, rectY1, rectY2) del pattern trovato in i, prezzi
+    orientati sul lato SUP. La candela di partenza puo' essere negativa per
+    i < offset, come nella scansione originale."""
+    anchor = int(i - offsets[i])
+    high = candles.high(0)
+    return anchor, max(high[anchor], high[anchor + 1]), candles.close(0)[anchor]
+
+
+def _last_new_low(history, close, lo, side):
+    """Ultimo (il piu' vecchio) nuovo minimo della scansione all'indietro da
+    len - 1 a lo: la candela i e' un nuovo minimo se il suo low e' sotto il
+    close dell'ultimo nuovo minimo (all'inizio il close dell'ultima candela).
+    -1 se non ce ne sono."""
+    table = range_table(history, *side.table)
+    last = -1
+    j = len(close) - 1
+    value = close[j]
+    while j >= lo:
+        i = table.last_beyond(lo, j, side.sign * value)
+        if i < 0:
+            break
+        last = i
+        value = close[i]
+        j = i - 1
+    return last
+
+
+def detect_pattern(history, kijun_h4, zone_rectX1_h4, side_name):
+    """Pattern M15 del lato side_name ('SUP' o 'RES').
+
+    Ritorna (rectX1, rectX2, rectY1, rectY2, last_extreme, stop): il
+    rettangolo (None se nessun pattern), lastlow / lasthigh e la candela dove
+    si e' fermata la scansione come (indice, 'zone' o 'kijun'), None se non
+    si e' fermata o la scansione non e' partita.
+    """
+    side = SIDES[side_name]
+    sign = side.sign
+    ts, open_, high, low, close = pattern_columns(history)
+    if side.sign > 0:
+        candles = Candles(open_, high, low, close)
+    else:
+        candles = Candles(-open_, -low, -high, -close)
+    # da qui in poi prezzi orientati sul lato SUP
+    low_s = candles.low(0)
+    high_s = candles.high(0)
+    close_s = candles.close(0)
+
+    last_extreme = float(sign * low_s[-1])
+    if not close_s[-1] < sign * next(reversed(kijun_h4.values())):
+        return None, None, None, None, last_extreme, None
+
+    # stop: inizio della zona H4 o ultima candela che tocca la Kijun H4
+    zone_start = zone_start_index(history, ts, zone_rectX1_h4)
+    touches = np.flatnonzero(high_s >= sign * lower_kijun_h4_array(ts, kijun_h4))
+    kijun_stop = int(touches[-1]) if len(touches) else -1
+    stop = None
+    if zone_start >= 0 and zone_start >= kijun_stop:
+        stop = (zone_start, 'zone')
+    elif kijun_stop >= 0:
+        stop = (kijun_stop, 'kijun')
+    lo = stop[0] + 1 if stop else 0
+
+    # pattern a sinistra (fino all'ultimo nuovo minimo) e a destra
+    new_low = _last_new_low(history, close_s, lo, side)
+    if new_low >= 0:
+        last_extreme = float(sign * low_s[max(new_low - 1, 0):new_low + 2].min())
+    offsets = pattern_offsets(candles)
+    hits = lo + np.flatnonzero(offsets[lo:])
+    if new_low >= 0:
+        split = int(np.searchsorted(hits, new_low, side='right'))
+        left = _rect(candles, offsets, hits[split - 1]) if split > 0 else None
+        right = _rect(candles, offsets, hits[split]) if split < len(hits) else None
+    else:
+        left = _rect(candles, offsets, hits[-1]) if len(hits) else None
+        right = None
+
+    if left is not None and right is not None:
+        rect = right if left[2] > right[1] else left
+    else:
+        rect = left if left is not None else right
+    if rect is None:
+        return None, None, None, None, last_extreme, stop
+    anchor, y1, y2 = rect
+    return (history[anchor]['Date'], anchor, float(sign * y1), float(sign * y2),
+            last_extreme, stop)
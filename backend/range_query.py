@@ -0,0 +1,84 @@
+"""
+Range min / range max in O(1) sulle colonne di una serie (sparse table).
+
+La tabella e' costruita una volta per serie e colonna (O(n log n), in NumPy):
+level[k][i] e' il min (o max) di values[i .. i + 2^k - 1]. Il min/max di un
+intervallo qualunque [i, j] e' il min/max di due blocchi sovrapposti; la
+prima (o l'ultima) candela di un intervallo oltre una soglia (es. il primo
+close sotto la zona) si trova scendendo tra i livelli in O(log n).
+
+Usata dalla validazione finale delle zone (closeLowest / highestClose) e da
+validate_support / validate_resistence per trovare la candela di rottura
+della zona senza scorrere la coda della serie, e dalla ricerca dei pattern
+M15 (patterns.py) per seguire i nuovi minimi/massimi all'indietro.
+"""
+
+import operator
+
+import numpy as np
+
+_KINDS = {
+    'min': (np.minimum, min, operator.lt),
+    'max': (np.maximum, max, operator.gt),
+}
+
+
+class SparseTable:
+    def __init__(self, values, kind='min'):
+        reduce, self._pick, self._beyond = _KINDS[kind]
+        level = np.asarray(values, dtype=np.float64)
+        self.n = len(level)
+        self.levels = [level.tolist()]
+        width = 1
+        while 2 * width <= self.n:
+            level = reduce(level[:-width], level[width:])
+            self.levels.append(level.tolist())
+            width *= 2
+
+    def query(self, i, j):
+        """min/max di values[i .. j] (estremi inclusi, i <= j)."""
+        k = (j - i + 1).bit_length() - 1
+        level = self.levels[k]
+        return self._pick(level[i], level[j - (1 << k) + 1])
+
+    def first_beyond(self, i, j, value):
+        """Primo indice in [i, j] con values < value (tabella min) o
+        values > value (tabella max), -1 se non c'e'."""
+        beyond = self._beyond
+        while i <= j:
+            k = (j - i + 1).bit_length() - 1
+            if beyond(self.levels[k][i], value):
+                # il blocco [i, i + 2^k) contiene la candela: si scende
+                while k > 0:
+                    k -= 1
+                    if not beyond(self.levels[k][i], value):
+                        i += 1 << k
+                return i
+            i += 1 << k
+        return -1
+
+    def last_beyond(self, i, j, value):
+        """Ultimo indice in [i, j] con values < value (tabella min) o
+        values > value (tabella max), -1 se non c'e'."""
+        beyond = self._beyond
+        while i <= j:
+            k = (j - i + 1).bit_length() - 1
+            start = j - (1 << k) + 1
+            if beyond(self.levels[k][start], value):
+                # il blocco (j - 2^k, j] contiene la candela: si scende
+                while k > 0:
+                    k -= 1
+                    if not beyond(self.levels[k][j - (1 << k) + 1], value):
+                        j -= 1 << k
+                return j
+            j -= 1 << k
+        return -1
+
+
+def range_table(history, field, kind):
+    """SparseTable della colonna field ('close', 'high', 'low') di una storia:
+    in cache sulla CandleSeries, costruita al volo per una lista di dict."""
+    if hasattr(history, 'range_table'):
+        return history.range_table(field, kind)
+    column = 'Bid' + field.capitalize()
+    return SparseTable([candle[column] for candle in history], kind)
@@ -0,0 +1,186 @@
+"""
+Schema versionato della tabella trades.
+
+La versione dello schema e' in PRAGMA user_version del file SQLite.
+MIGRATIONS[i] porta lo schema dalla versione i alla i+1; migrate() applica
+quelle mancanti, ognuna in una transazione con l'aggiornamento della
+versione (un'interruzione lascia lo schema alla versione precedente).
+Una migrazione nuova si aggiunge in fondo alla lista, senza toccare le
+precedenti.
+
+Usato da tutti i processi che aprono un DB dei trade: bot (db_utils.
+initialize_db), backtest_runner (DB di lavoro dell'anno) e API Flask. Solo
+sqlite3: l'API lo importa senza le dipendenze del bot.
+"""
+
+import calendar
+import time
+
+# Colonne di trades in ordine (schema storico a 25 colonne del bot e del motore BT)
+TRADES_COLUMNS = (
+    ('pair', 'TEXT'), ('status', 'TEXT'), ('trade_type', 'TEXT'),
+    ('entry_date', 'TEXT'), ('close_date', 'TEXT'),
+    ('entry_price', 'REAL'), ('entry_price_index', 'INTEGER'),
+    ('stop_loss', 'REAL'), ('target', 'REAL'), ('direction', 'TEXT'),
+    ('initial_risk_reward', 'REAL'), ('final_risk_reward', 'REAL'),
+    ('profit', 'TEXT'), ('result', 'TEXT'),
+    ('zones_rectX1_DLY', 'TEXT'), ('zones_rectY1_DLY', 'REAL'), ('zones_rectY2_DLY', 'REAL'),
+    ('zones_rectX1_H4', 'TEXT'), ('zones_rectY1_H4', 'REAL'), ('zones_rectY2_H4', 'REAL'),
+    ('pattern_x1', 'TEXT'), ('pattern_y1', 'REAL'), ('pattern_y2', 'REAL'),
+    ('breakup_date', 'TEXT'), ('fibonacci100', 'REAL'),
+)
+
+# Date testuali 'MM.DD.YYYY HH:MM:SS' con la colonna generata ISO-8601
+# 'YYYY-MM-DD HH:MM:SS' (<colonna>_iso), ordinabile e confrontabile
+ISO_DATE_COLUMNS = ('entry_date', 'close_date', 'breakup_date')
+
+# Colonne generate epoch (secondi, data letta come UTC) indicizzate, usate
+# nelle query per ordinamenti e intervalli: colonna testuale -> colonna epoch
+EPOCH_COLUMNS = {
+    'entry_date': 'entry_ts',
+    'close_date': 'close_ts',
+    'breakup_date': 'breakup_ts',
+    'pattern_x1': 'pattern_x1_ts',
+}
+
+DATE_FORMAT = '%m.%d.%Y %H:%M:%S'
+ISO_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def iso_date_sql(column):
+    """Espressione SQL deterministica: data del bot in column in ISO-8601,
+    invariata se gia' ISO, NULL se vuota o in un altro formato."""
+    return (f"CASE WHEN {column} GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]*' "
+            f"THEN SUBSTR({column}, 7, 4) || '-' || SUBSTR({column}, 1, 2) || '-' || "
+            f"SUBSTR({column}, 4, 2) || SUBSTR({column}, 11) "
+            f"WHEN {column} GLOB '[0-9][0-9][0-9][0-9]-*' THEN {column} END")
+
+
+def to_epoch(date):
+    """Data del bot ('MM.DD.YYYY HH:MM:SS') o ISO in secondi epoch, come le
+    colonne *_ts; None se vuota o non riconosciuta."""
+    date = str(date or '')[:19]
+    for fmt in (DATE_FORMAT, ISO_FORMAT):
+        try:
+            return calendar.timegm(time.strptime(date, fmt))
+        except ValueError:
+            pass
+    return None
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute('PRAGMA table_xinfo(trades)')}
+
+
+def _v1_base(conn):
+    """Tabella storica a 25 colonne; aggiunge le colonne mancanti ai DB
+    creati con schemi precedenti (es. senza breakup_date / fibonacci100)."""
+    columns = ',\n'.join(f'"{name}" {sql_type}' for name, sql_type in TRADES_COLUMNS)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS trades (\n{columns}\n)')
+    existing = _columns(conn)
+    for name, sql_type in TRADES_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE trades ADD COLUMN "{name}" {sql_type}')
+
+
+def _v2_iso_columns(conn):
+    """Colonne ISO generate (<colonna>_iso), aggiunte in coda: le 25
+    colonne storiche restano alle posizioni 0-24, per il motore BT e i
+    lettori posizionali (INSERT a 25 valori, SELECT * per indice). Come
+    chiave si usa il rowid implicito."""
+    for name in ISO_DATE_COLUMNS:
+        conn.execute(f'ALTER TABLE trades ADD COLUMN {name}_iso TEXT '
+                     f'GENERATED ALWAYS AS ({iso_date_sql(name)}) VIRTUAL')
+
+
+def _v3_indexes(conn):
+    """Indici delle ricerche del bot: trade aperti della coppia (pair,
+    status, trade_type), chiusi per data (pair, close_date) e per pattern
+    (pair, pattern_x1)."""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_status_type ON trades(pair, status, trade_type)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_close_date ON trades(pair, close_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_pattern_x1 ON trades(pair, pattern_x1)')
+
+
+def _v4_epoch_columns(conn):
+    """Colonne epoch generate (EPOCH_COLUMNS) e loro indici, al posto
+    dell'indice testuale su close_date: nessun backfill da scrivere, i
+    valori delle righe esistenti sono calcolati da SQLite (anche per le
+    righe scritte dal motore BT, che conosce solo le date testuali) e
+    materializzati negli indici."""
+    for column, ts in EPOCH_COLUMNS.items():
+        iso = f'{column}_iso' if column in ISO_DATE_COLUMNS else iso_date_sql(column)
+        conn.execute(f"ALTER TABLE trades ADD COLUMN {ts} INTEGER "
+                     f"GENERATED ALWAYS AS (CAST(strftime('%s', {iso}) AS INTEGER)) VIRTUAL")
+    conn.execute('DROP INDEX IF EXISTS idx_trades_pair_close_date')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_close_ts ON trades(pair, close_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_close_ts ON trades(close_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_entry_ts ON trades(entry_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_trades_pair_pattern_x1_ts ON trades(pair, pattern_x1_ts)')
+
+
+def _v5_legacy_layout(conn):
+    """Ripara i DB migrati con la v2 precedente, che ricostruiva trades con
+    la chiave primaria id in prima posizione (INSERT a 25 valori del motore
+    BT rifiutati, colonne spostate per i lettori posizionali): la tabella
+    viene ricostruita con le 25 colonne storiche in testa, id torna rowid
+    implicito (stessi valori) e colonne generate e indici delle v2-v4 sono
+    ricreati. Nessuna modifica per i DB senza id."""
+    if 'id' not in _columns(conn):
+        return
+    names = ', '.join(f'"{name}"' for name, _ in TRADES_COLUMNS)
+    columns = ',\n'.join(f'"{name}" {sql_type}' for name, sql_type in TRADES_COLUMNS)
+    conn.execute(f'CREATE TABLE trades_v5 (\n{columns}\n)')
+    conn.execute(f'INSERT INTO trades_v5 (rowid, {names}) SELECT id, {names} FROM trades')
+    conn.execute('DROP TABLE trades')
+    conn.execute('ALTER TABLE trades_v5 RENAME TO trades')
+    _v2_iso_columns(conn)
+    _v3_indexes(conn)
+    _v4_epoch_columns(conn)
+
+
+MIGRATIONS = [
+    _v1_base,
+    _v2_iso_columns,
+    _v3_indexes,
+    _v4_epoch_columns,
+    _v5_legacy_layout,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """Versione dello schema di trades, 0 se la tabella non c'e' (anche se
+    e' stata cancellata dopo una migrazione, es. drop_all_tables)."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trades'").fetchone()
+    return conn.execute('PRAGMA user_version').fetchone()[0] if exists else 0
+
+
+def migrate(conn, create=True):
+    """
+    Porta trades del DB di conn all'ultima versione (SCHEMA_VERSION).
+    create False: non crea la tabella se non c'e' (DB che non sono del
+    bot, es. i .db elencati dall'API). conn non deve avere una transazione
+    aperta. Ritorna la versione trovata all'inizio.
+    """
+    start = schema_version(conn)
+    if not create and start == 0 and not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trades'").fetchone():
+        return start
+    while True:
+        # BEGIN IMMEDIATE: un solo processo alla volta migra, gli altri
+        # attendono e rileggono la versione
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                return start
+            MIGRATIONS[version](conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test di update_kijun_state (kijun.KijunState) contro calculate_kijun.
+
+La Kijun incrementale deve restituire lo stesso dict della calcolata
+sull'intera storia anche quando lo stato salvato non copre tutta la storia:
+stato costruito da una storia piu' corta, finestra di fetch piu' ampia,
+valori tagliati da max_bars.
+"""
+
+import math
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kijun import KIJUN_PERIOD, KijunState, calculate_kijun, history_arrays, update_kijun_state
+
+print("=" * 60)
+print("  TEST KIJUN INCREMENTALE")
+print("=" * 60)
+
+
+def make_history(n, start=datetime(2024, 1, 1, 1)):
+    history = []
+    for i in range(n):
+        mid = 1.1 + 0.01 * math.sin(i / 7.0) + 0.0001 * i
+        history.append({
+            'Date': (start + timedelta(hours=4 * i)).strftime('%m.%d.%Y %H:%M:%S'),
+            'BidHigh': mid + 0.002 + 0.001 * math.cos(i),
+            'BidLow': mid - 0.002 - 0.001 * math.sin(i),
+        })
+    return history
+
+
+failures = 0
+
+
+def check(name, history, state_path):
+    global failures
+    expected = calculate_kijun(history, KIJUN_PERIOD)
+    got = update_kijun_state(history, KIJUN_PERIOD, state_path)
+    if dict(got) != dict(expected):
+        failures += 1
+        print(f"   FAIL {name}: {len(got)} chiavi, attese {len(expected)}")
+    else:
+        print(f"   {name}: {len(got)} chiavi OK")
+
+
+history = make_history(401)
+with tempfile.TemporaryDirectory() as tmp:
+    print("\n1. Stato da 100 candele, poi storia da 401...")
+    path = os.path.join(tmp, 'short.npz')
+    check('100 candele', history[:100], path)
+    check('401 candele', history, path)
+
+    print("\n2. Aggiornamento candela per candela...")
+    path = os.path.join(tmp, 'append.npz')
+    check('300 candele', history[:300], path)
+    for n in (301, 302, 350, 401):
+        check(f'{n} candele', history[:n], path)
+
+    print("\n3. Stato tagliato da max_bars...")
+    path = os.path.join(tmp, 'trimmed.npz')
+    state = KijunState(KIJUN_PERIOD, max_bars=50)
+    state.sync(*history_arrays(history[:200]))
+    state.save(path)
+    check('401 candele', history, path)
+
+print(f"\n{failures} differenze")
+if failures:
+    sys.exit(1)
+print("   OK")
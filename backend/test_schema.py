@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test delle migrazioni di trades (schema.py) su un DB con lo schema storico.
+
+Dopo la migrazione le 25 colonne storiche restano alle posizioni 0-24 (le
+colonne generate sono in coda) e un INSERT posizionale a 25 valori, come
+quelli del motore BT, deve funzionare. La chiusura al target di un trade
+FULL con il suo PARTIAL (db_utils.update_trade_closed) deve dare R:R e
+profitto del FULL al FULL e 1 al PARTIAL. Un DB migrato con la vecchia v2
+(id in prima posizione) deve tornare allo schema storico con gli stessi
+rowid.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db_utils
+from schema import (ISO_DATE_COLUMNS, SCHEMA_VERSION, TRADES_COLUMNS, _v3_indexes, _v4_epoch_columns,
+                    iso_date_sql, migrate, schema_version)
+
+print("=" * 60)
+print("  TEST SCHEMA TRADES")
+print("=" * 60)
+
+tmp = tempfile.TemporaryDirectory()
+db_utils.DB_PATH = os.path.join(tmp.name, 'legacy.db')
+
+failures = 0
+
+
+def check(name, got, expected):
+    global failures
+    if got != expected:
+        failures += 1
+        print(f"   FAIL {name}: {got!r}, atteso {expected!r}")
+    else:
+        print(f"   {name}: {got!r} OK")
+
+
+PAIR = 'EUR/USD'
+ENTRY_DATE = '01.02.2024 13:00:00'
+
+print("\n1. DB con lo schema storico (senza id) e un FULL + PARTIAL in corso...")
+conn = sqlite3.connect(db_utils.DB_PATH)
+columns = ', '.join(f'"{name}" {sql_type}' for name, sql_type in TRADES_COLUMNS)
+conn.execute(f'CREATE TABLE trades ({columns})')
+for trade_type in ('FULL', 'PARTIAL'):
+    conn.execute("""INSERT INTO trades (pair, status, trade_type, entry_date, entry_price,
+                    entry_price_index, stop_loss, target, direction, initial_risk_reward)
+                    VALUES (?, 'IN PROGRESS', ?, ?, 1.0, 10, 0.99, 1.04, 'LONG', 4)""",
+                 (PAIR, trade_type, ENTRY_DATE))
+conn.commit()
+conn.close()
+
+print("\n2. Migrazione...")
+db_utils.initialize_db()
+check('versione', schema_version(db_utils.get_connection()), SCHEMA_VERSION)
+row = db_utils.check_in_progress_trade(PAIR)
+names = [name for name, _ in TRADES_COLUMNS]
+check('colonne 0-24', list(row.keys())[:len(names)], names)
+check('trade_type per nome', row['trade_type'], 'FULL')
+with db_utils.transaction() as c:
+    c.execute(f"INSERT INTO trades VALUES ({', '.join('?' * len(names))})",
+              ['GBP/USD', 'CLOSED'] + [None] * (len(names) - 2))
+    c.execute("DELETE FROM trades WHERE pair = 'GBP/USD'")
+    check('INSERT a 25 valori', c.rowcount, 1)
+
+print("\n3. Chiusura al target del FULL (R:R 4)...")
+db_utils.update_trade_closed(PAIR, 'TARGET', 'FULL', '01.03.2024 09:00:00', 4.0)
+with db_utils.transaction(sqlite3.Row) as c:
+    c.execute("SELECT * FROM trades WHERE pair = ?", (PAIR,))
+    trades = {row['trade_type']: row for row in c.fetchall()}
+for trade_type, rr, profit in (('FULL', 4.0, '4.0'), ('PARTIAL', 1, '1')):
+    trade = trades[trade_type]
+    check(f'{trade_type} status', trade['status'], 'CLOSED')
+    check(f'{trade_type} final_risk_reward', trade['final_risk_reward'], rr)
+    check(f'{trade_type} profit', trade['profit'], profit)
+
+print("\n4. DB migrato con la vecchia v2 (id in prima posizione)...")
+path = os.path.join(tmp.name, 'old_v2.db')
+conn = sqlite3.connect(path)
+columns = ', '.join(f'"{name}" {sql_type}' for name, sql_type in TRADES_COLUMNS)
+generated = ', '.join(f'{name}_iso TEXT GENERATED ALWAYS AS ({iso_date_sql(name)}) VIRTUAL'
+                      for name in ISO_DATE_COLUMNS)
+conn.execute(f'CREATE TABLE trades (id INTEGER PRIMARY KEY, {columns}, {generated})')
+conn.execute("INSERT INTO trades (id, pair, entry_date) VALUES (7, ?, ?)", (PAIR, ENTRY_DATE))
+_v3_indexes(conn)
+_v4_epoch_columns(conn)
+conn.execute('PRAGMA user_version = 4')
+conn.commit()
+migrate(conn)
+check('versione', schema_version(conn), SCHEMA_VERSION)
+conn.row_factory = sqlite3.Row
+row = conn.execute('SELECT rowid, * FROM trades').fetchone()
+check('colonne 0-24', list(row.keys())[1:len(names) + 1], names)
+check('id', 'id' in row.keys(), False)
+check('rowid', row['rowid'], 7)
+check('entry_ts', row['entry_ts'], 1704200400)
+conn.close()
+
+print(f"\n{failures} differenze")
+if failures:
+    sys.exit(1)
+print("   OK")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test di trade_manager.manage_trade con resume (loop live).
+
+Il PARTIAL si chiude al target 1:1 su una candela M15 non ancora confermata
+(dopo l'apertura dell'ultima candela H4): il DB ha gia' lo stop loss del FULL
+a break even, lo stato salvato del TradeManager deve ripartire da li'. Al
+ciclo successivo quella candela e' confermata e una candela con il minimo
+tra lo stop loss originale e il break even deve chiudere il trade in stop
+loss, come la scansione completa di process_trades_LONG.
+"""
+
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+import db_utils
+from candles import DATE_FORMAT
+
+print("=" * 60)
+print("  TEST TRADE MANAGER (RESUME)")
+print("=" * 60)
+
+tmp = tempfile.TemporaryDirectory()
+db_utils.DB_PATH = os.path.join(tmp.name, 'test.db')
+db_utils.initialize_db()
+db_utils.initialize_activity_logs_db()
+db_utils.initialize_signals_db()
+db_utils.initialize_trade_managers_db()
+
+import trade_manager
+
+PAIR = 'EUR/USD'
+ENTRY = 1.0
+INITIAL_SL = 0.99
+TARGET = 1.05           # Kijun H4: R:R 5, target 1:1 a 1.01
+ZONE = 0.5              # zone D1/H4 lontane: mai rotte
+START = datetime(2024, 1, 1, 13)
+
+
+def date_str(dt):
+    return dt.strftime(DATE_FORMAT)
+
+
+def m15_history(lows, highs):
+    history = []
+    for i, (low, high) in enumerate(zip(lows, highs)):
+        history.append({'Date': date_str(START + timedelta(minutes=15 * i)),
+                        'BidOpen': 1.003, 'BidHigh': high, 'BidLow': low, 'BidClose': 1.003,
+                        'Volume': 0})
+    return history
+
+
+def h4_history(last):
+    history = []
+    dt = START
+    while dt <= last:
+        history.append({'Date': date_str(dt), 'BidOpen': 1.003, 'BidHigh': 1.005,
+                        'BidLow': 1.002, 'BidClose': 1.003, 'Volume': 0})
+        dt += timedelta(hours=4)
+    return history
+
+
+def run_cycle(history_15, history_H4, history_DLY):
+    kijun_h4 = {pd.to_datetime(candle['Date'], format=DATE_FORMAT): TARGET for candle in history_H4}
+    full = db_utils.check_in_progress_trade(PAIR)
+    initial_sl = db_utils.get_stop_loss(PAIR, full['entry_date'])
+    return trade_manager.manage_trade('LONG', history_DLY, ZONE, history_15, PAIR,
+                                      full['entry_price_index'] + 1, kijun_h4, full['stop_loss'],
+                                      initial_sl, full['entry_price'], full['target'], ZONE,
+                                      history_H4, full['entry_date'], resume=True)
+
+
+with db_utils.transaction() as c:
+    for trade_type in ('FULL', 'PARTIAL'):
+        c.execute("""INSERT INTO trades (pair, status, trade_type, entry_date, entry_price,
+                     entry_price_index, stop_loss, target, direction, initial_risk_reward)
+                     VALUES (?, 'IN PROGRESS', ?, ?, ?, 0, ?, ?, 'LONG', 5)""",
+                  (PAIR, trade_type, date_str(START), ENTRY, INITIAL_SL, TARGET))
+
+# candela D1 in formazione aperta alle 22:00, H4 alle 13/17/21
+history_DLY = [{'Date': date_str(START - timedelta(hours=15)), 'BidClose': 1.003},
+               {'Date': date_str(START + timedelta(hours=9)), 'BidClose': 1.003}]
+
+failures = 0
+
+
+def check(name, got, expected):
+    global failures
+    if got != expected:
+        failures += 1
+        print(f"   FAIL {name}: {got!r}, atteso {expected!r}")
+    else:
+        print(f"   {name}: {got!r} OK")
+
+
+print("\n1. Ciclo 1: target 1:1 sulla candela delle 21:15 (non confermata)...")
+lows = [1.002] * 34
+highs = [1.005] * 33 + [1.012]
+history_15 = m15_history(lows, highs)
+closed, _ = run_cycle(history_15, h4_history(START + timedelta(hours=8)), history_DLY)
+check('chiuso', closed, False)
+check('PARTIAL in corso', db_utils.get_partial_trade(PAIR), None)
+check('stop loss FULL', db_utils.check_in_progress_trade(PAIR)['stop_loss'], ENTRY)
+state = json.loads(db_utils.get_trade_manager_state(PAIR)[1])['state']
+check('stop loss salvato', state['stop_loss'], ENTRY)
+
+print("\n2. Ciclo 2: minimo a 0.995 alle 21:30, ora confermata...")
+lows = lows + [0.995] + [1.002] * 16
+highs = highs + [1.005] * 17
+history_15 = m15_history(lows, highs)
+closed, enddate = run_cycle(history_15, h4_history(START + timedelta(hours=12)), history_DLY)
+check('chiuso', closed, True)
+check('chiusura', enddate, history_15[34]['Date'])
+check('FULL in corso', db_utils.check_in_progress_trade(PAIR), None)
+with db_utils.transaction() as c:
+    c.execute("SELECT result FROM trades WHERE pair = ? AND trade_type = 'FULL'", (PAIR,))
+    check('risultato FULL', c.fetchone()[0], 'STOP LOSS')
+
+db_utils.flush_activity_logs()
+print(f"\n{failures} differenze")
+if failures:
+    sys.exit(1)
+print("   OK")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test golden di get_zones (zones.detect_zones, zones.compute_zones_for_range).
+
+test_data/zones_golden.json contiene storie D1/H4 registrate e, per un
+campione di indici, l'output (zones_rectX1, zones_rectX2, zones_rectY1,
+zones_rectY2, final_zones, zone_type) della vecchia scansione all'indietro
+candela per candela: la versione su array e la passata unica su tutti gli
+index devono restituire le stesse liste. Per le zone finali contiene anche
+l'esito della vecchia validate_support / validate_resistence.
+"""
+
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from candles import CandleSeries
+from kijun import calculate_kijun
+import utils
+from zones import compute_zones_for_range, detect_zone_sets, detect_zones
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data', 'zones_golden.json')
+
+print("=" * 60)
+print("  TEST GOLDEN ZONE D1/H4")
+print("=" * 60)
+
+with open(GOLDEN_PATH) as f:
+    golden = json.load(f)
+
+histories = {}
+for timerange, columns in golden['histories'].items():
+    histories[timerange] = CandleSeries(columns['ts'], columns['open'], columns['high'],
+                                        columns['low'], columns['close'],
+                                        [0] * len(columns['ts']))
+kijun_h4 = calculate_kijun(histories['H4'], golden['kijun_period'])
+plain_kijun = dict(kijun_h4)
+records = {timerange: history.to_records() for timerange, history in histories.items()}
+
+# get_zones scrive nel log attivita': non serve per il confronto
+utils.log_trader = lambda *args, **kwargs: None
+
+# compute_zones_for_range: una sola passata su tutti gli index
+sweeps = {timerange: compute_zones_for_range(history, kijun_h4, 0, len(history), timerange)
+          for timerange, history in histories.items()}
+
+failures = 0
+for n, case in enumerate(golden['cases']):
+    timerange = case['timerange']
+    index = case['index']
+    expected = tuple(case['expected'])
+
+    results = {
+        'get_zones': utils.get_zones(histories[timerange], kijun_h4, index, timerange, 'Trade', None),
+        'detect_zones': detect_zones(histories[timerange], kijun_h4, index, timerange),
+        'compute_zones_for_range': sweeps[timerange][index],
+    }
+    zone_sets, zone_type = detect_zone_sets(histories[timerange], kijun_h4, index, timerange)
+    if zone_type is not None:
+        results['detect_zone_sets'] = zone_sets[zone_type] + (zone_type,)
+    # ogni tanto anche con la lista di dict e con la Kijun come dict semplice
+    if n % 10 == 0:
+        results['records'] = detect_zones(records[timerange], kijun_h4, index, timerange)
+        results['plain_kijun'] = detect_zones(histories[timerange], plain_kijun, index, timerange)
+
+    for name, result in results.items():
+        if tuple(result) != expected:
+            failures += 1
+            print(f"   FAIL {name} {timerange} index={index}")
+            print(f"      expected: {expected}")
+            print(f"      got:      {tuple(result)}")
+
+# validate_support / validate_resistence sulle zone finali dei casi
+cases = {(case['timerange'], case['index']): case['expected'] for case in golden['cases']}
+for check in golden['validations']:
+    timerange = check['timerange']
+    index = check['index']
+    zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, _, zone_type = cases[(timerange, index)]
+    validate = utils.validate_support if zone_type == 'SUP' else utils.validate_resistence
+    z = check['zone']
+    last_candle, zone_valid, zone_validated, anchor = validate(
+        zones_rectX1[z], zones_rectX2[z], zones_rectY1[z], zones_rectY2[z],
+        histories[timerange][:index + 1], timerange, kijun_h4, 'TEST', 'Trade')
+    result = [last_candle['Date'] if len(last_candle) else None, zone_valid, zone_validated, anchor]
+    if result != check['expected']:
+        failures += 1
+        print(f"   FAIL {validate.__name__} {timerange} index={index} zone={z}")
+        print(f"      expected: {check['expected']}")
+        print(f"      got:      {result}")
+
+print(f"\n{len(golden['cases'])} casi, {len(golden['validations'])} validazioni, {failures} differenze")
+if failures:
+    sys.exit(1)
+print("   OK")
@@ -0,0 +1,316 @@
+"""
+Gestione del trade in corso (motore di process_trades_LONG / process_trades_SHORT).
+
+Dalla candela M15 dopo l'entry TradeManager segue il trade candela per
+candela: target alla Kijun H4 della candela con il relativo R:R, chiusura al
+target o allo stop loss, chiusura del PARTIAL al target 1:1 con stop loss a
+break even, stop loss alzato sui target parziali (get_rr_range), target o
+stop loss all'entry se la candela D1 in formazione o l'ultima candela H4
+chiusa tornano oltre la zona. LONG e SHORT usano la stessa macchina con i
+confronti di breakout.DIRECTIONS.
+
+Le scritture passano da TradeWrites, che salta quelle identiche all'ultima
+fatta (il target cambia solo con la Kijun H4, non a ogni candela) e le tiene
+in coda: target e stop loss sono sovrascritti in coda dall'ultimo valore e
+applicati in una sola transazione (db_utils.apply_trade_updates) alla fine
+del replay o prima di un cambio di stato (PARTIAL, zona rotta). Lo stato
+finale dei trade sul DB e' lo stesso di una scrittura per candela.
+
+Con resume (loop live) lo stato del trade e' salvato nella tabella
+trade_managers (db_utils) fino all'ultima candela confermata, cioe'
+precedente sia all'ultima candela H4 (Kijun definitiva) sia alla candela D1
+in formazione (il controllo D1 guarda la sua chiusura corrente); le candele
+piu' recenti si rigiocano a ogni ciclo su una copia dello stato, come in
+pattern_tracker.py. Le transizioni con effetti che non si annullano (stop
+loss spostato, PARTIAL chiuso, zona rotta, chiusura) su una candela non
+confermata portano lo stato salvato fino a quella candela, come fa
+entry_price_index sul DB: il ciclo successivo non la rigioca con lo stop
+loss precedente. Il lavoro per ciclo dipende dalle candele nuove e non
+dall'eta' del trade. Lo stato e' salvato nella stessa transazione delle
+scritture in coda: un'interruzione a meta' replay non lascia il trade avanti
+rispetto allo stato (o viceversa), il ciclo successivo rigioca le stesse
+candele.
+"""
+
+import calendar
+import json
+import time
+
+import numpy as np
+
+from breakout import DIRECTIONS
+from candles import DATE_FORMAT
+from db_utils import (
+    apply_trade_updates, update_trade_target_ALL, get_partial_trade, get_partial_trade_closed,
+    close_mt5_partial_positions, get_trade_manager_state
+)
+from kijun import kijun_keys, lower_kijun_h4_series
+from patterns import pattern_columns
+from utils import calculate_risk_reward_ratio, get_rr_range, get_H4BidClose, _to_dt
+
+_STATE_FIELDS = ('stop_loss', 'target_price', 'target_1_1', 'risk_reward', 'partial_target',
+                 'dly_broken', 'h4_broken', 'closed', 'last_ts')
+
+
+class TradeWrites:
+    """Scritture del trade (tabella trades e MT5) come unita' di lavoro.
+    Quelle identiche all'ultima fatta sono saltate; target e stop loss
+    restano in coda (l'ultimo valore sostituisce i precedenti) fino a flush.
+    written: ultime scritture ancora valide.
+    changes: transizioni che non si annullano rigiocando la candela (stop
+    loss, target all'entry, PARTIAL o FULL chiusi)."""
+
+    def __init__(self, pair, written=None):
+        self.pair = pair
+        self.written = dict(written or {})
+        self.pending = []
+        self.changes = 0
+
+    def _queue(self, update):
+        # un target (stop loss) successivo sovrascrive tutte le colonne del
+        # precedente: basta l'ultimo, nella posizione dell'ultimo
+        self.pending = [p for p in self.pending if p[0] != update[0]]
+        self.pending.append(update)
+
+    def target(self, target_price, risk_reward):
+        if self.written.get('target') == [target_price, risk_reward]:
+            return
+        self._queue(('target', target_price, risk_reward))
+        self.written.pop('all', None)
+        self.written['target'] = [target_price, risk_reward]
+
+    def stop_loss(self, stop_loss, index, risk_reward):
+        # entry_price_index e' l'indice di partenza del ciclo successivo
+        if self.written.get('stop_loss') == [stop_loss, index, risk_reward]:
+            return
+        self._queue(('stop_loss', stop_loss, int(index), risk_reward))
+        self.changes += 1
+        # final_risk_reward sovrascritto: il target va riscritto
+        self.written.pop('target', None)
+        self.written.pop('all', None)
+        self.written['stop_loss'] = [stop_loss, int(index), risk_reward]
+
+    def target_all(self, entry_price, risk_reward):
+        if self.written.get('all') == [entry_price, risk_reward]:
+            return
+        # SL o TP delle posizioni MT5 spostati all'entry dopo le modifiche in coda
+        self.flush()
+        update_trade_target_ALL(self.pair, entry_price, risk_reward)
+        self.written = {'all': [entry_price, risk_reward]}
+        self.changes += 1
+
+    def partial_closed(self, close_date):
+        """PARTIAL chiuso al target 1:1: scritto subito (get_partial_trade
+        delle candele successive deve vederlo chiuso)."""
+        self.pending.append(('closed', 'TARGET', 'PARTIAL', close_date, 1))
+        self.changes += 1
+        self.flush()
+        close_mt5_partial_positions(self.pair)
+
+    def closed(self, result, close_date, risk_reward):
+        """Chiusura del FULL: ultima scrittura del trade, applicata da flush."""
+        self.pending.append(('closed', result, 'FULL', close_date, risk_reward))
+        self.changes += 1
+
+    def flush(self, trade_key=None, state=None):
+        """Applica le scritture in coda, con lo stato JSON del TradeManager
+        se dato, in una sola transazione."""
+        if self.pending or state is not None:
+            apply_trade_updates(self.pair, self.pending, trade_key, state)
+        self.pending = []
+
+
+class TradeManager:
+    def __init__(self, direction, pair, entry_price, initial_sl, stop_loss, tp,
+                 zone_rectY1_DLY, zone_rectY1_H4, entry_date):
+        self.direction = DIRECTIONS[direction]
+        self.pair = pair
+        self.entry_price = entry_price
+        self.initial_sl = initial_sl
+        self.zone_rectY1_DLY = zone_rectY1_DLY
+        self.zone_rectY1_H4 = zone_rectY1_H4
+        self.entry_date = entry_date
+        self.stop_loss = stop_loss
+        self.target_price = tp
+        self.target_1_1 = self.direction.target_price(entry_price, stop_loss, 1)
+        self.risk_reward = None
+        self.partial_target = []
+        self.dly_broken = False
+        self.h4_broken = False
+        self.closed = False
+        self.last_ts = None         # ultima candela consumata (epoch)
+
+    def on_bar(self, index, candle, kijun, history_DLY, history_H4, kijun_h4, writes, ts=None):
+        """Consuma la candela M15 index con la sua Kijun H4 di riferimento.
+        Ritorna True se il trade si e' chiuso (target o stop loss)."""
+        if ts is not None:
+            self.last_ts = int(ts)
+        d = self.direction
+        pair = self.pair
+        entry_price = self.entry_price
+        date = candle['Date']
+        if not self.dly_broken and not self.h4_broken:
+            self.target_price = kijun
+            self.risk_reward = calculate_risk_reward_ratio(entry_price, self.target_price, self.initial_sl)
+            self.partial_target = get_rr_range(self.risk_reward)
+
+        if d.reaches(candle[d.extreme], self.target_price):
+            print('target reached: '+str(candle[d.extreme]))
+            writes.closed('TARGET', date, self.risk_reward)
+            self.closed = True
+            return True
+
+        elif d.reaches(self.stop_loss, candle[d.back]):
+            print('stop loss reached: '+str(candle[d.back]))
+            pt = get_partial_trade_closed(pair, self.entry_date)
+            if pt and pt['stop_loss'] != self.stop_loss:
+                rr = calculate_risk_reward_ratio(pt['entry_price'], self.stop_loss, pt['stop_loss'])
+                writes.closed('STOP LOSS', date, rr)
+            else:
+                writes.closed('STOP LOSS', date, -1)
+            self.closed = True
+            return True
+
+        elif d.reaches(candle[d.extreme], self.target_1_1):
+            if get_partial_trade(pair):
+                # Update stoploss to entry price
+                writes.stop_loss(entry_price, index, 0)
+                self.stop_loss = entry_price
+                # Set 'close' to pair from trades table
+                writes.partial_closed(date)
+
+        while self.partial_target:
+            partial_target_price = d.target_price(entry_price, self.initial_sl, self.partial_target[0])
+            if not d.reaches(candle[d.extreme], partial_target_price):
+                break
+            sl = d.target_price(entry_price, self.initial_sl, self.partial_target[0]-2)
+            writes.stop_loss(sl, index, self.partial_target[0]-2)
+            self.partial_target.pop(0)
+            self.stop_loss = sl
+
+        if not self.dly_broken and not self.h4_broken:
+            writes.target(self.target_price, self.risk_reward)
+
+        # check if DLY was broken
+        if history_DLY[-1]['Date'] == date and d.beyond(self.zone_rectY1_DLY, history_DLY[-1]['BidClose']):
+            print('******* DLY_broken: '+str(date))
+            self.dly_broken = True
+            self._zone_broken(history_DLY[-1]['BidClose'], writes)
+
+        # check if H4 was broken
+        if _to_dt(date) in kijun_h4.keys():
+            h4BidClose = get_H4BidClose(date, history_H4)
+            if h4BidClose is not None and d.beyond(self.zone_rectY1_H4, h4BidClose):
+                print('******* H4_broken: '+str(date))
+                self.h4_broken = True
+                self._zone_broken(h4BidClose, writes)
+        return False
+
+    def _zone_broken(self, close, writes):
+        """Zona D1/H4 rotta in chiusura: sotto l'entry (LONG) il target va
+        all'entry, altrimenti lo stop loss va a break even."""
+        self.risk_reward = 0
+        if self.direction.beyond(self.entry_price, close):
+            self.target_price = self.entry_price
+            self.target_1_1 = self.entry_price
+            self.partial_target = []
+        else:
+            self.stop_loss = self.entry_price
+        writes.target_all(self.entry_price, self.risk_reward)
+
+    def key(self):
+        """Chiave del trade nello stato salvato."""
+        return json.dumps([self.direction.name, self.entry_date, self.entry_price, self.initial_sl])
+
+    def to_state(self):
+        return {field: getattr(self, field) for field in _STATE_FIELDS}
+
+    def load_state(self, state):
+        for field in _STATE_FIELDS:
+            setattr(self, field, state[field])
+        self.partial_target = list(self.partial_target)
+
+    def copy(self):
+        manager = TradeManager(self.direction.name, self.pair, self.entry_price, self.initial_sl,
+                               self.stop_loss, self.target_price, self.zone_rectY1_DLY,
+                               self.zone_rectY1_H4, self.entry_date)
+        manager.load_state(self.to_state())
+        return manager
+
+
+def manage_trade(direction, history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4,
+                 stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date,
+                 resume=False):
+    """process_trades_LONG / process_trades_SHORT (direction 'LONG' o 'SHORT').
+    Con resume riprende lo stato salvato del trade e consuma solo le candele
+    nuove. Ritorna (Continue, enddate): Continue True se il trade si e'
+    chiuso, enddate la data dell'ultima candela consumata."""
+    # Kijun H4 di riferimento di ogni candela M15 (get_nearest_lower_kijun_h4)
+    kijun_m15 = lower_kijun_h4_series(history_15, kijun_h4)
+    manager = TradeManager(direction, pair, entry_price, initial_sl, stop_loss, tp,
+                           zone_rectY1_DLY, zone_rectY1_H4, entry_date)
+    n = len(history_15)
+    enddate = None
+
+    if not resume:
+        writes = TradeWrites(pair)
+        closed = False
+        for index in range(start_index, n):
+            enddate = history_15[index]['Date']
+            if manager.on_bar(index, history_15[index], kijun_m15[index], history_DLY, history_H4, kijun_h4, writes):
+                closed = True
+                break
+        writes.flush()
+        return closed, enddate
+
+    ts = pattern_columns(history_15)[0]
+    key = manager.key()
+    writes = TradeWrites(pair)
+    record = get_trade_manager_state(pair)
+    saved = None
+    if record is not None and record[0] == key:
+        saved = json.loads(record[1])
+        writes = TradeWrites(pair, saved['written'])
+        last_ts = saved['state']['last_ts']
+        pos = int(np.searchsorted(ts, last_ts)) if last_ts is not None else -1
+        if 0 <= pos < n and ts[pos] == last_ts:
+            manager.load_state(saved['state'])
+            start_index = pos + 1
+
+    # confermate: candele prima dell'ultima candela H4 (Kijun definitiva) e
+    # della candela D1 in formazione (il controllo D1 usa la sua chiusura)
+    confirmed = start_index
+    key_ts, _ = kijun_keys(kijun_h4)
+    if len(key_ts) and len(history_DLY):
+        dly_ts = calendar.timegm(time.strptime(history_DLY[-1]['Date'], DATE_FORMAT))
+        limit = min(int(key_ts[-1]), dly_ts)
+        confirmed = max(min(int(np.searchsorted(ts, limit)), n - 1), start_index)
+
+    closed = manager.closed
+    for index in range(start_index, confirmed):
+        if closed:
+            break
+        enddate = history_15[index]['Date']
+        closed = manager.on_bar(index, history_15[index], kijun_m15[index], history_DLY, history_H4, kijun_h4,
+                                writes, ts[index])
+
+    live = manager.copy()
+    for index in range(confirmed, n):
+        if closed:
+            break
+        enddate = history_15[index]['Date']
+        changes = writes.changes
+        closed = live.on_bar(index, history_15[index], kijun_m15[index], history_DLY, history_H4, kijun_h4,
+                             writes, ts[index])
+        if writes.changes != changes:
+            # il DB e MT5 sono gia' oltre questa candela: lo stato salvato
+            # riparte da qui
+            manager = live
+            live = manager.copy()
+
+    record = {'state': manager.to_state(), 'written': writes.written}
+    if record != saved:
+        writes.flush(key, json.dumps(record))
+    else:
+        writes.flush()
+    return closed, enddate
@@ -10,7 +10,11 @@ from datetime import datetime, timedelta, time
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
-from db_utils import update_trade_stoploss, update_trade_closed, get_partial_trade, update_trade_in_progress,close_trade_in_retest, upsert_order_waiting_retest, close_mt5_orders_already_processed, update_trade_target, update_trade_target_ALL, get_partial_trade_closed, close_mt5_partial_positions, fetch_trades_from_db, fetch_trades_from_mt5, mt5_place_order, mt5_close_order, mt5_close_positions, SIMULATION_MODE, log_mt5_signal, log_trader
+from candles import CandleSeries
+from kijun import lower_kijun_h4_series
+from zones import detect_zones, validate_zone
+from patterns import detect_pattern
+from db_utils import update_trade_in_progress,close_trade_in_retest, upsert_order_waiting_retest, close_mt5_orders_already_processed, update_trade_target, fetch_trades_from_db, fetch_trades_from_mt5, mt5_place_order, mt5_close_order, mt5_close_positions, SIMULATION_MODE, log_mt5_signal, log_trader
 
 # Import condizionale di MetaTrader5
 if not SIMULATION_MODE:
@@ -20,32 +24,20 @@ else:
 
 
 def format_history(hist, timeframe):
-    history = [] 
-    date_format = '%m.%d.%Y %H:%M:%S'
-
     #poichè i dati provengono da FXCM nel timeframe DLY rimuoviamo i sabati per far corrispondere i 
     #risultati con ciò che mostra tradingViews
-    if timeframe == 'DLY':
-        for row in hist:
-            formatted_date = pd.to_datetime(str(row['Date']))
-            if formatted_date.weekday() != 5:
-                formatted_date_str = formatted_date.strftime(date_format)
-                history.append({'Date': formatted_date_str, 'BidOpen': row['BidOpen'], 'BidHigh': row['BidHigh'], 'BidLow': row['BidLow'], 'BidClose': row['BidClose'], 'Volume': row['Volume']})
-    else:
-        for row in hist:
-            formatted_date = pd.to_datetime(str(row['Date'])).strftime(date_format)
-            history.append({'Date': formatted_date, 'BidOpen': row['BidOpen'], 'BidHigh': row['BidHigh'], 'BidLow': row['BidLow'], 'BidClose': row['BidClose'], 'Volume': row['Volume']})
-        
-
-    return history
+    # La serie e' colonnare (array NumPy) ma history[i]['Date'] / ['BidClose']
+    # continuano a funzionare come con la vecchia lista di dict
+    return CandleSeries.from_history(hist, drop_saturdays=(timeframe == 'DLY'))
 
 # ---------------------------------------------------------------------------
 # Ottimizzazione lookup (nessun cambio di semantica).
 # Le date dei dati FXCM sono stringhe immutabili in formato %m.%d.%Y %H:%M:%S:
 # il parse viene messo in cache e fatto con formato esplicito (pandas senza
 # formato "indovina" lo stesso formato a ogni chiamata, con costo enorme).
-# _KijunDict e' un dict {Timestamp: kijun} con indici precalcolati usati da
-# get_last_hour / get_nearest_lower_kijun_h4 al posto delle scansioni lineari.
+# _KijunDict (kijun.py) e' un dict {Timestamp: kijun} con indici precalcolati
+# usati da get_last_hour / get_nearest_lower_kijun_h4 al posto delle
+# scansioni lineari.
 # ---------------------------------------------------------------------------
 from bisect import bisect_left
 
@@ -69,33 +61,6 @@ def _strptime_mdy(date_str):
     return dt
 
 
-class _KijunDict(dict):
-    __slots__ = ('by_date', 'sorted_keys')
-
-
-def calculate_kijun(history, kijun_period):
-    kijun = _KijunDict()
-
-    for i in range(kijun_period, len(history)):
-        dt = _to_dt(history[i]["Date"])
-        kijun_value = 0
-        highestBidHigh = -100000
-        lowestBidLow = 100000
-        for j in range(i-kijun_period, i):
-            highestBidHigh = history[j]["BidHigh"] if history[j]["BidHigh"] > highestBidHigh else highestBidHigh
-            lowestBidLow = history[j]["BidLow"] if history[j]["BidLow"] < lowestBidLow else lowestBidLow
-
-        kijun_value =  (highestBidHigh + lowestBidLow) / 2
-        kijun[dt] = kijun_value
-
-    # Indici per lookup O(1)/O(log n): stessa semantica delle scansioni lineari
-    # (by_date: ultima chiave di ogni giorno, in ordine di inserimento)
-    kijun.by_date = {}
-    for _k in kijun.keys():
-        kijun.by_date[_k.date()] = _k
-    kijun.sorted_keys = sorted(kijun.keys())
-    return kijun
-
 def get_last_hour(kijun_h4, date_str):
     target_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').date()
     # Fast path: indice precalcolato (ultima chiave del giorno, poi giorno
@@ -191,406 +156,23 @@ def get_zones(history, kijun_h4, index, timerange, type, dlyZoneDate, str_instru
     2. Estensione fino a 7 candele consecutive
     3. Tracking dei Kijun touch per validazione
     4. Validazione finale che la zona non sia stata rotta
+
+    La scansione all'indietro e' in zones.detect_zones (su array, stesso output);
+    zones.detect_zone_sets restituisce insieme le zone SUP e RES.
     """
-    lastclosearray = []
-    zones_rectX1 = []
-    zones_rectX2 = []
-    zones_rectY1 = []
-    zones_rectY2 = []
-    final_zones = []
-    zone = 0
-    zone_type = None
-
-    log_trader(f'history[index]: {history[index]}', pair=str_instrument)
-    log_trader(f'timerange: {timerange}', pair=str_instrument)
-
-    dt = _to_dt(history[index]["Date"])
-   
-    # Add one day to the datetime object to adjust the history daily error
-    if timerange == 'DLY':
-        dt = dt + timedelta(days=1)
-
-    dt_str = get_last_hour(kijun_h4, dt.strftime('%Y-%m-%d %H:%M:%S'))
-    
+    log_trader('history[index]: %s', history[index], pair=str_instrument)
+    log_trader('timerange: %s', timerange, pair=str_instrument)
+
     if type == 'BTLOG':
         print('i: '+str(index))
-    
-    if dt_str in kijun_h4 and history[index]["BidClose"] < kijun_h4[dt_str]: 
-        zone_type = 'SUP'           
-        lastclosearray.clear()
-        zones_rectX1.clear()
-        zones_rectX2.clear()
-        zones_rectY1.clear()
-        zones_rectY2.clear()
-
-        rectY2 = 0
-        
-        # Tracking dei Kijun touch (come nel PineScript)
-        high_kijun_touch = []
-        kijun_touch = False
-
-        zone_datetime = _strptime_mdy(history[index-1]['Date'])
-        zone_date = zone_datetime.date()
-        try:
-            zone_last_date = zone_date.replace(year=zone_date.year - 1)
-        except ValueError:
-            if zone_date.month == 2 and zone_date.day == 29:
-                zone_last_date = zone_date.replace(year=zone_date.year - 1, day=28)
-            else:
-                raise
-
-        for i in range(index-1, -1, -1):
-            history_date_datetime = _strptime_mdy(history[i]['Date'])
-            history_date_date = history_date_datetime.date()
-
-            if history_date_date < zone_last_date:
-                break
-            
-            # Ottieni il valore del Kijun per questa candela
-            candle_dt = _to_dt(history[i]["Date"])
-            if timerange == 'DLY':
-                candle_dt = candle_dt + timedelta(days=1)
-            candle_dt_str = get_last_hour(kijun_h4, candle_dt.strftime('%Y-%m-%d %H:%M:%S'))
-            
-            # Check Kijun touch (come nel PineScript): high >= kijun o high[i-1] >= kijun
-            if candle_dt_str in kijun_h4:
-                kijun_value = kijun_h4[candle_dt_str]
-                high_condition = False
-                if i == index - 1:
-                    high_condition = history[i]['BidHigh'] >= kijun_value
-                else:
-                    high_condition = (history[i]['BidHigh'] >= kijun_value or 
-                                     history[i+1]['BidHigh'] >= kijun_value)
-                
-                if high_condition:
-                    kijun_touch = True
-                    high_kijun_touch.append(history[i]['BidHigh'])
-
-            lastclosearray.append(history[i]['BidClose'])
-            
-            # Calcolo minlow con controllo i+1 (come nel PineScript)
-            # log_trader(f'history[i][BidLow]: {history[i]["BidLow"]}', pair=str_instrument)
-            #log_trader(f'history[i+1][BidLow]: {history[i+1]["BidLow"]}', pair=str_instrument)
-            
-            if i == index - 1:
-                minlow = history[i]['BidLow']
-            else:
-                minlow = min(history[i]['BidLow'], history[i+1]['BidLow'])
-
-            # Pattern basato su Close consecutivi (gap management) - come nel PineScript
-            # sup_condition = close[i+1] >= close[i] and close[i] < close[i-1]
-            sup_condition = False
-            if i > 0 and i < index - 1:
-                sup_condition = (history[i+1]['BidClose'] >= history[i]['BidClose'] and 
-                                history[i]['BidClose'] < history[i-1]['BidClose'])
-            
-            if sup_condition:
-                # Estensione fino a 7 candele consecutive (come nel PineScript zone_3_candles)
-                if i >= 2 and history[i+2]['BidClose'] > history[i+1]['BidClose']:
-                    minlow = min(history[i+1]['BidLow'], history[i]['BidLow'], history[i-1]['BidLow'])
-                    
-                    if i >= 3 and i + 3 <= index and history[i+3]['BidClose'] > history[i+2]['BidClose']:
-                        minlow = min(history[i+2]['BidLow'], minlow)
-                        
-                        if i >= 4 and i + 4 <= index and history[i+4]['BidClose'] > history[i+3]['BidClose']:
-                            minlow = min(history[i+3]['BidLow'], minlow)
-                            
-                            if i >= 5 and i + 5 <= index and history[i+5]['BidClose'] > history[i+4]['BidClose']:
-                                minlow = min(history[i+4]['BidLow'], minlow)
-                                
-                                if i >= 6 and i + 6 <= index and history[i+6]['BidClose'] > history[i+5]['BidClose']:
-                                    minlow = min(history[i+5]['BidLow'], minlow)
-                                    
-                                    if i >= 7 and i + 7 <= index and history[i+7]['BidClose'] > history[i+6]['BidClose']:
-                                        minlow = min(history[i+6]['BidLow'], minlow)
-                
-                # Validazione con Kijun touch (come nel PineScript)
-                safe_last_close = min(lastclosearray) if lastclosearray else None
-                safe_high_kijun = high_kijun_touch[0] if high_kijun_touch else None
-                
-                if safe_last_close is not None and safe_high_kijun is not None:
-                    # Condizione: minlow < min(lastclosearray) AND kijun_touch AND not single touch on current candle
-                    if (minlow < safe_last_close and kijun_touch and 
-                        not (len(high_kijun_touch) == 1 and history[i]['BidHigh'] == safe_high_kijun)):
-                        
-                        rectX1 = history[i+1]["Date"]
-                        rectX2 = i
-                        rectY1 = minlow
-                        rectY2 = history[i]['BidClose']
-
-                        zones_rectX1.append(rectX1)
-                        zones_rectX2.append(rectX2)
-                        zones_rectY1.append(rectY1)
-                        zones_rectY2.append(rectY2)
-                        
-                        # Clear lastclosearray dopo aver trovato una zona (come nel PineScript)
-                        lastclosearray.clear()
 
-        zones_rectX1.reverse()
-        zones_rectX2.reverse()
-        zones_rectY1.reverse()
-        zones_rectY2.reverse()
+    zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones, zone_type = detect_zones(history, kijun_h4, index, timerange)
 
-        final_zones.clear()
-        zone = 0
-        
-        for i in range(len(zones_rectY2)):
-            if i == len(zones_rectY2)-1:
-                if zone not in final_zones:
-                    final_zones.append(zone)
-                break
-
-            if zones_rectY2[i+1] < zones_rectY1[zone]:
-                zone = i+1
-                while len(final_zones) > 0:
-                    z = final_zones.pop()
-                    if zones_rectY2[z] < zones_rectY1[i+1]:
-                        final_zones.append(z)
-                        zone = i+1
-                        break
-                    elif zones_rectY1[i+1] > zones_rectY2[z]:
-                        zone = i+1
-                    elif zones_rectY2[i+1] >= zones_rectY2[z] and zones_rectY1[i+1] <= zones_rectY1[z]:
-                        zone = z
-                        break
-                    elif zones_rectY2[i+1] <= zones_rectY2[z] and zones_rectY2[i+1] >= zones_rectY1[z]:
-                        zone = z
-                        break
-                    elif zones_rectY1[i+1] <= zones_rectY2[z] and zones_rectY1[i+1] >= zones_rectY1[z]:
-                        zone = z
-                        break
-            elif zones_rectY1[i+1] > zones_rectY2[zone]:
-                final_zones.append(zone)
-                zone = i+1
-        
-        # Validazione finale: verifica che la zona non sia stata rotta (come nel PineScript)
-        # closeLowest = min di tutti i close dalla zona ad oggi
-        if zones_rectY1 and zones_rectY2:
-            close_lowest = history[index]['BidClose']
-            zone_start_idx = zones_rectX2[zone] if zone < len(zones_rectX2) else index
-            for j in range(index, zone_start_idx, -1):
-                if j < len(history):
-                    close_lowest = min(close_lowest, history[j]['BidClose'])
-            
-            # Rimuovi zone che sono state rotte o sono sopra il Kijun
-            current_kijun = kijun_h4.get(dt_str, float('inf'))
-            valid_final_zones = []
-            for z_idx in final_zones:
-                if z_idx < len(zones_rectY1):
-                    # La zona è valida se: rectY1 <= closeLowest AND rectY1 < kijun
-                    if zones_rectY1[z_idx] <= close_lowest and zones_rectY1[z_idx] < current_kijun:
-                        valid_final_zones.append(z_idx)
-            final_zones = valid_final_zones
-                
-    elif dt_str in kijun_h4 and history[index]["BidClose"] > kijun_h4[dt_str]:
-        zone_type = 'RES' 
-        zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones = get_resistences(history, index, type, timerange, dlyZoneDate, kijun_h4)
+    if type == 'BTLOG' and zone_type is not None:
+        print('zones_rectX1 '+zone_type+': '+str(zones_rectX1))
 
     return zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones, zone_type
 
-def get_resistences(history, index, session, timerange, dlyZoneDate, kijun_h4=None):
-    """
-    Identifica zone di resistenza allineato alla logica PineScript MP-DH415 v5.8
-    
-    Modifiche rispetto alla versione precedente:
-    1. Pattern basato su confronto Close consecutivi (gap management)
-    2. Estensione fino a 7 candele consecutive
-    3. Tracking dei Kijun touch per validazione
-    4. Validazione finale che la zona non sia stata rotta
-    """
-    lastclosearray = []
-    zones_rectX1 = []
-    zones_rectX2 = []
-    zones_rectY1 = []
-    zones_rectY2 = []
-    final_zones = []
-    zone = 0
-    rectY2 = 0
-    
-    # Tracking dei Kijun touch (come nel PineScript)
-    low_kijun_touch = []
-    kijun_touch = False
-
-    zone_datetime = _strptime_mdy(history[index-1]['Date'])
-    zone_date = zone_datetime.date()
-
-    try:
-        zone_last_date = zone_date.replace(year=zone_date.year - 1)
-    except ValueError:
-        if zone_date.month == 2 and zone_date.day == 29:
-            zone_last_date = zone_date.replace(year=zone_date.year - 1, day=28)
-        else:
-            raise
-
-    for i in range(index-1, -1, -1):
-        history_date_datetime = _strptime_mdy(history[i]['Date'])
-        history_date_date = history_date_datetime.date()
-
-        if history_date_date < zone_last_date:
-            break
-        
-        # Ottieni il valore del Kijun per questa candela
-        if kijun_h4:
-            candle_dt = _to_dt(history[i]["Date"])
-            if timerange == 'DLY':
-                candle_dt = candle_dt + timedelta(days=1)
-            candle_dt_str = get_last_hour(kijun_h4, candle_dt.strftime('%Y-%m-%d %H:%M:%S'))
-            
-            # Check Kijun touch (come nel PineScript): low <= kijun o low[i-1] <= kijun
-            if candle_dt_str in kijun_h4:
-                kijun_value = kijun_h4[candle_dt_str]
-                low_condition = False
-                if i == index - 1:
-                    low_condition = history[i]['BidLow'] <= kijun_value
-                else:
-                    low_condition = (history[i]['BidLow'] <= kijun_value or 
-                                    history[i+1]['BidLow'] <= kijun_value)
-                
-                if low_condition:
-                    kijun_touch = True
-                    low_kijun_touch.append(history[i]['BidLow'])
-
-        lastclosearray.append(history[i]['BidClose'])
-        
-        # Calcolo maxhigh con controllo i+1 (come nel PineScript)
-        if i == index - 1:
-            maxhigh = history[i]['BidHigh']
-        else:
-            maxhigh = max(history[i]['BidHigh'], history[i+1]['BidHigh'])
-
-        # Pattern basato su Close consecutivi (gap management) - come nel PineScript
-        # res_condition = close[i+1] <= close[i] and close[i] > close[i-1]
-        res_condition = False
-        if i > 0 and i < index - 1:
-            res_condition = (history[i+1]['BidClose'] <= history[i]['BidClose'] and 
-                            history[i]['BidClose'] > history[i-1]['BidClose'])
-        
-        if res_condition:
-            # Estensione fino a 7 candele consecutive (come nel PineScript zone_3_candles)
-            if i >= 2 and history[i+2]['BidClose'] < history[i+1]['BidClose']:
-                maxhigh = max(history[i+1]['BidHigh'], history[i]['BidHigh'], history[i-1]['BidHigh'])
-                
-                if i >= 3 and i + 3 <= index and history[i+3]['BidClose'] < history[i+2]['BidClose']:
-                    maxhigh = max(history[i+2]['BidHigh'], maxhigh)
-                    
-                    if i >= 4 and i + 4 <= index and history[i+4]['BidClose'] < history[i+3]['BidClose']:
-                        maxhigh = max(history[i+3]['BidHigh'], maxhigh)
-                        
-                        if i >= 5 and i + 5 <= index and history[i+5]['BidClose'] < history[i+4]['BidClose']:
-                            maxhigh = max(history[i+4]['BidHigh'], maxhigh)
-                            
-                            if i >= 6 and i + 6 <= index and history[i+6]['BidClose'] < history[i+5]['BidClose']:
-                                maxhigh = max(history[i+5]['BidHigh'], maxhigh)
-                                
-                                if i >= 7 and i + 7 <= index and history[i+7]['BidClose'] < history[i+6]['BidClose']:
-                                    maxhigh = max(history[i+6]['BidHigh'], maxhigh)
-            
-            # Validazione con Kijun touch (come nel PineScript)
-            safe_max_close = max(lastclosearray) if lastclosearray else None
-            safe_low_kijun = low_kijun_touch[0] if low_kijun_touch else None
-            
-            # Se non abbiamo kijun_h4, usa la logica originale
-            if kijun_h4 is None:
-                if maxhigh > max(lastclosearray) or maxhigh > rectY2:
-                    rectX1 = history[i+1]["Date"]
-                    rectX2 = i
-                    rectY1 = maxhigh
-                    rectY2 = history[i]['BidClose']
-
-                    zones_rectX1.append(rectX1)
-                    zones_rectX2.append(rectX2)
-                    zones_rectY1.append(rectY1)
-                    zones_rectY2.append(rectY2)
-                    
-                    lastclosearray.clear()
-            elif safe_max_close is not None and safe_low_kijun is not None:
-                # Condizione: maxhigh > max(lastclosearray) AND kijun_touch AND not single touch on current candle
-                if (maxhigh > safe_max_close and kijun_touch and 
-                    not (len(low_kijun_touch) == 1 and history[i]['BidLow'] == safe_low_kijun)):
-                    
-                    rectX1 = history[i+1]["Date"]
-                    rectX2 = i
-                    rectY1 = maxhigh
-                    rectY2 = history[i]['BidClose']
-
-                    zones_rectX1.append(rectX1)
-                    zones_rectX2.append(rectX2)
-                    zones_rectY1.append(rectY1)
-                    zones_rectY2.append(rectY2)
-                    
-                    # Clear lastclosearray dopo aver trovato una zona (come nel PineScript)
-                    lastclosearray.clear()
-
-    zones_rectX1.reverse()
-    zones_rectX2.reverse()
-    zones_rectY1.reverse()
-    zones_rectY2.reverse()
-
-    if session == 'BTLOG':
-        print('zones_rectX1 before: '+str(zones_rectX1))
-        input()
-
-    final_zones.clear()
-    zone = 0
-    for i in range(len(zones_rectY2)):
-        if i == len(zones_rectY2)-1:
-            if zone not in final_zones:
-                final_zones.append(zone)
-            break
-
-        if zones_rectY2[i+1] > zones_rectY1[zone]:
-            zone = i+1
-            while len(final_zones) > 0:
-                z = final_zones.pop()
-                if zones_rectY2[z] > zones_rectY1[i+1]:
-                    final_zones.append(z)
-                    zone = i+1
-                    break
-                elif zones_rectY1[z] < zones_rectY2[i+1]:
-                    zone = i+1
-                elif zones_rectY1[i+1] >= zones_rectY1[z] and zones_rectY2[i+1] <= zones_rectY2[z]:
-                    zone = z
-                    break
-                elif zones_rectY1[i+1] <= zones_rectY1[z] and zones_rectY1[i+1] >= zones_rectY2[z]:
-                    zone = z
-                    break
-                elif zones_rectY2[i+1] <= zones_rectY1[z] and zones_rectY2[i+1] >= zones_rectY2[z]:
-                    zone = z
-                    break
-        elif zones_rectY1[i+1] < zones_rectY2[zone]:
-            final_zones.append(zone)
-            zone = i+1
-
-    # Validazione finale: verifica che la zona non sia stata rotta (come nel PineScript)
-    if kijun_h4 and zones_rectY1 and zones_rectY2:
-        dt = _to_dt(history[index]["Date"])
-        if timerange == 'DLY':
-            dt = dt + timedelta(days=1)
-        dt_str = get_last_hour(kijun_h4, dt.strftime('%Y-%m-%d %H:%M:%S'))
-        
-        # highestClose = max di tutti i close dalla zona ad oggi
-        highest_close = history[index]['BidClose']
-        zone_start_idx = zones_rectX2[zone] if zone < len(zones_rectX2) else index
-        for j in range(index, zone_start_idx, -1):
-            if j < len(history):
-                highest_close = max(highest_close, history[j]['BidClose'])
-        
-        # Rimuovi zone che sono state rotte o sono sotto il Kijun
-        current_kijun = kijun_h4.get(dt_str, 0)
-        valid_final_zones = []
-        for z_idx in final_zones:
-            if z_idx < len(zones_rectY1):
-                # La zona è valida se: rectY1 >= highestClose AND rectY1 > kijun
-                if zones_rectY1[z_idx] >= highest_close and zones_rectY1[z_idx] > current_kijun:
-                    valid_final_zones.append(z_idx)
-        final_zones = valid_final_zones
-
-    if session == 'BTLOG':
-        print('zones_rectX1: '+str(zones_rectX1))
-        input()
-   
-    return zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones
-
 def send_slack_message(channel, message):
     token = os.getenv('SLACK_BOT_TOKEN')
     if not token:
@@ -668,406 +250,34 @@ def place_order(symbol, lot, price, sl_points, tp_points, order_type):
     return True
 
 def validate_resistence(zone_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, history, timeframe, kijun_h4,str_instrument, type):
-    
-    zone_validated = False
-    last_candle = []
-    anchor = None
-
-    start_index = zones_rectX2
-    zone_valid = False
-    zone_touch = False
-
-    for i, candle in enumerate(history[start_index+1:]):
-        #print('timeframe: '+str(timeframe)+' - zone: '+str(zone_rectX1)+' - (zone_touch: '+str(zone_touch)+'- (time: '+str(candle["Date"]))
-        dt = pd.to_datetime(candle["Date"])
-        
-        if timeframe == 'DLY':  
-            dt_str = get_last_hour(kijun_h4, dt.strftime('%Y-%m-%d %H:%M:%S'))
-        elif timeframe == 'H4': 
-            dt_str = dt
-            
-        if candle['BidClose'] > zones_rectY1 and candle != history[-1]:
-            last_candle = candle
-            zone_validated = False
-            break
-        
-        if zone_valid == True:
-            if candle['BidHigh'] >= zones_rectY2:
-                if zone_touch == False:
-                    anchor = candle['Date']
-                zone_touch = True
-                last_candle = candle
-                zone_validated = True
-            
-            elif dt_str in kijun_h4 and candle['BidLow'] <= kijun_h4[dt_str]: 
-                zone_touch = False
-                zone_validated = False
-        
-        elif zone_valid == False:
-            if dt_str in kijun_h4 and candle['BidLow'] < kijun_h4[dt_str]: 
-                zone_valid = True
-                #print('zone_valid: '+str(candle['Date']))
-                if candle['BidHigh'] >= zones_rectY2 and candle['Date'] != history[start_index+1]['Date']:
-                    zone_touch = True
-                    last_candle = candle
-                    zone_validated = True
-                    anchor = candle['Date']
-    
-    return last_candle, zone_valid, zone_validated, anchor
+    # macchina a stati della validazione su array: zones.validate_zone
+    return validate_zone(history, zones_rectX2, zones_rectY1, zones_rectY2, timeframe, kijun_h4, 'RES')
 
 def validate_support(zone_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, history, timeframe, kijun_h4,str_instrument, type):
-    
-    zone_validated = False
-    last_candle = []
-    anchor = None
-    
-    start_index = zones_rectX2
-    zone_valid = False
-    zone_touch = False
-
-    for candle in history[start_index+1:]:
-        dt = pd.to_datetime(candle["Date"]) 
-            
-        if timeframe == 'DLY':  
-            dt_str = get_last_hour(kijun_h4, dt.strftime('%Y-%m-%d %H:%M:%S'))
-        elif timeframe == 'H4': 
-            dt_str = dt
-        
-        if candle['BidClose'] < zones_rectY1 and candle != history[-1]:
-                last_candle = candle
-                zone_validated = False
-                break
-
-        if zone_valid == True:
-            if candle['BidLow'] <= zones_rectY2:
-                if zone_touch == False:
-                    anchor = candle['Date']
-                zone_touch = True
-                last_candle = candle
-                zone_validated = True
-            elif dt_str in kijun_h4 and candle['BidHigh'] > kijun_h4[dt_str]: 
-                zone_touch = False
-                zone_validated = False
-        
-        elif zone_valid == False:
-            if dt_str in kijun_h4 and candle['BidHigh'] > kijun_h4[dt_str]: 
-                zone_valid = True
-                #print('zone_valid: '+str(candle['Date']))
-                if candle['BidLow'] <= zones_rectY2 and candle['Date'] != history[start_index+1]['Date']:
-                    zone_touch = True
-                    last_candle = candle
-                    zone_validated = True
-                    anchor = candle['Date']
-
-    return last_candle, zone_valid, zone_validated, anchor
+    # macchina a stati della validazione su array: zones.validate_zone
+    return validate_zone(history, zones_rectX2, zones_rectY1, zones_rectY2, timeframe, kijun_h4, 'SUP')
 
 def get_pattern_m15_SUP(history,kijun_h4, zone_rectX1_h4, zone_rectX2_h4, zone_rectY1_h4, zone_rectY2_h4,str_instrument,str_session):
-
-    rectX1 = None
-    rectX2 = None
-    rectY1 = None
-    rectY2 = None
-
-    lastlow = history[-1]["BidLow"]
-    left_lastlow_higher_closure = history[-1]["BidClose"]
-    lowestclose = history[-1]["BidClose"]
-
-    if history[-1]['BidClose'] < list(kijun_h4.values())[-1]:  
-        patterns_left_rectX1 = []
-        patterns_left_rectX2 = []
-        patterns_left_rectY1 = []
-        patterns_left_rectY2 = []
-
-        patterns_right_rectX1 = []
-        patterns_right_rectX2 = []
-        patterns_right_rectY1 = []
-        patterns_right_rectY2 = []
-
-        for i in range(len(history)-1, -1, -1):
-            
-            if history[i]["Date"] == zone_rectX1_h4:
-                if str_session == 'Trade':  
-                    ('The search for the pattern is stopped because the beginning of the valid h4 zone has been reached: '+history[i]["Date"])
-                break
-            
-            nearest_kijun_val = get_nearest_lower_kijun_h4(history[i], kijun_h4)
-            if history[i]["BidHigh"] >= nearest_kijun_val:
-                if str_session == 'Trade':
-                    print('- The search for the pattern is stopped because the BidHigh is above the kijun h4: '+history[i]["Date"])
-                break
-
-            #if left_lastlow_higher_closure < history[i]["BidClose"]:
-                #left_lastlow_higher_closure = history[i]["BidClose"]
-            
-            if lowestclose > history[i]["BidLow"]:
-                
-                # Initialize lastlow with the current item's BidLow
-                lastlow = history[i]['BidLow']
-
-                # If not at the start of the list, compare with the previous item's BidLow
-                if i > 0:
-                    lastlow = min(lastlow, history[i-1]['BidLow'])
-
-                # If not at the end of the list, compare with the next item's BidLow
-                if i < len(history) - 1:
-                    lastlow = min(lastlow, history[i+1]['BidLow'])
-                    
-                lowestclose = history[i]["BidClose"]
-           
-                #left_lastlow_higher_closure = history[i]["BidClose"]
-                for j in range(len(patterns_left_rectY1)):
-                    patterns_right_rectX1.append(patterns_left_rectX1[j])
-                    patterns_right_rectX2.append(patterns_left_rectX2[j])
-                    patterns_right_rectY1.append(patterns_left_rectY1[j])
-                    patterns_right_rectY2.append(patterns_left_rectY2[j])
-                patterns_left_rectX1.clear()
-                patterns_left_rectX2.clear()
-                patterns_left_rectY1.clear()
-                patterns_left_rectY2.clear()
-
-            # due candele + due candele
-            if (history[i]["BidOpen"] > history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] > history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] < history[i-2]["BidClose"] and 
-                history[i-3]["BidOpen"] < history[i-3]["BidClose"]):
-                
-                #if max(history[i-2]["BidHigh"], history[i-1]["BidHigh"]) >= left_lastlow_higher_closure:
-                    # Define the coordinates of the rectangle
-                patterns_left_rectX1.append(history[i-2]["Date"]) 
-                patterns_left_rectX2.append(i-2)
-                patterns_left_rectY1.append(max(history[i-2]["BidHigh"], history[i-1]["BidHigh"]))
-                patterns_left_rectY2.append(history[i-2]["BidClose"])
-                continue
-
-            # engulfing + due candele 
-            if (history[i]["BidOpen"] > history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] > history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] < history[i-2]["BidClose"] and 
-                history[i-3]["BidOpen"] > history[i-3]["BidClose"] and
-                history[i-2]["BidClose"] > history[i-3]["BidHigh"]):
-                
-                #if max(history[i-2]["BidHigh"], history[i-1]["BidHigh"]) >= left_lastlow_higher_closure:
-                patterns_left_rectX1.append(history[i-2]["Date"]) 
-                patterns_left_rectX2.append(i-2)
-                patterns_left_rectY1.append(max(history[i-2]["BidHigh"], history[i-1]["BidHigh"]))
-                patterns_left_rectY2.append(history[i-2]["BidClose"])
-                continue
-
-            # engulfing + engulfing
-            if (history[i]["BidOpen"] > history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] < history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] > history[i-2]["BidClose"] and 
-                history[i-1]["BidClose"] > history[i-2]["BidHigh"] and
-                history[i]["BidClose"] < history[i-1]["BidLow"]):
-                
-                #if max(history[i-1]["BidHigh"], history[i]["BidHigh"]) >= left_lastlow_higher_closure:
-                patterns_left_rectX1.append(history[i-1]["Date"]) 
-                patterns_left_rectX2.append(i-1)
-                patterns_left_rectY1.append(max(history[i-1]["BidHigh"], history[i]["BidHigh"]))
-                patterns_left_rectY2.append(history[i-1]["BidClose"])
-                continue
-
-            # due candele + enfulfing
-            if (history[i]["BidOpen"] > history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] < history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] < history[i-2]["BidClose"] and 
-                history[i]["BidClose"] < history[i-1]["BidLow"]):
-
-                #if max(history[i-1]["BidHigh"], history[i]["BidHigh"]) >= left_lastlow_higher_closure:
-                patterns_left_rectX1.append(history[i-1]["Date"]) 
-                patterns_left_rectX2.append(i-1)
-                patterns_left_rectY1.append(max(history[i-1]["BidHigh"], history[i]["BidHigh"]))
-                patterns_left_rectY2.append(history[i-1]["BidClose"])
-                continue
-
-        rectX1_sx = None if len(patterns_left_rectX1) == 0 else patterns_left_rectX1[0]
-        rectX2_sx = None if len(patterns_left_rectX2) == 0 else patterns_left_rectX2[0]
-        rectY1_sx = None if len(patterns_left_rectY1) == 0 else patterns_left_rectY1[0]
-        rectY2_sx = None if len(patterns_left_rectY2) == 0 else patterns_left_rectY2[0]
-
-        rectX1_dx = None if len(patterns_right_rectX1) == 0 else patterns_right_rectX1[-1]
-        rectX2_dx = None if len(patterns_right_rectX2) == 0 else patterns_right_rectX2[-1]
-        rectY1_dx = None if len(patterns_right_rectY1) == 0 else patterns_right_rectY1[-1]
-        rectY2_dx = None if len(patterns_right_rectY2) == 0 else patterns_right_rectY2[-1]
-        
-        if rectY1_sx is None and rectY1_dx is not None:
-            rectX1 = rectX1_dx
-            rectX2 = rectX2_dx
-            rectY1 = rectY1_dx
-            rectY2 = rectY2_dx
-        elif rectY1_dx is None and rectY1_sx is not None:
-            rectX1 = rectX1_sx
-            rectX2 = rectX2_sx
-            rectY1 = rectY1_sx
-            rectY2 = rectY2_sx
-        elif rectY1_dx is not None and rectY1_sx is not None:
-            if rectY2_sx > rectY1_dx:
-                rectX1 = rectX1_dx
-                rectX2 = rectX2_dx
-                rectY1 = rectY1_dx
-                rectY2 = rectY2_dx
-            else:
-                rectX1 = rectX1_sx
-                rectX2 = rectX2_sx
-                rectY1 = rectY1_sx
-                rectY2 = rectY2_sx
+    # Maschere NumPy dei quattro template su tutta la serie (patterns.detect_pattern)
+    rectX1, rectX2, rectY1, rectY2, lastlow, stop = detect_pattern(history, kijun_h4, zone_rectX1_h4, 'SUP')
+    if stop is not None and stop[1] == 'kijun' and str_session == 'Trade':
+        print('- The search for the pattern is stopped because the BidHigh is above the kijun h4: '+history[stop[0]]["Date"])
 
     #if rectX1 is not None:
         #send_slack_message('general',':ballot_box_with_check: In attesa rottura o retest pattern: '+str_instrument)
     return rectX1, rectX2, rectY1,rectY2, lastlow
 
 def get_pattern_m15_RES(history,kijun_h4, zone_rectX1_h4, zone_rectX2_h4, zone_rectY1_h4, zone_rectY2_h4,str_instrument,str_session):
-
-    rectX1 = None
-    rectX2 = None
-    rectY1 = None
-    rectY2 = None
-
-    lasthigh = history[-1]["BidHigh"]
-    highestclose = history[-1]["BidClose"]
-    
-    left_lasthigh_lower_closure = history[-1]["BidClose"]
     if str_session == 'Trade':
-        print('first lasthigh: '+str(lasthigh)+' - Date: '+str(history[-1]["Date"])) 
-
-    if history[-1]['BidClose'] > list(kijun_h4.values())[-1]:  
-        patterns_left_rectX1 = []
-        patterns_left_rectX2 = []
-        patterns_left_rectY1 = []
-        patterns_left_rectY2 = []
-
-        patterns_right_rectX1 = []
-        patterns_right_rectX2 = []
-        patterns_right_rectY1 = []
-        patterns_right_rectY2 = []
-
-        for i in range(len(history)-1, -1, -1):
-            
-            if history[i]["Date"] == zone_rectX1_h4:
-                if str_session == 'Trade':
-                    print('The search for the pattern is stopped because the beginning of the valid h4 zone has been reached: '+history[i]["Date"])
-                break
-            
-            nearest_kijun_val = get_nearest_lower_kijun_h4(history[i], kijun_h4)
-            if history[i]["BidLow"] <= nearest_kijun_val:
-                if str_session == 'Trade':
-                    print('- The search for the pattern is stopped because the BidLow is below the kijun h4: '+history[i]["Date"])
-                break
+        print('first lasthigh: '+str(history[-1]["BidHigh"])+' - Date: '+str(history[-1]["Date"])) 
 
-            #if left_lasthigh_lower_closure > history[i]["BidClose"]:
-                #left_lasthigh_lower_closure = history[i]["BidClose"]
-
-            if highestclose < history[i]["BidHigh"]:
-                # Initialize lasthigh with the current item's BidHigh
-                lasthigh = history[i]['BidHigh']
-
-                # If not at the start of the list (remember we're iterating in reverse), compare with the next item's BidHigh
-                if i < len(history) - 1:
-                    lasthigh = max(lasthigh, history[i+1]['BidHigh']) 
-
-                # If not at the end of the list, compare with the previous item's BidHigh
-                if i > 0:
-                    lasthigh = max(lasthigh, history[i-1]['BidHigh'])
-
-                highestclose = history[i]["BidClose"]
-
-                #left_lasthigh_lower_closure = history[i]["BidClose"]
-                for j in range(len(patterns_left_rectY1)):
-                    patterns_right_rectX1.append(patterns_left_rectX1[j])
-                    patterns_right_rectX2.append(patterns_left_rectX2[j])
-                    patterns_right_rectY1.append(patterns_left_rectY1[j])
-                    patterns_right_rectY2.append(patterns_left_rectY2[j])
-                patterns_left_rectX1.clear()
-                patterns_left_rectX2.clear()
-                patterns_left_rectY1.clear()
-                patterns_left_rectY2.clear()
-
-            # due candele + due candele
-            if (history[i]["BidOpen"] < history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] < history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] > history[i-2]["BidClose"] and 
-                history[i-3]["BidOpen"] > history[i-3]["BidClose"]):
-
-                #if min(history[i-2]["BidLow"], history[i-1]["BidLow"]) <= left_lasthigh_lower_closure:                
-                    # Define the coordinates of the rectangle
-                patterns_left_rectX1.append(history[i-2]["Date"]) 
-                patterns_left_rectX2.append(i-2)
-                patterns_left_rectY1.append(min(history[i-2]["BidLow"], history[i-1]["BidLow"]))
-                patterns_left_rectY2.append(history[i-2]["BidClose"])
-                continue
-
-            # engulfing + due candele 
-            if (history[i]["BidOpen"] < history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] < history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] > history[i-2]["BidClose"] and 
-                history[i-3]["BidOpen"] < history[i-3]["BidClose"] and
-                history[i-2]["BidClose"] < history[i-3]["BidLow"]):
-                
-                #if min(history[i-2]["BidLow"], history[i-1]["BidLow"]) <= left_lasthigh_lower_closure:        
-                patterns_left_rectX1.append(history[i-2]["Date"]) 
-                patterns_left_rectX2.append(i-2)
-                patterns_left_rectY1.append(min(history[i-2]["BidLow"], history[i-1]["BidLow"]))
-                patterns_left_rectY2.append(history[i-2]["BidClose"])
-                continue
-
-            # engulfing + engulfing
-            if (history[i]["BidOpen"] < history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] > history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] < history[i-2]["BidClose"] and 
-                history[i-1]["BidClose"] < history[i-2]["BidLow"] and
-                history[i]["BidClose"] > history[i-1]["BidHigh"]):
-                
-                #if min(history[i-1]["BidLow"], history[i]["BidLow"]) <= left_lasthigh_lower_closure:        
-                patterns_left_rectX1.append(history[i-1]["Date"]) 
-                patterns_left_rectX2.append(i-1)
-                patterns_left_rectY1.append(min(history[i-1]["BidLow"], history[i]["BidLow"]))
-                patterns_left_rectY2.append(history[i-1]["BidClose"])
-                continue
-
-            # due candele + enfulfing
-            if (history[i]["BidOpen"] < history[i]["BidClose"] and 
-                history[i-1]["BidOpen"] > history[i-1]["BidClose"] and 
-                history[i-2]["BidOpen"] > history[i-2]["BidClose"] and 
-                history[i]["BidClose"] > history[i-1]["BidHigh"]):
-
-                #if min(history[i-1]["BidLow"], history[i]["BidLow"]) <= left_lasthigh_lower_closure:        
-                patterns_left_rectX1.append(history[i-1]["Date"]) 
-                patterns_left_rectX2.append(i-1)
-                patterns_left_rectY1.append(min(history[i-1]["BidLow"], history[i]["BidLow"]))
-                patterns_left_rectY2.append(history[i-1]["BidClose"])
-                continue
-
-        rectX1_sx = None if len(patterns_left_rectX1) == 0 else patterns_left_rectX1[0]
-        rectX2_sx = None if len(patterns_left_rectX2) == 0 else patterns_left_rectX2[0]
-        rectY1_sx = None if len(patterns_left_rectY1) == 0 else patterns_left_rectY1[0]
-        rectY2_sx = None if len(patterns_left_rectY2) == 0 else patterns_left_rectY2[0]
-
-        rectX1_dx = None if len(patterns_right_rectX1) == 0 else patterns_right_rectX1[-1]
-        rectX2_dx = None if len(patterns_right_rectX2) == 0 else patterns_right_rectX2[-1]
-        rectY1_dx = None if len(patterns_right_rectY1) == 0 else patterns_right_rectY1[-1]
-        rectY2_dx = None if len(patterns_right_rectY2) == 0 else patterns_right_rectY2[-1]
-        
-        if rectY1_sx is None and rectY1_dx is not None:
-            rectX1 = rectX1_dx
-            rectX2 = rectX2_dx
-            rectY1 = rectY1_dx
-            rectY2 = rectY2_dx
-        elif rectY1_dx is None and rectY1_sx is not None:
-            rectX1 = rectX1_sx
-            rectX2 = rectX2_sx
-            rectY1 = rectY1_sx 
-            rectY2 = rectY2_sx
-        elif rectY1_dx is not None and rectY1_sx is not None:
-            if rectY2_sx < rectY1_dx:
-                rectX1 = rectX1_dx
-                rectX2 = rectX2_dx
-                rectY1 = rectY1_dx
-                rectY2 = rectY2_dx
-            else:
-                rectX1 = rectX1_sx
-                rectX2 = rectX2_sx
-                rectY1 = rectY1_sx
-                rectY2 = rectY2_sx
+    # Maschere NumPy dei quattro template su tutta la serie (patterns.detect_pattern)
+    rectX1, rectX2, rectY1, rectY2, lasthigh, stop = detect_pattern(history, kijun_h4, zone_rectX1_h4, 'RES')
+    if stop is not None and str_session == 'Trade':
+        if stop[1] == 'zone':
+            print('The search for the pattern is stopped because the beginning of the valid h4 zone has been reached: '+history[stop[0]]["Date"])
+        else:
+            print('- The search for the pattern is stopped because the BidLow is below the kijun h4: '+history[stop[0]]["Date"])
 
     #if rectX1 is not None:
         #send_slack_message('general',':ballot_box_with_check: In attesa rottura o retest pattern: '+str_instrument)
@@ -1275,243 +485,15 @@ def calculate_stop_loss_SHORT(pair, entry_price, highest_price):
     print('stop_loss_price: '+str(stop_loss_price))
     return stop_loss_price
 
-def process_trades_LONG(history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date):
-    enddate = None
-    Continue = False
-    Partial = False
-    H4_broken = False
-    DLY_broken = False
-    target_price = tp
-    target_1_1 = calculate_target_price_LONG(entry_price, stop_loss, 1)
-    
-    #print('candles to  '+str(len(history_15) - start_index))
-    print('entry_price: '+str(entry_price))
-    print('stop_loss: '+str(stop_loss))
-    print('target 1:1: '+str(target_1_1))
-    
-    for index in range(start_index, len(history_15)):
-        enddate = history_15[index]['Date']
-        if not DLY_broken and not H4_broken:
-            target_price = get_nearest_lower_kijun_h4(history_15[index], kijun_h4)
-            risk_reward = calculate_risk_reward_ratio(entry_price, target_price, initial_sl)
-            partial_target = get_rr_range(risk_reward)
-
-        if history_15[index]['BidHigh'] >= target_price:
-            print('history_15 < target price: '+str(history_15[index]['BidHigh']))
-            # Send operation to Salesforce
-            #salesforce.send_operation(pair, 'close')
-
-            # Set 'close' to the status pair on trades table
-            update_trade_closed(pair, 'TARGET', 'FULL', history_15[index]['Date'], risk_reward)
-            Continue = True
-            break
-
-        elif history_15[index]['BidLow'] <= stop_loss:
-            print('history_15 < stop_loss: '+str(history_15[index]['BidLow']))
-            # Send operation to Salesforce
-            #salesforce.send_operation(pair, 'stop loss')
-            
-            # Set 'close' to pair on trades table
-            pt = get_partial_trade_closed(pair, entry_date)
-            if pt:
-                if pt['stop_loss'] != stop_loss:
-                    rr = calculate_risk_reward_ratio(pt['entry_price'], stop_loss, pt['stop_loss'])
-                    update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], rr)
-                else:
-                    update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], -1)
-            else:
-                update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], -1)
-
-            Continue = True
-            break
-        
-        elif history_15[index]['BidHigh'] >= target_1_1:
-            partial_trade = get_partial_trade(pair)
-            if partial_trade:
-                # Update stoploss to entry price
-                
-                update_trade_stoploss(pair, entry_price, index, 0)
-                stop_loss = entry_price
-                # Set 'close' to pair from trades table
-                update_trade_closed(pair, 'TARGET', 'PARTIAL', history_15[index]['Date'], 1)
-                close_mt5_partial_positions(pair)
-                # Send operation to Salesforce
-                #salesforce.send_operation(pair, 'partial close')
-        print('partial_target: '+str(partial_target))
-        while partial_target:
-            partial_target_price = calculate_target_price_LONG(entry_price, initial_sl, partial_target[0])
-            print('partial_target_price: '+str(partial_target_price))
-            print('partial_target[0]-2: '+str(partial_target[0]-2))
-            if history_15[index]['BidHigh'] >= partial_target_price:
-                sl = calculate_target_price_LONG(entry_price, initial_sl, partial_target[0]-2)
-                update_trade_stoploss(pair, sl, index, partial_target[0]-2) 
-                partial_target.pop(0)
-                stop_loss = sl
-            else:
-                break
-        
-        if not DLY_broken and not H4_broken:
-            update_trade_target(pair, target_price, risk_reward)  
-        
-        # check if DLY was broken
-        if history_DLY[-1]["Date"] == history_15[index]["Date"] and history_DLY[-1]["BidClose"] < zone_rectY1_DLY:
-            print(" DLY close: ",history_DLY[-1]["BidClose"])
-            print(" zone_rectY1_DLY: ",zone_rectY1_DLY)
-            print ('******* DLY_broken: '+str(history_15[index]["Date"]))
-            DLY_broken = True
-            risk_reward = 0
-            
-            if history_DLY[-1]["BidClose"] < entry_price:
-                target_price = entry_price
-                target_1_1 = entry_price
-                partial_target = []
-            else:
-                stop_loss = entry_price
-
-            update_trade_target_ALL(pair, entry_price, risk_reward)
-
-        # check if H4 was broken
-        dt = _to_dt(history_15[index]["Date"])
-        if dt in kijun_h4.keys():
-            h4BidClose = get_H4BidClose(history_15[index]["Date"], history_H4)
-            print ('******* h4BidClose: '+str(h4BidClose)+' - zone_rectY1_H4: '+str(zone_rectY1_H4))
-            if h4BidClose is not None and h4BidClose < zone_rectY1_H4:
-                #update target with entry price
-                print ('******* H4_broken: '+str(history_15[index]["Date"]))
-                #print ('******* target: '+str(entry_price))
-                H4_broken = True
-                risk_reward = 0
-
-                if h4BidClose < entry_price:
-                    target_price = entry_price
-                    target_1_1 = entry_price
-                    partial_target = []
-                else:
-                    stop_loss = entry_price
-
-                update_trade_target_ALL(pair, entry_price, risk_reward) 
-
-    
-    return Continue, enddate
-
-def process_trades_SHORT(history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date):
-    enddate = None
-    Continue = False
-    Partial = False
-    H4_broken = False
-    DLY_broken = False
-    target_price = tp
-    target_1_1 = calculate_target_price_SHORT(entry_price, stop_loss, 1)
-    print('start_index: '+str(start_index))
-    print('len(history_15): '+str(len(history_15)))
-    # print('start_index_date: '+str(history_15[start_index]['Date']))
-    print('target_1_1: '+str(target_1_1))
-    print('initial_sl: '+str(initial_sl))
-    
-    for index in range(start_index, len(history_15)):
-        enddate = history_15[index]['Date']
-        if not DLY_broken and not H4_broken:
-            target_price = get_nearest_lower_kijun_h4(history_15[index], kijun_h4)
-            risk_reward = calculate_risk_reward_ratio(entry_price, target_price, initial_sl)
-            partial_target = get_rr_range(risk_reward)
-        
-        if history_15[index]['BidLow'] <= target_price:
-            print('history_15 < target price: '+str(history_15[index]['BidLow']))
-            # Send operation to Salesforce
-            #salesforce.send_operation(pair, 'close')
-
-            # Set 'close' to the status pair on trades table
-            update_trade_closed(pair, 'TARGET', 'FULL', history_15[index]['Date'], risk_reward)
-            Continue = True
-            break
-
-        elif history_15[index]['BidHigh'] >= stop_loss:
-            print('history_15 > stop_loss: '+str(history_15[index]['BidHigh']))
-            # Send operation to Salesforce
-            #salesforce.send_operation(pair, 'stop loss')
-            
-            # Set 'close' to pair on trades table
-            pt = get_partial_trade_closed(pair, entry_date)
-            if pt:
-                if pt['stop_loss'] != stop_loss:
-                    rr = calculate_risk_reward_ratio(pt['entry_price'], stop_loss, pt['stop_loss'])
-                    update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], rr)
-                else:
-                    update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], -1)
-            else:
-                update_trade_closed(pair, 'STOP LOSS', 'FULL', history_15[index]['Date'], -1)
-
-            Continue = True
-            break
-        
-        elif history_15[index]['BidLow'] <= target_1_1:
-            print('history_15 < target_1_1: '+str(history_15[index]['BidLow']))
-            partial_trade = get_partial_trade(pair)
-            if partial_trade:
-                # Update stoploss to entry price
-                #print('entry_price: '+str(entry_price))
-                #print('index: '+str(index))
-                update_trade_stoploss(pair, entry_price, index, 0)
-                stop_loss = entry_price
-                # Set 'close' to pair from trades table
-                update_trade_closed(pair, 'TARGET', 'PARTIAL', history_15[index]['Date'], 1)
-                close_mt5_partial_positions(pair)
-
-        while partial_target:
-            partial_target_price = calculate_target_price_SHORT(entry_price, initial_sl, partial_target[0])
-            #print('partial_target_price: '+str(partial_target_price))
-            #print('partial_target[0]-2: '+str(partial_target[0]-2))
-            if history_15[index]['BidLow'] <= partial_target_price:
-                sl = calculate_target_price_SHORT(entry_price, initial_sl, partial_target[0]-2)
-                #print(f'new_stop_loss from partial {partial_target[0]}: '+str(sl))
-                update_trade_stoploss(pair, sl, index, partial_target[0]-2)
-                partial_target.pop(0)
-                stop_loss = sl
-            else:
-                break  
-        
-        if not DLY_broken and not H4_broken:
-            update_trade_target(pair, target_price, risk_reward)   
-
-        # check if DLY was broken
-        if history_DLY[-1]["Date"] == history_15[index]["Date"] and history_DLY[-1]["BidClose"] > zone_rectY1_DLY:
-            print(" DLY close: ",history_DLY[-1]["BidClose"])
-            print(" zone_rectY1_DLY: ",zone_rectY1_DLY)
-            print ('******* DLY_broken: '+str(history_15[index]["Date"]))
-            DLY_broken = True
-            risk_reward = 0
-
-            if history_DLY[-1]["BidClose"] > entry_price:
-                target_price = entry_price
-                target_1_1 = entry_price
-                partial_target = []
-            else:
-                stop_loss = entry_price
-            
-            update_trade_target_ALL(pair, entry_price, risk_reward) 
-
-        # check if H4 was broken
-        dt = _to_dt(history_15[index]["Date"])
-        if dt in kijun_h4.keys():
-            h4BidClose = get_H4BidClose(history_15[index]["Date"], history_H4)
-            print ('******* h4BidClose: '+str(h4BidClose)+' - zone_rectY1_H4: '+str(zone_rectY1_H4))
-            if h4BidClose is not None and h4BidClose > zone_rectY1_H4:
-                #update target with entry price
-                print ('******* H4_broken: '+str(history_15[index]["Date"]))
-                print ('******* target: '+str(entry_price))
-                H4_broken = True
-                risk_reward = 0
-
-                if h4BidClose > entry_price:
-                    target_price = entry_price
-                    target_1_1 = entry_price
-                    partial_target = []
-                else:
-                    stop_loss = entry_price
-
-                update_trade_target_ALL(pair, entry_price, risk_reward) 
+def process_trades_LONG(history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date, resume=False):
+    # trade_manager importa utils: import locale
+    from trade_manager import manage_trade
+    return manage_trade('LONG', history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date, resume)
 
-    return Continue, enddate
+def process_trades_SHORT(history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date, resume=False):
+    # trade_manager importa utils: import locale
+    from trade_manager import manage_trade
+    return manage_trade('SHORT', history_DLY, zone_rectY1_DLY, history_15, pair, start_index, kijun_h4, stop_loss, initial_sl, entry_price, tp, zone_rectY1_H4, history_H4, entry_date, resume)
 
 def get_rr_range(risk_reward):
     if risk_reward == float('inf') or risk_reward == 0:
@@ -1560,6 +542,8 @@ def verify_trade_in_retest(trade, history_m15):
 
 
 def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
+    # Kijun H4 di riferimento di ogni candela M15 (get_nearest_lower_kijun_h4)
+    kijun_m15 = lower_kijun_h4_series(history_m15, kijun_h4)
     continue_logic = False
     start_session = 0
     broken = False
@@ -1603,7 +587,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                     update_trade_in_progress(trade['pair'], index, history_m15[index]['Date'])
                     continue_logic = True
                     break
-                elif history_m15[index]['BidHigh'] >= get_nearest_lower_kijun_h4(history_m15[index], kijun_h4):
+                elif history_m15[index]['BidHigh'] >= kijun_m15[index]:
                     print('BidHigh >= get_nearest_lower_kijun_h4')
                     close_trade_in_retest(trade['pair'])
                     continue_logic = True
@@ -1611,7 +595,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                 elif history_m15[index]['BidHigh'] > higher_high:
                     higher_high = history_m15[index]['BidHigh']
                     
-                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
+                    target_price = kijun_m15[index]
                     fib_78_6 = fibonacci_78_6(lowest_low, higher_high)
                     print('fib_78_6: '+str(fib_78_6)+' - pattern_Y1: '+str(trade['pattern_Y1']))
                     if fib_78_6 > trade['pattern_Y1']:
@@ -1648,7 +632,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                         continue_logic = True
                         break
                 else:
-                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
+                    target_price = kijun_m15[index]
                     if target_price != trade['target']:
                         risk_reward = calculate_risk_reward_ratio(trade['entry_price'], target_price, trade['stop_loss'])
                         if risk_reward >= 2:
@@ -1682,7 +666,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                     update_trade_in_progress(trade['pair'], index, history_m15[index]['Date'])
                     continue_logic = True
                     break
-                elif history_m15[index]['BidLow'] <= get_nearest_lower_kijun_h4(history_m15[index], kijun_h4):
+                elif history_m15[index]['BidLow'] <= kijun_m15[index]:
                     print('BidLow <= get_nearest_lower_kijun_h4') 
                     close_trade_in_retest(trade['pair'])
                     continue_logic = True
@@ -1690,7 +674,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                 elif history_m15[index]['BidLow'] < lowest_low:
                     lowest_low = history_m15[index]['BidLow']
                     
-                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
+                    target_price = kijun_m15[index]
                     fib_78_6 = fibonacci_78_6(higher_high, lowest_low)
                     print('fib_78_6: '+str(fib_78_6)+' - pattern_Y1: '+str(trade['pattern_Y1']))
                     if fib_78_6 < trade['pattern_Y1']:
@@ -1728,7 +712,7 @@ def process_trade_in_retest(trade, history_m15, kijun_h4, history_H4):
                         continue_logic = True
                         break
                 else:
-                    target_price = get_nearest_lower_kijun_h4(history_m15[index], kijun_h4)
+                    target_price = kijun_m15[index]
                     if target_price != trade['target']:
                         risk_reward = calculate_risk_reward_ratio(trade['entry_price'], target_price, trade['stop_loss'])
                         if risk_reward >= 2:
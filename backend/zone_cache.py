@@ -0,0 +1,70 @@
+"""
+Memo persistente delle zone D1/H4 tra un ciclo e l'altro.
+
+Le zone D1 (get_zones + validate_support/validate_resistence) e le zone H4
+dentro la zona D1 valida dipendono solo dalle candele D1/H4 e dalla Kijun H4:
+cambiano quando si chiude una candela D1 o H4, non a ogni chiusura M15.
+Ogni risultato viene salvato con la sua chiave
+    (strumento, timeframe, finestra della storia / ultima candela chiusa,
+     hash della Kijun, parametri)
+in un file JSON per strumento e timeframe sotto cache/zones/: se al ciclo
+successivo la chiave coincide il risultato viene riusato (anche dopo un
+riavvio del bot), altrimenti viene ricalcolato e sovrascritto.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from db_utils import CACHE_DIR
+
+ZONES_CACHE_DIR = os.path.join(CACHE_DIR, 'zones')
+
+
+def history_key(history):
+    """Finestra di una storia: numero di candele, prima candela e ultima
+    candela chiusa (la penultima: l'ultima e' quella in formazione)."""
+    if len(history) == 0:
+        return [0, None, None]
+    last_closed = history[-2]['Date'] if len(history) > 1 else None
+    return [len(history), history[0]['Date'], last_closed]
+
+
+def kijun_hash(kijun_h4):
+    """Impronta dei valori Kijun (timestamp + valori)."""
+    digest = hashlib.sha1()
+    if getattr(kijun_h4, 'line', None) is not None:
+        digest.update(np.asarray(kijun_h4.ts, dtype=np.int64).tobytes())
+        digest.update(np.asarray(kijun_h4.line, dtype=np.float64).tobytes())
+    else:
+        digest.update(repr(list(kijun_h4.items())).encode())
+    return digest.hexdigest()
+
+
+class ZoneCache:
+    def __init__(self, root=ZONES_CACHE_DIR):
+        self.root = root
+
+    def path(self, instrument, timeframe):
+        return os.path.join(self.root, f"{instrument.replace('/', '')}_{timeframe}.json")
+
+    def get(self, instrument, timeframe, key):
+        """Risultato salvato per key, None se manca o la chiave e' cambiata."""
+        try:
+            with open(self.path(instrument, timeframe)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        return entry.get('value')
+
+    def put(self, instrument, timeframe, key, value):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(instrument, timeframe)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'value': value}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,603 @@
+"""
+Rilevamento delle zone di supporto/resistenza su array (motore di get_zones).
+
+Stessa logica (PineScript MP-DH415 v5.8) e stesso output della scansione
+all'indietro originale di utils.get_zones / get_resistences:
+1. pattern basato su confronto di close consecutivi (gap management)
+2. estensione fino a 7 candele consecutive
+3. tracking dei touch della Kijun per la validazione
+4. validazione finale che la zona non sia stata rotta
+
+Invece di ricavare candela per candela la Kijun tramite date/strftime/
+get_last_hour, il valore Kijun di ogni candela e' calcolato una volta come
+array allineato alla serie; touch della Kijun e pattern sui close sono
+maschere NumPy e il ciclo Python visita solo le candele candidate. Il
+min/max dei close dall'ultima zona trovata (lastclosearray) e' mantenuto in
+modo incrementale invece di essere ricalcolato sulla lista che cresce.
+
+SUP e RES sono lo stesso algoritmo specchiato: un solo motore parametrizzato
+dalla direzione (DIRECTIONS) esegue scansione, merge e validazione finale;
+detect_zone_sets calcola entrambi i lati sugli stessi array.
+"""
+
+import operator
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from candles import DATE_FORMAT, SECONDS_PER_DAY
+from range_query import SparseTable, range_table
+
+_EPOCH_DATE = date(1970, 1, 1)
+
+
+def history_columns(history):
+    """(ts, high, low, close) di una storia: CandleSeries o lista di dict FXCM."""
+    if hasattr(history, 'ts'):
+        return history.ts, history.high, history.low, history.close
+    dates = pd.to_datetime([candle['Date'] for candle in history], format=DATE_FORMAT)
+    ts = np.asarray(dates, dtype='datetime64[s]').astype(np.int64)
+    columns = [np.array([candle[field] for candle in history], dtype=np.float64)
+               for field in ('BidHigh', 'BidLow', 'BidClose')]
+    return (ts, *columns)
+
+
+def kijun_per_candle(ts, kijun_h4, timerange):
+    """Valore Kijun di ogni candela usato da get_zones: kijun_by_day sul
+    giorno della candela, il giorno dopo per il D1 (le candele D1 FXCM sono
+    datate alle 21:00 del giorno precedente)."""
+    return kijun_by_day(ts, kijun_h4, 1 if timerange == 'DLY' else 0)
+
+
+def kijun_by_day(ts, kijun_h4, days_ahead=0):
+    """Kijun di ogni candela con la semantica di get_last_hour: ultima chiave
+    Kijun del giorno della candela (+ days_ahead) o, se manca, del giorno
+    precedente. NaN dove get_last_hour non trova nessuna chiave."""
+    days = np.asarray(ts, dtype=np.int64) // SECONDS_PER_DAY + days_ahead
+    values = np.full(len(days), np.nan)
+    if not kijun_h4:
+        return values
+
+    by_date = getattr(kijun_h4, 'by_date', None)
+    if by_date is None:
+        # dict semplice: ultima chiave di ogni giorno in ordine di inserimento
+        by_date = {}
+        for key in kijun_h4.keys():
+            by_date[key.date()] = key
+    key_days = np.array([(day - _EPOCH_DATE).days for day in by_date], dtype=np.int64)
+    key_values = np.array([kijun_h4[key] for key in by_date.values()], dtype=np.float64)
+    order = np.argsort(key_days, kind='stable')
+    key_days = key_days[order]
+    key_values = key_values[order]
+    if len(key_days) == 0:
+        return values
+
+    # prima il giorno stesso, poi il giorno precedente
+    for offset in (1, 0):
+        wanted = days - offset
+        pos = np.searchsorted(key_days, wanted)
+        pos_ok = np.minimum(pos, len(key_days) - 1)
+        found = (pos < len(key_days)) & (key_days[pos_ok] == wanted)
+        values[found] = key_values[pos_ok[found]]
+    return values
+
+
+def kijun_at_candle(ts, kijun_h4):
+    """Kijun con chiave uguale al timestamp della candela (lookup esatto
+    kijun_h4[Timestamp], come per le candele H4), NaN se la chiave manca."""
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.full(len(ts), np.nan)
+    if not kijun_h4:
+        return values
+    if getattr(kijun_h4, 'line', None) is not None:
+        # le candele senza chiave hanno linea NaN
+        key_ts = np.asarray(kijun_h4.ts, dtype=np.int64)
+        key_values = np.asarray(kijun_h4.line, dtype=np.float64)
+    else:
+        key_ts = np.asarray(pd.DatetimeIndex(list(kijun_h4.keys())), dtype='datetime64[s]').astype(np.int64)
+        key_values = np.array(list(kijun_h4.values()), dtype=np.float64)
+        order = np.argsort(key_ts, kind='stable')
+        key_ts = key_ts[order]
+        key_values = key_values[order]
+    if len(key_ts) == 0:
+        return values
+    pos = np.searchsorted(key_ts, ts)
+    pos_ok = np.minimum(pos, len(key_ts) - 1)
+    found = (pos < len(key_ts)) & (key_ts[pos_ok] == ts)
+    values[found] = key_values[pos_ok[found]]
+    return values
+
+
+def _first_day_of_window(ts, index):
+    """Giorno (epoch) piu' vecchio della finestra di un anno che termina con
+    la candela index-1 (29 febbraio -> 28 febbraio)."""
+    zone_date = _EPOCH_DATE + timedelta(days=int(ts[index - 1]) // SECONDS_PER_DAY)
+    try:
+        zone_last_date = zone_date.replace(year=zone_date.year - 1)
+    except ValueError:
+        if zone_date.month == 2 and zone_date.day == 29:
+            zone_last_date = zone_date.replace(year=zone_date.year - 1, day=28)
+        else:
+            raise
+    return (zone_last_date - _EPOCH_DATE).days
+
+
+def _window_start(ts, index):
+    """Prima candela visitata dalla scansione all'indietro da index-1: si
+    ferma alla prima candela (andando indietro) piu' vecchia di un anno."""
+    first_day = _first_day_of_window(ts, index)
+    older = np.flatnonzero(ts[:index] // SECONDS_PER_DAY < first_day)
+    return int(older[-1]) + 1 if len(older) else 0
+
+
+def _touch_mask(prices, kijun, lo, index, reaches):
+    """Touch della Kijun sulle candele lo..index-1 (maschera lunga index-lo):
+    reaches(prezzo, kijun) sulla candela i o sulla i+1 (solo sulla i per la
+    candela index-1), con la Kijun della candela i."""
+    k = kijun[lo:index]
+    touch = reaches(prices[lo:index], k)
+    touch[:-1] |= reaches(prices[lo + 1:index], k[:-1])
+    return touch
+
+
+def merge_support_zones(zones_rectY1, zones_rectY2):
+    """Zone di supporto finali (non sovrapposte). Ritorna (final_zones, zone)."""
+    final_zones = []
+    zone = 0
+    for i in range(len(zones_rectY2)):
+        if i == len(zones_rectY2)-1:
+            if zone not in final_zones:
+                final_zones.append(zone)
+            break
+
+        if zones_rectY2[i+1] < zones_rectY1[zone]:
+            zone = i+1
+            while len(final_zones) > 0:
+                z = final_zones.pop()
+                if zones_rectY2[z] < zones_rectY1[i+1]:
+                    final_zones.append(z)
+                    zone = i+1
+                    break
+                elif zones_rectY1[i+1] > zones_rectY2[z]:
+                    zone = i+1
+                elif zones_rectY2[i+1] >= zones_rectY2[z] and zones_rectY1[i+1] <= zones_rectY1[z]:
+                    zone = z
+                    break
+                elif zones_rectY2[i+1] <= zones_rectY2[z] and zones_rectY2[i+1] >= zones_rectY1[z]:
+                    zone = z
+                    break
+                elif zones_rectY1[i+1] <= zones_rectY2[z] and zones_rectY1[i+1] >= zones_rectY1[z]:
+                    zone = z
+                    break
+        elif zones_rectY1[i+1] > zones_rectY2[zone]:
+            final_zones.append(zone)
+            zone = i+1
+    return final_zones, zone
+
+
+def merge_resistance_zones(zones_rectY1, zones_rectY2):
+    """Zone di resistenza finali (non sovrapposte). Ritorna (final_zones, zone)."""
+    final_zones = []
+    zone = 0
+    for i in range(len(zones_rectY2)):
+        if i == len(zones_rectY2)-1:
+            if zone not in final_zones:
+                final_zones.append(zone)
+            break
+
+        if zones_rectY2[i+1] > zones_rectY1[zone]:
+            zone = i+1
+            while len(final_zones) > 0:
+                z = final_zones.pop()
+                if zones_rectY2[z] > zones_rectY1[i+1]:
+                    final_zones.append(z)
+                    zone = i+1
+                    break
+                elif zones_rectY1[z] < zones_rectY2[i+1]:
+                    zone = i+1
+                elif zones_rectY1[i+1] >= zones_rectY1[z] and zones_rectY2[i+1] <= zones_rectY2[z]:
+                    zone = z
+                    break
+                elif zones_rectY1[i+1] <= zones_rectY1[z] and zones_rectY1[i+1] >= zones_rectY2[z]:
+                    zone = z
+                    break
+                elif zones_rectY2[i+1] <= zones_rectY1[z] and zones_rectY2[i+1] >= zones_rectY2[z]:
+                    zone = z
+                    break
+        elif zones_rectY1[i+1] < zones_rectY2[zone]:
+            final_zones.append(zone)
+            zone = i+1
+    return final_zones, zone
+
+
+# Parametri di una direzione. SUP: zone sotto la Kijun, estremo della zona
+# = low, touch della Kijun con gli high; RES: zone sopra, estremo = high,
+# touch con i low. beyond(a, b): a oltre b nel verso della zona (< per SUP,
+# > per RES); reaches(prezzo, kijun): touch; pick / kind: min/max
+# dell'estremo e dei close (kind per range_query).
+Direction = namedtuple('Direction', 'name extreme touch beyond reaches pick kind np_beyond np_reaches merge')
+
+DIRECTIONS = {
+    'SUP': Direction('SUP', 'low', 'high', operator.lt, operator.ge, min, 'min',
+                     np.less, np.greater_equal, merge_support_zones),
+    'RES': Direction('RES', 'high', 'low', operator.gt, operator.le, max, 'max',
+                     np.greater, np.less_equal, merge_resistance_zones),
+}
+
+
+class ZoneArrays:
+    """Array di una serie condivisi da SUP e RES: close/high/low come array e
+    come liste di float Python, Kijun per candela, range min/max dei close."""
+
+    def __init__(self, history, kijun_h4, timerange, kijun=None):
+        ts, high, low, close = history_columns(history)
+        self.history = history
+        self.ts = ts
+        self.close = close
+        self.closes = close.tolist()
+        self.prices = {'high': high, 'low': low}
+        self.lists = {'high': high.tolist(), 'low': low.tolist()}
+        self.kijun = kijun if kijun is not None else kijun_per_candle(ts, kijun_h4, timerange)
+        self._close_tables = {}
+
+    def close_range(self, i, j, side):
+        """min (SUP) / max (RES) dei close i..j (inclusi)."""
+        table = self._close_tables.get(side.kind)
+        if table is None:
+            if hasattr(self.history, 'range_table'):
+                table = self.history.range_table('close', side.kind)
+            else:
+                table = SparseTable(self.close, side.kind)
+            self._close_tables[side.kind] = table
+        return table.query(i, j)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def zone_type(self, index):
+        """'SUP' se il close della candela index e' sotto la Kijun, 'RES' se
+        e' sopra, None se coincide o la Kijun della candela manca."""
+        current_kijun = self.kijun[index]
+        if np.isnan(current_kijun):
+            return None
+        if self.closes[index] < current_kijun:
+            return 'SUP'
+        if self.closes[index] > current_kijun:
+            return 'RES'
+        return None
+
+
+def _extreme(c, e, i, index, side):
+    """minlow (SUP) o maxhigh (RES) della candela candidata i, con
+    l'estensione fino a 7 candele consecutive (zone_3_candles)."""
+    beyond = side.beyond
+    pick = side.pick
+    extreme = pick(e[i], e[i + 1])
+    if i >= 2 and beyond(c[i + 1], c[i + 2]):
+        extreme = pick(e[i + 1], e[i], e[i - 1])
+        for k in range(3, 8):
+            if i >= k and i + k <= index and beyond(c[i + k - 1], c[i + k]):
+                extreme = pick(e[i + k - 1], extreme)
+            else:
+                break
+    return extreme
+
+
+def _candidate_mask(close, side):
+    """Pattern sui close consecutivi (gap management) per le candele
+    1..len-2: SUP close[i+1] >= close[i] and close[i] < close[i-1], RES
+    close[i+1] <= close[i] and close[i] > close[i-1]. mask[j] e' la candela j+1."""
+    return ~side.np_beyond(close[2:], close[1:-1]) & side.np_beyond(close[1:-1], close[:-2])
+
+
+def _scan_zones(arrays, index, lo, side):
+    """Scansione all'indietro da index-1 a lo sulle sole candele candidate:
+    zona se l'estremo e' oltre tutti i close dall'ultima zona trovata
+    (lastclosearray) e la Kijun e' stata toccata."""
+    zones_rectX1 = []
+    zones_rectX2 = []
+    zones_rectY1 = []
+    zones_rectY2 = []
+    # candidate solo tra le candele 1..index-2
+    if index - lo <= 0 or index < 3:
+        return zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2
+
+    candidates = np.flatnonzero(_candidate_mask(arrays.close[:index], side)) + 1
+    candidates = candidates[candidates >= lo][::-1]
+    if len(candidates) == 0:
+        return zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2
+
+    touch = _touch_mask(arrays.prices[side.touch], arrays.kijun, lo, index, side.np_reaches)
+    touch_idx = np.flatnonzero(touch) + lo
+    # primo touch incontrato andando all'indietro (high/low_kijun_touch[0])
+    first_touch = int(touch_idx[-1]) if len(touch_idx) else None
+
+    c = arrays.closes
+    e = arrays.lists[side.extreme]
+    o = arrays.lists[side.touch]
+    pick = side.pick
+    running = None      # min/max dei close dall'ultima zona (lastclosearray)
+    upper = index       # i close in [i, upper) non ancora inclusi in running
+    for i in candidates.tolist():
+        seg = arrays.close_range(i, upper - 1, side)
+        running = seg if running is None else pick(running, seg)
+        upper = i
+
+        touches = len(touch_idx) - int(np.searchsorted(touch_idx, i))
+        if touches == 0:
+            continue
+
+        extreme = _extreme(c, e, i, index, side)
+        if side.beyond(extreme, running) and not (touches == 1 and o[i] == o[first_touch]):
+            zones_rectX1.append(arrays.history[i + 1]["Date"])
+            zones_rectX2.append(i)
+            zones_rectY1.append(extreme)
+            zones_rectY2.append(c[i])
+            # lastclosearray.clear()
+            running = None
+
+    zones_rectX1.reverse()
+    zones_rectX2.reverse()
+    zones_rectY1.reverse()
+    zones_rectY2.reverse()
+    return zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2
+
+
+def _final_zones(arrays, index, side, zones_rectX2, zones_rectY1, zones_rectY2):
+    """Zone finali: merge delle zone sovrapposte e validazione finale (la zona
+    non deve essere stata rotta dai close successivi - closeLowest /
+    highestClose - e deve stare oltre la Kijun della candela index)."""
+    if not zones_rectY2:
+        return []
+
+    final_zones, zone = side.merge(zones_rectY1, zones_rectY2)
+
+    zone_start_idx = zones_rectX2[zone] if zone < len(zones_rectX2) else index
+    extreme_close = arrays.closes[index]
+    if zone_start_idx < index:
+        extreme_close = side.pick(extreme_close, arrays.close_range(zone_start_idx + 1, index, side))
+    current_kijun = arrays.kijun[index]
+    return [z for z in final_zones
+            if not side.beyond(extreme_close, zones_rectY1[z]) and side.beyond(zones_rectY1[z], current_kijun)]
+
+
+def _zones_at(arrays, index, names):
+    """{direzione: (zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2,
+    final_zones)} della candela index per le direzioni in names."""
+    if np.isnan(arrays.kijun[index]):
+        return {name: ([], [], [], [], []) for name in names}
+    lo = _window_start(arrays.ts, index) if index > 0 else index
+    result = {}
+    for name in names:
+        side = DIRECTIONS[name]
+        zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2 = _scan_zones(arrays, index, lo, side)
+        final_zones = _final_zones(arrays, index, side, zones_rectX2, zones_rectY1, zones_rectY2)
+        result[name] = (zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones)
+    return result
+
+
+def detect_zone_sets(history, kijun_h4, index, timerange, kijun=None):
+    """Zone di supporto e di resistenza della candela index sugli stessi
+    array, indipendentemente dalla posizione del close rispetto alla Kijun:
+    ({'SUP': (zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2,
+    final_zones), 'RES': (...)}, zone_type). Ogni lato e' identico a quello
+    che get_zones restituisce quando zone_type e' quel lato."""
+    arrays = ZoneArrays(history, kijun_h4, timerange, kijun)
+    return _zones_at(arrays, index, ('SUP', 'RES')), arrays.zone_type(index)
+
+
+def detect_zones(history, kijun_h4, index, timerange, kijun=None):
+    """Zone della candela index: (zones_rectX1, zones_rectX2, zones_rectY1,
+    zones_rectY2, final_zones, zone_type), identico a utils.get_zones.
+    kijun: array di kijun_per_candle gia' calcolato per la serie (opzionale)."""
+    arrays = ZoneArrays(history, kijun_h4, timerange, kijun)
+    zone_type = arrays.zone_type(index)
+    if zone_type is None:
+        return [], [], [], [], [], None
+    return _zones_at(arrays, index, (zone_type,))[zone_type] + (zone_type,)
+
+
+class _SweepSide:
+    """Una direzione di compute_zones_for_range: maschere dei touch e candele
+    candidate calcolate una volta sull'intera serie, piu' il memo della zona
+    successiva (andando all'indietro) dopo una zona trovata."""
+
+    def __init__(self, arrays, side):
+        self.arrays = arrays
+        self.side = side
+        self.c = arrays.closes
+        self.e = arrays.lists[side.extreme]
+        self.o = arrays.lists[side.touch]
+        self.last = len(arrays) - 1
+        prices = arrays.prices[side.touch]
+        kijun = arrays.kijun
+
+        # touch della candela i con la Kijun della candela i: prezzo della
+        # candela i o della i+1 (per la candela index-1 conta solo own_touch)
+        own = side.np_reaches(prices, kijun)
+        touch = own.copy()
+        touch[:-1] |= side.np_reaches(prices[1:], kijun[:-1])
+        self.own_touch = own.tolist()
+        # touch_count[k] = touch sulle candele 0..k-1
+        self.touch_count = np.concatenate(([0], np.cumsum(touch))).tolist()
+        # last_touch[k] = ultima candela <= k con touch, -1 se nessuna
+        self.last_touch = np.maximum.accumulate(
+            np.where(touch, np.arange(len(touch)), -1)).tolist() if len(touch) else []
+
+        if len(arrays) > 2:
+            self.candidates = (np.flatnonzero(_candidate_mask(arrays.close, side)) + 1).tolist()
+        else:
+            self.candidates = []
+        self.next_zone = {}
+
+    def _running(self, running, lo, hi):
+        """min/max di running e dei close lo..hi-1 (lastclosearray)."""
+        seg = self.arrays.close_range(lo, hi - 1, self.side)
+        return seg if running is None else self.side.pick(running, seg)
+
+    def _next(self, i):
+        """Zona successiva (andando all'indietro) dopo una zona trovata sulla
+        candela i, quando per tutte le candidate prima di i ci sono almeno due
+        touch e l'estensione a 7 candele non e' limitata da index: dipende
+        solo dalla serie, non da index. -1 se non c'e'."""
+        j = self.next_zone.get(i)
+        if j is not None:
+            return j
+        j = -1
+        running = None
+        upper = i
+        p = bisect_left(self.candidates, i) - 1
+        while p >= 0:
+            k = self.candidates[p]
+            running = self._running(running, k, upper)
+            upper = k
+            if self.side.beyond(_extreme(self.c, self.e, k, self.last, self.side), running):
+                j = k
+                break
+            p -= 1
+        self.next_zone[i] = j
+        return j
+
+    def zones_at(self, index, lo):
+        """Zone (candela, estremo) della candela index con finestra
+        lo..index-1, in ordine di scansione: le stesse di _scan_zones."""
+        if index < 2:
+            return []
+        own_last = self.own_touch[index - 1]
+        # primo touch incontrato andando all'indietro (high/low_kijun_touch[0])
+        first_touch = index - 1 if own_last else self.last_touch[index - 2]
+        if first_touch < lo:
+            return []
+        touches_before_last = self.touch_count[index - 1]
+
+        found = []
+        running = None
+        upper = index
+        # le candidate dopo il primo touch non hanno touch: si parte da li'
+        p = bisect_right(self.candidates, min(index - 2, first_touch)) - 1
+        while p >= 0:
+            i = self.candidates[p]
+            if i < lo:
+                break
+            running = self._running(running, i, upper)
+            upper = i
+            touches = touches_before_last - self.touch_count[i] + own_last
+            extreme = _extreme(self.c, self.e, i, index, self.side)
+            if self.side.beyond(extreme, running) and not (touches == 1 and self.o[i] == self.o[first_touch]):
+                found.append((i, extreme))
+                running = None
+                if i <= index - 8 and touches >= 2:
+                    # da qui la catena delle zone non dipende piu' da index
+                    j = self._next(i)
+                    while j >= lo:
+                        found.append((j, _extreme(self.c, self.e, j, index, self.side)))
+                        j = self._next(j)
+                    break
+            p -= 1
+        return found
+
+
+def compute_zones_for_range(history, kijun_h4, start, end=None, timerange='H4'):
+    """get_zones per ogni index in range(start, end) con una sola passata:
+    {index: (zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2,
+    final_zones, zone_type)}, identico a detect_zones su ogni index.
+
+    Per i backtest: Kijun per candela, touch e candidate sono calcolati una
+    volta; per ogni index la scansione all'indietro si ferma alla prima zona
+    che non dipende piu' da index e prosegue sulla catena memorizzata delle
+    zone successive, condivisa tra tutti gli index."""
+    arrays = ZoneArrays(history, kijun_h4, timerange)
+    if end is None:
+        end = len(arrays)
+    sweeps = {name: _SweepSide(arrays, side) for name, side in DIRECTIONS.items()}
+    days = np.asarray(arrays.ts, dtype=np.int64) // SECONDS_PER_DAY
+
+    results = {}
+    for index in range(start, end):
+        zone_type = arrays.zone_type(index)
+        if zone_type is None:
+            results[index] = ([], [], [], [], [], None)
+            continue
+        if index > 0:
+            lo = min(int(np.searchsorted(days, _first_day_of_window(arrays.ts, index))), index)
+        else:
+            lo = index
+        found = sweeps[zone_type].zones_at(index, lo)
+        found.reverse()
+        zones_rectX1 = [history[i + 1]["Date"] for i, _ in found]
+        zones_rectX2 = [i for i, _ in found]
+        zones_rectY1 = [extreme for _, extreme in found]
+        zones_rectY2 = [arrays.closes[i] for i, _ in found]
+        final_zones = _final_zones(arrays, index, DIRECTIONS[zone_type], zones_rectX2, zones_rectY1, zones_rectY2)
+        results[index] = (zones_rectX1, zones_rectX2, zones_rectY1, zones_rectY2, final_zones, zone_type)
+    return results
+
+
+# Validazione di una zona (validate_support / validate_resistence):
+# (la Kijun e' rotta -> zona valida, la Kijun e' ripresa -> reset del touch,
+#  touch della zona con Y2). SUP: high > kijun, high > kijun, low <= Y2;
+# RES: low < kijun, low <= kijun, high >= Y2.
+_VALIDATION = {
+    'SUP': (np.greater, np.greater, np.less_equal),
+    'RES': (np.less, np.less_equal, np.greater_equal),
+}
+
+
+def validate_zone(history, start_index, zone_y1, zone_y2, timeframe, kijun_h4, zone_type):
+    """Validazione della zona che inizia alla candela start_index sulle
+    candele successive: (last_candle, zone_valid, zone_validated, anchor),
+    identico a validate_support (SUP) / validate_resistence (RES).
+
+    Stessa macchina a stati, ma calcolata sugli array: la candela di rottura
+    (primo close oltre Y1, esclusa l'ultima) viene da range_query, la zona
+    diventa valida alla prima candela che rompe la Kijun e da li' contano
+    solo l'ultimo touch di Y2, l'ultimo reset e il touch che ha fissato
+    l'anchor. Kijun per candela: giorno della candela per il D1
+    (get_last_hour), chiave esatta per l'H4."""
+    side = DIRECTIONS[zone_type]
+    crosses, resets, touches_zone = _VALIDATION[zone_type]
+    ts, high, low, close = history_columns(history)
+    prices = {'high': high, 'low': low}
+    kijun_prices = prices[side.touch]
+    zone_prices = prices[side.extreme]
+
+    first = start_index + 1
+    break_index = range_table(history, 'close', side.kind).first_beyond(first, len(ts) - 2, zone_y1)
+    end = break_index if break_index >= 0 else len(ts)
+    last_candle = history[break_index] if break_index >= 0 else []
+    if first >= end:
+        return last_candle, False, False, None
+
+    if timeframe == 'DLY':
+        kijun = kijun_by_day(ts[first:end], kijun_h4)
+    else:
+        kijun = kijun_at_candle(ts[first:end], kijun_h4)
+    crossed = np.flatnonzero(crosses(kijun_prices[first:end], kijun))
+    if len(crossed) == 0:
+        return last_candle, False, False, None
+
+    # dalla candela valid in poi (zone_valid = True)
+    valid = first + int(crossed[0])
+    touch = touches_zone(zone_prices[valid:end], zone_y2)
+    reset = ~touch & resets(kijun_prices[valid:end], kijun[valid - first:])
+    # sulla candela valid: touch solo se non e' la prima dopo la zona, nessun reset
+    touch[0] = touch[0] and valid != first
+    reset[0] = False
+
+    touch_idx = np.flatnonzero(touch)
+    if len(touch_idx) == 0:
+        return last_candle, True, False, None
+    last_touch = int(touch_idx[-1])
+    reset_idx = np.flatnonzero(reset[:last_touch])
+    zone_validated = break_index < 0 and not reset[last_touch:].any()
+    if break_index < 0:
+        last_candle = history[valid + last_touch]
+    # anchor: primo touch dopo l'ultimo reset che precede l'ultimo touch
+    if len(reset_idx):
+        anchor_pos = int(touch_idx[np.searchsorted(touch_idx, reset_idx[-1])])
+    else:
+        anchor_pos = int(touch_idx[0])
+    return last_candle, True, zone_validated, history[valid + anchor_pos]['Date']
@@ -11,6 +11,8 @@ import os
 import re
 import sqlite3
 import json
+import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
@@ -20,6 +22,10 @@ _REPO_ROOT = Path(__file__).resolve().parent.parent.parent
 ENV_PATH = _REPO_ROOT / '.env'
 DB_PATH = _REPO_ROOT / 'my_database.db'
 
+# Versioned trades schema shared with the bot (backend/schema.py, sqlite3 only)
+sys.path.insert(0, str(_REPO_ROOT / 'backend'))
+from schema import EPOCH_COLUMNS, migrate as migrate_trades, to_epoch
+
 if ENV_PATH.exists():
     load_dotenv(ENV_PATH)
 
@@ -44,6 +50,23 @@ CORS(app, resources={
 # CONFIGURATION ENDPOINTS
 # ============================================================================
 
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+
+def _parse_log_number(value, cast, minimum):
+    """LOG_SAMPLE_LIMIT / LOG_SAMPLE_SECONDS as parsed by db_utils.configure_logging:
+    cast(value) clamped to minimum, None if value is not a number."""
+    try:
+        return max(minimum, cast(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _env_log_number(name, cast, minimum, default):
+    value = _parse_log_number(os.getenv(name, default), cast, minimum)
+    return default if value is None else value
+
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Get all configuration from .env file"""
@@ -65,6 +88,12 @@ def get_config():
             'channel': os.getenv('SLACK_CHANNEL', ''),
         },
         'activePairs': os.getenv('ACTIVE_PAIRS', '').split(',') if os.getenv('ACTIVE_PAIRS') else [],
+        'logging': {
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'debugPairs': os.getenv('LOG_DEBUG_PAIRS', '').split(',') if os.getenv('LOG_DEBUG_PAIRS') else [],
+            'sampleLimit': _env_log_number('LOG_SAMPLE_LIMIT', int, 0, 0),
+            'sampleSeconds': _env_log_number('LOG_SAMPLE_SECONDS', float, 1.0, 60.0),
+        },
     })
 
 
@@ -75,6 +104,28 @@ def update_config():
     if not ENV_PATH.exists():
         return jsonify({'success': False, 'error': 'No .env file; set variables in Render dashboard'}), 400
 
+    # Validate the logging settings before writing anything
+    logging_keys = {}
+    logging_data = data.get('logging') or {}
+    if 'level' in logging_data:
+        level = str(logging_data['level']).upper()
+        if level not in LOG_LEVELS:
+            return jsonify({'success': False, 'error': f'Invalid log level: {level}'}), 400
+        logging_keys['LOG_LEVEL'] = level
+    if 'debugPairs' in logging_data:
+        pairs = logging_data['debugPairs']
+        if not isinstance(pairs, list) or not all(isinstance(p, str) for p in pairs):
+            return jsonify({'success': False, 'error': 'debugPairs must be a list of pairs'}), 400
+        logging_keys['LOG_DEBUG_PAIRS'] = ','.join(p.strip() for p in pairs if p.strip())
+    for field, key, cast, minimum in (('sampleLimit', 'LOG_SAMPLE_LIMIT', int, 0),
+                                      ('sampleSeconds', 'LOG_SAMPLE_SECONDS', float, 1.0)):
+        if field in logging_data:
+            value = logging_data[field]
+            number = None if isinstance(value, bool) else _parse_log_number(value, cast, minimum)
+            if number is None:
+                return jsonify({'success': False, 'error': f'Invalid {field}: {value!r}'}), 400
+            logging_keys[key] = str(number)
+
     try:
         # Update FXCM settings
         if 'fxcm' in data:
@@ -107,6 +158,10 @@ def update_config():
         if 'activePairs' in data:
             set_key(ENV_PATH, 'ACTIVE_PAIRS', ','.join(data['activePairs']))
         
+        # Update Logging settings (picked up by the bot at the next scan cycle)
+        for key, value in logging_keys.items():
+            set_key(ENV_PATH, key, value)
+        
         # Reload env
         load_dotenv(ENV_PATH, override=True)
         
@@ -119,10 +174,35 @@ def update_config():
 # DATABASE HELPERS
 # ============================================================================
 
+_migrated_dbs = set()
+_migrate_lock = threading.Lock()
+
+
+def ensure_trades_schema(path):
+    """Bring the trades table of an existing DB to the latest schema
+    version, once per process and file. DBs without trades are left alone;
+    a failed migration is retried on the next call."""
+    path = str(path)
+    with _migrate_lock:
+        if path in _migrated_dbs:
+            return
+        try:
+            conn = sqlite3.connect(path, timeout=10)
+            try:
+                migrate_trades(conn, create=False)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[API] trades schema migration failed for {path}: {e}")
+            return
+        _migrated_dbs.add(path)
+
+
 def get_db_connection():
     """Create a database connection"""
     if not DB_PATH.exists():
         return None
+    ensure_trades_schema(DB_PATH)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
@@ -130,11 +210,26 @@ def get_db_connection():
 
 def iso_date_expr(column):
     """SQL expression converting the bot's 'MM.DD.YYYY HH:MM:SS' text dates to
-    ISO 'YYYY-MM-DD HH:MM:SS', so they can be sorted and compared correctly."""
+    ISO 'YYYY-MM-DD HH:MM:SS', so they can be sorted and compared correctly.
+    Only for DBs without the indexed epoch columns (entry_ts, close_ts, ...)
+    added by backend/schema.py: backtest archives, which are never migrated,
+    and DBs whose migration failed."""
     return (f"SUBSTR({column}, 7, 4) || '-' || SUBSTR({column}, 1, 2) || '-' || "
             f"SUBSTR({column}, 4, 2) || SUBSTR({column}, 11)")
 
 
+def epoch_date_sql(conn):
+    """SQL expressions of the trades dates as epoch seconds, keyed by epoch
+    column (entry_ts, close_ts, ...): the indexed generated column when the
+    DB has it, the same value computed from the text date otherwise."""
+    existing = {row[1] for row in conn.execute('PRAGMA table_xinfo(trades)')}
+    return {
+        ts: ts if ts in existing
+        else f"CAST(strftime('%s', {iso_date_expr(column)}) AS INTEGER)"
+        for column, ts in EPOCH_COLUMNS.items()
+    }
+
+
 # ============================================================================
 # TRADES ENDPOINTS
 # ============================================================================
@@ -148,6 +243,7 @@ def get_trades():
     
     try:
         cursor = conn.cursor()
+        entry_ts = epoch_date_sql(conn)['entry_ts']
         
         # Get all trades from the 'trades' table
         cursor.execute(f'''
@@ -155,7 +251,7 @@ def get_trades():
                    entry_price, stop_loss, target, direction,
                    initial_risk_reward, final_risk_reward, profit, result
             FROM trades
-            ORDER BY {iso_date_expr('entry_date')} DESC
+            ORDER BY {entry_ts} DESC
         ''')
         all_trades = [dict(row) for row in cursor.fetchall()]
         
@@ -184,6 +280,7 @@ def get_active_trades():
     
     try:
         cursor = conn.cursor()
+        entry_ts = epoch_date_sql(conn)['entry_ts']
         
         # Get trades that are not closed (case-insensitive)
         cursor.execute(f'''
@@ -191,7 +288,7 @@ def get_active_trades():
             FROM trades
             WHERE UPPER(status) NOT IN ('CLOSED', 'COMPLETED', 'STOPPED')
               AND close_date IS NULL
-            ORDER BY {iso_date_expr('entry_date')} DESC
+            ORDER BY {entry_ts} DESC
         ''')
         rows = cursor.fetchall()
         
@@ -278,11 +375,13 @@ def get_trade_stats():
         win_rate = (wins / total_closed * 100) if total_closed > 0 else 0
         
         # Calculate today's profit (trades closed today)
-        # close_date is stored as 'MM.DD.YYYY HH:MM:SS'
-        cursor.execute('''
+        # close_ts is close_date as epoch: today's range on the index
+        today = to_epoch(datetime.now().strftime('%Y-%m-%d 00:00:00'))
+        close_ts = epoch_date_sql(conn)['close_ts']
+        cursor.execute(f'''
             SELECT SUM(CAST(profit AS REAL)) FROM trades
-            WHERE close_date LIKE ?
-        ''', (datetime.now().strftime('%m.%d.%Y') + '%',))
+            WHERE {close_ts} >= ? AND {close_ts} < ?
+        ''', (today, today + 86400))
         today_profit_result = cursor.fetchone()[0]
         today_profit = today_profit_result if today_profit_result else 0
         
@@ -330,19 +429,19 @@ def get_performance():
         time_filter = request.args.get('period', 'all')
         direction_filter = request.args.get('direction', 'all')
         
-        # Build date filter (close_date is 'MM.DD.YYYY HH:MM:SS' → convert to ISO)
-        iso_close = iso_date_expr('close_date')
+        # Build date filter on close_ts (close_date as epoch, indexed: backend/schema.py)
+        close_ts = epoch_date_sql(conn)['close_ts']
         date_condition = ""
         if time_filter == '24h':
-            date_condition = f"AND {iso_close} >= datetime('now', '-1 day')"
+            date_condition = f"AND {close_ts} >= CAST(strftime('%s', 'now', '-1 day') AS INTEGER)"
         elif time_filter == '7d':
-            date_condition = f"AND {iso_close} >= datetime('now', '-7 days')"
+            date_condition = f"AND {close_ts} >= CAST(strftime('%s', 'now', '-7 days') AS INTEGER)"
         elif time_filter == 'month':
-            date_condition = f"AND {iso_close} >= datetime('now', '-30 days')"
+            date_condition = f"AND {close_ts} >= CAST(strftime('%s', 'now', '-30 days') AS INTEGER)"
         elif time_filter == 'quarter':
-            date_condition = f"AND {iso_close} >= datetime('now', '-90 days')"
+            date_condition = f"AND {close_ts} >= CAST(strftime('%s', 'now', '-90 days') AS INTEGER)"
         elif time_filter == 'ytd':
-            date_condition = f"AND {iso_close} >= '{datetime.now().year}-01-01'"
+            date_condition = f"AND {close_ts} >= {to_epoch(f'{datetime.now().year}-01-01 00:00:00')}"
         
         # Build direction filter
         direction_condition = ""
@@ -397,7 +496,7 @@ def get_performance():
             FROM trades
             WHERE UPPER(status) = 'CLOSED' AND result IS NOT NULL
             {date_condition} {direction_condition}
-            ORDER BY {iso_close} DESC
+            ORDER BY {close_ts} DESC
             LIMIT 20
         ''')
         
@@ -447,16 +546,16 @@ def get_performance():
             })
         
         # ========== EQUITY CURVE (all closed trades, cumulative P/L) ==========
-        # Date format in DB is MM.DD.YYYY HH:MM:SS, so we extract and convert
+        # Day of close_ts (close_date as epoch)
         # Get the last 30 unique days in ascending order for proper cumulative calculation
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT day, daily_pl FROM (
                 SELECT 
-                    SUBSTR(close_date, 7, 4) || '-' || SUBSTR(close_date, 1, 2) || '-' || SUBSTR(close_date, 4, 2) as day,
+                    date({close_ts}, 'unixepoch') as day,
                     SUM(CASE WHEN UPPER(result) = 'TARGET' THEN initial_risk_reward ELSE -1 END) as daily_pl
                 FROM trades 
                 WHERE UPPER(status) = 'CLOSED' AND result IS NOT NULL
-                  AND close_date IS NOT NULL AND close_date != ''
+                  AND {close_ts} IS NOT NULL
                 GROUP BY day
                 ORDER BY day DESC
                 LIMIT 30
@@ -1324,12 +1423,14 @@ def get_backtest_trades():
     where_sql = ('WHERE ' + ' AND '.join(where)) if where else ''
 
     try:
+        # Read-only: archives (e.g. ../MP-DH415-BT/*.db) are not migrated
         conn = sqlite3.connect(dbs[db_name])
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
         # Older DBs miss some columns: select what exists, NULL the rest
-        cursor.execute('PRAGMA table_info(trades)')
+        # (table_xinfo also lists the generated *_ts columns)
+        cursor.execute('PRAGMA table_xinfo(trades)')
         existing = {row[1] for row in cursor.fetchall()}
         select_cols = ', '.join(
             f'"{c}"' if c in existing else f'NULL AS "{c}"' for c in _BT_COLUMNS
@@ -1337,11 +1438,13 @@ def get_backtest_trades():
 
         # Entry date can be empty for trades invalidated during retest:
         # fall back to breakup_date for a stable chronological order
-        if 'breakup_date' in existing:
-            date_col = "COALESCE(NULLIF(entry_date, ''), breakup_date)"
+        if 'entry_ts' in existing:
+            date_sql = 'COALESCE(entry_ts, breakup_ts)'
+        elif 'breakup_date' in existing:
+            date_sql = iso_date_expr("COALESCE(NULLIF(entry_date, ''), breakup_date)")
         else:
-            date_col = 'entry_date'
-        order_sql = f"ORDER BY {iso_date_expr(date_col)} DESC, rowid DESC"
+            date_sql = iso_date_expr('entry_date')
+        order_sql = f"ORDER BY {date_sql} DESC, rowid DESC"
 
         cursor.execute(f'SELECT COUNT(*) FROM trades {where_sql}', params)
         total = cursor.fetchone()[0]
@@ -32,6 +32,10 @@ function Settings() {
     executionAlerts: true,
     errorLogs: true,
     dailySummary: false,
+    logLevel: 'INFO',
+    logDebugPairs: '',
+    logSampleLimit: 0,
+    logSampleSeconds: 60,
   })
 
   const [activePairs, setActivePairs] = useState({})
@@ -59,6 +63,10 @@ function Settings() {
         executionAlerts: true,
         errorLogs: true,
         dailySummary: false,
+        logLevel: data.logging?.level || 'INFO',
+        logDebugPairs: (data.logging?.debugPairs || []).join(','),
+        logSampleLimit: data.logging?.sampleLimit || 0,
+        logSampleSeconds: data.logging?.sampleSeconds || 60,
       })
       
       // Set active pairs
@@ -105,6 +113,12 @@ function Settings() {
             channel: config.slackChannel,
           },
           activePairs: activePairsList,
+          logging: {
+            level: config.logLevel,
+            debugPairs: config.logDebugPairs.split(',').map(p => p.trim()).filter(Boolean),
+            sampleLimit: config.logSampleLimit,
+            sampleSeconds: config.logSampleSeconds,
+          },
         }),
       })
       
@@ -503,6 +517,67 @@ function Settings() {
         </div>
       </div>
 
+      {/* Logging Section */}
+      <div className="mb-10">
+        <div className="flex items-center gap-2 px-4 pb-3 pt-5">
+          <span className="material-symbols-outlined text-primary">terminal</span>
+          <h2 className="text-slate-900 dark:text-white text-[22px] font-bold leading-tight tracking-[-0.015em]">Logging</h2>
+        </div>
+        <div className="p-4 bg-slate-50 dark:bg-[#192633]/50 rounded-xl border border-slate-200 dark:border-[#233648]">
+          <div className="grid grid-cols-1 md:grid-cols-2 gap-4 mb-4">
+            <label className="flex flex-col">
+              <p className="text-slate-700 dark:text-white text-sm font-medium pb-2">Log Level</p>
+              <select
+                className="w-full rounded-lg text-slate-900 dark:text-white border border-slate-300 dark:border-[#324d67] bg-white dark:bg-[#101922] focus:border-primary focus:ring-1 focus:ring-primary h-12 px-4 text-sm font-normal"
+                value={config.logLevel}
+                onChange={(e) => setConfig(prev => ({ ...prev, logLevel: e.target.value }))}
+              >
+                <option value="DEBUG">Debug (Trader trace)</option>
+                <option value="INFO">Info</option>
+                <option value="WARNING">Warning</option>
+                <option value="ERROR">Error</option>
+              </select>
+            </label>
+            <label className="flex flex-col">
+              <p className="text-slate-700 dark:text-white text-sm font-medium pb-2">Debug Pairs</p>
+              <input
+                className="w-full rounded-lg text-slate-900 dark:text-white border border-slate-300 dark:border-[#324d67] bg-white dark:bg-[#101922] focus:border-primary h-12 p-4 text-sm font-normal"
+                placeholder="EUR/USD,GBP/JPY"
+                type="text"
+                value={config.logDebugPairs}
+                onChange={(e) => setConfig(prev => ({ ...prev, logDebugPairs: e.target.value }))}
+              />
+            </label>
+            <label className="flex flex-col">
+              <p className="text-slate-700 dark:text-white text-sm font-medium pb-2">Debug Sample Limit (0 = off)</p>
+              <input
+                className="w-full rounded-lg text-slate-900 dark:text-white border border-slate-300 dark:border-[#324d67] bg-white dark:bg-[#101922] focus:border-primary h-12 p-4 text-sm font-normal"
+                type="number"
+                min="0"
+                value={config.logSampleLimit}
+                onChange={(e) => setConfig(prev => ({ ...prev, logSampleLimit: parseInt(e.target.value) || 0 }))}
+              />
+            </label>
+            <label className="flex flex-col">
+              <p className="text-slate-700 dark:text-white text-sm font-medium pb-2">Sample Window (s)</p>
+              <input
+                className="w-full rounded-lg text-slate-900 dark:text-white border border-slate-300 dark:border-[#324d67] bg-white dark:bg-[#101922] focus:border-primary h-12 p-4 text-sm font-normal"
+                type="number"
+                min="1"
+                value={config.logSampleSeconds}
+                onChange={(e) => setConfig(prev => ({ ...prev, logSampleSeconds: parseFloat(e.target.value) || 60 }))}
+              />
+            </label>
+          </div>
+          <div className="bg-primary/10 border border-primary/20 p-3 rounded-lg flex items-center gap-3">
+            <span className="material-symbols-outlined text-primary">info</span>
+            <p className="text-slate-500 dark:text-[#92adc9] text-xs leading-tight">
+              Trader debug logs are written only at Debug level or for the debug pairs. Changes apply from the next scan cycle.
+            </p>
+          </div>
+        </div>
+      </div>
+
       {/* Help Card */}
       <div className="p-4">
         <div className="flex flex-col items-stretch justify-start rounded-xl md:flex-row md:items-start shadow-[0_0_4px_rgba(0,0,0,0.1)] bg-white dark:bg-[#192633] border border-slate-200 dark:border-transparent overflow-hidden">